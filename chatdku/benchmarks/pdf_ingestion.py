@@ -0,0 +1,77 @@
+"""
+Measure PDF parsing throughput of `update_data._read_pdf` with
+`--workers` on a synthetic corpus.
+
+Generates `--files` PDFs (plus one corrupt file to check that a failure is
+isolated), parses them sequentially and with a process pool, and checks
+that both produce the same chunks in the same order.
+
+Usage:
+    python pdf_ingestion.py --files 32 --pages 20 --workers 8
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+from time import perf_counter
+
+from chatdku.benchmarks.structure_chunker import make_pdf
+
+# The ingestion scripts use script-style imports.
+sys.path.insert(
+    0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "ingestion")
+)
+from update_data import _read_pdf  # noqa: E402
+
+
+def run(paths: list[str], workers: int):
+    t0 = perf_counter()
+    nodes, failed = _read_pdf(paths, "Chat_DKU", "student", "student", None, workers)
+    return nodes, failed, perf_counter() - t0
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--files", type=int, default=32)
+    parser.add_argument("--pages", type=int, default=20)
+    parser.add_argument("--workers", type=int, default=os.cpu_count())
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        paths = []
+        for i in range(args.files):
+            path = os.path.join(tmp, f"doc_{i:03d}.pdf")
+            make_pdf(path, args.pages, seed=i)
+            paths.append(path)
+        corrupt = os.path.join(tmp, "corrupt.pdf")
+        with open(corrupt, "wb") as f:
+            f.write(b"%PDF-1.7 not really a pdf")
+        paths.append(corrupt)
+
+        serial_nodes, serial_failed, serial_s = run(paths, 1)
+        pool_nodes, pool_failed, pool_s = run(paths, args.workers)
+
+    pages = args.files * args.pages
+    print(f"\n{args.files} files, {pages} pages, {len(serial_nodes)} chunks")
+    print(f"workers=1:  {serial_s:7.2f}s  {pages / serial_s:7.1f} pages/s")
+    print(
+        f"workers={args.workers}: {pool_s:7.2f}s  {pages / pool_s:7.1f} pages/s"
+        f"  ({serial_s / pool_s:.1f}x)"
+    )
+    print(f"failed (isolated): {sorted(map(os.path.basename, pool_failed))}")
+
+    same = [
+        (a.text, a.metadata["file_name"], a.metadata["page_number"], a.ref_doc_id)
+        for a in serial_nodes
+    ] == [
+        (b.text, b.metadata["file_name"], b.metadata["page_number"], b.ref_doc_id)
+        for b in pool_nodes
+    ]
+    print(
+        f"same chunks and order: {same and serial_failed.keys() == pool_failed.keys()}"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -80,6 +80,9 @@ def reasoning_to_tags(reasoning: dict, output: str) -> str:
                     doc_id += 1
 
             blocks.append(f"<information>\n" + "\n".join(docs) + "\n</information>")
+        elif obs and isinstance(obs, str):
+            # Compact observations are already plain text.
+            blocks.append(f"<information>\n{obs.strip()}\n</information>")
 
         step += 1
 
@@ -0,0 +1,139 @@
+"""
+Measure how many trajectory tokens the compact observation format saves.
+
+Reads the Executor (AGENT) spans of a Phoenix project, re-encodes every
+retrieval observation that was recorded in the old format (a
+`str(list[NodeWithScore])` repr or the nested list of dicts returned by
+`DocumentRetriever`) with `nodes_to_observation()` and compares token counts.
+
+Usage:
+    python trace_eval/observation_tokens.py --project seekbench_eval
+
+The spans can also be read from a file saved with
+`client.spans.get_spans_dataframe(...).to_parquet(path)`, e.g. to measure a
+project after it was deleted:
+    python trace_eval/observation_tokens.py --spans_path outputs/spans.parquet
+"""
+
+import argparse
+import ast
+import json
+
+import pandas as pd
+from import_traces import safe_json_load, setup
+from llama_index.core.utils import get_tokenizer
+
+from chatdku.core.tools.retriever.base_retriever import NodeWithScore
+from chatdku.core.tools.utils import nodes_to_observation
+
+parser = argparse.ArgumentParser()
+parser.add_argument("--project", default="seekbench_eval", help="Phoenix project")
+parser.add_argument("--limit", type=int, default=100000, help="Max spans to fetch")
+parser.add_argument("--output_path", default=None, help="Optional JSON report path")
+parser.add_argument(
+    "--spans_path", default=None, help="Saved spans dataframe instead of Phoenix"
+)
+
+
+def parse_raw_observation(obs) -> list | None:
+    """
+    Recover the nodes from an observation in the old format.
+
+    Returns `None` if `obs` is not a retrieval result in the old format
+    (e.g. an error message or an already compact observation).
+    """
+    if isinstance(obs, list):
+        # `DocumentRetriever`: [[{"text": ..., "metadata": ...}], "[Already ...]"]
+        nodes = []
+        for group in obs:
+            if isinstance(group, str):
+                nodes.append(group)
+                continue
+            for doc in group:
+                nodes.append(
+                    NodeWithScore(
+                        node_id="",
+                        text=doc.get("text", ""),
+                        metadata=doc.get("metadata") or {},
+                        score=0.0,
+                    )
+                )
+        return nodes
+
+    if not isinstance(obs, str) or not obs.startswith("["):
+        return None
+
+    # `VectorQuery`/`KeywordQuery`: "[NodeWithScore(node_id='1', ...), ...]"
+    try:
+        tree = ast.parse(obs, mode="eval")
+    except SyntaxError:
+        return None
+    if not isinstance(tree.body, ast.List):
+        return None
+
+    nodes = []
+    for elt in tree.body.elts:
+        if isinstance(elt, ast.Constant) and isinstance(elt.value, str):
+            nodes.append(elt.value)
+        elif isinstance(elt, ast.Call) and getattr(elt.func, "id", "") == (
+            "NodeWithScore"
+        ):
+            fields = {kw.arg: ast.literal_eval(kw.value) for kw in elt.keywords}
+            nodes.append(NodeWithScore(**fields))
+        else:
+            return None
+    return nodes
+
+
+def measure(trajectories: list[dict]) -> dict:
+    tokenizer = get_tokenizer()
+
+    def count(value) -> int:
+        text = value if isinstance(value, str) else json.dumps(value)
+        return len(tokenizer(text))
+
+    report = {"observations": 0, "raw_tokens": 0, "compact_tokens": 0}
+    for trajectory in trajectories:
+        step = 0
+        while f"thought_{step}" in trajectory:
+            obs = trajectory.get(f"observation_{step}")
+            nodes = parse_raw_observation(obs)
+            if nodes is not None:
+                report["observations"] += 1
+                report["raw_tokens"] += count(obs)
+                report["compact_tokens"] += count(nodes_to_observation(nodes))
+            step += 1
+
+    report["trajectories"] = len(trajectories)
+    if report["raw_tokens"]:
+        report["reduction"] = 1 - report["compact_tokens"] / report["raw_tokens"]
+    return report
+
+
+def main():
+    args = parser.parse_args()
+
+    if args.spans_path:
+        traces = pd.read_parquet(args.spans_path)
+    else:
+        client = setup()
+        print("Fetching traces...")
+        traces = client.spans.get_spans_dataframe(
+            project_identifier=args.project,
+            timeout=500,
+            limit=args.limit,
+        )
+
+    outputs = traces[traces["span_kind"] == "AGENT"]["attributes.output.value"]
+    trajectories = [t for t in map(safe_json_load, outputs) if isinstance(t, dict)]
+
+    report = measure(trajectories)
+    print(json.dumps(report, indent=2))
+
+    if args.output_path:
+        with open(args.output_path, "w") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
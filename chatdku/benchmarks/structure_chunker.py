@@ -0,0 +1,126 @@
+"""
+Benchmark `structure_chunker.pdf_to_items` against the previous
+implementation on a generated multi-hundred-page PDF.
+
+The previous version matched every line against all chars of the page
+(O(lines x chars)) and took the page's font size mode with
+`max(set(sizes), key=sizes.count)`. The fixture uses a single body font
+size, so both versions must produce the same items; font-size based
+headings are not compared because the previous per-line lookup did not
+actually look at the line's own chars.
+
+Usage:
+    python structure_chunker.py --pages 300
+"""
+
+import argparse
+import os
+import random
+import tempfile
+from time import perf_counter
+
+import pdfplumber
+import pymupdf
+
+from chatdku.ingestion.structure_chunker import detect_title_level, page_to_items
+
+WORDS = (
+    "students must complete the major requirements before graduation and may "
+    "petition the registrar for course substitutions approved by the advisor"
+).split()
+
+
+def make_pdf(path: str, pages: int, seed: int = 0) -> None:
+    rng = random.Random(seed)
+    doc = pymupdf.open()
+    for page_num in range(pages):
+        page = doc.new_page()
+        y = 50
+        for line_num in range(48):
+            kind = rng.random()
+            if line_num == 0:
+                text = f"CHAPTER {page_num + 1} ACADEMIC POLICIES"
+            elif kind < 0.05:
+                text = f"{page_num + 1}.{line_num} Requirements"
+            elif kind < 0.08:
+                text = "Additional notes:"
+            else:
+                text = " ".join(rng.choices(WORDS, k=14)).capitalize() + "."
+            page.insert_text((50, y), text, fontsize=10)
+            y += 15
+    doc.save(path)
+
+
+def page_to_items_baseline(page, page_num: int) -> list[dict]:
+    """The previous implementation of `pdf_to_items`, kept for comparison."""
+    items = []
+    text = page.extract_text()
+    if not text:
+        return items
+    chars = page.chars if page.chars else []
+    font_sizes = [char.get("size", 0) for char in chars if char.get("size")]
+    common_size = max(set(font_sizes), key=font_sizes.count) if font_sizes else 12
+    for line in text.split("\n"):
+        line = line.strip()
+        if not line:
+            continue
+        line_font_size = common_size
+        if chars:
+            line_chars = [c for c in chars if c.get("text") and c["text"] in line]
+            if line_chars:
+                line_font_size = line_chars[0].get("size", common_size)
+        level = detect_title_level(line, line_font_size, common_size)
+        items.append({"text": line, "level": level, "page": page_num})
+    return items
+
+
+def extract(pdf, page_func) -> tuple[list[dict], float]:
+    t0 = perf_counter()
+    items = []
+    for page_num, page in enumerate(pdf.pages):
+        items.extend(page_func(page, page_num))
+    return items, perf_counter() - t0
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--pages", type=int, default=300)
+    parser.add_argument("--pdf", default=None, help="Use an existing PDF instead")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = args.pdf
+        if path is None:
+            path = os.path.join(tmp, "fixture.pdf")
+            make_pdf(path, args.pages)
+
+        with pdfplumber.open(path) as pdf:
+            # pdfplumber's char parsing is the same for both versions and is
+            # cached per page, so parse once and time only the extraction.
+            t0 = perf_counter()
+            for page in pdf.pages:
+                page.extract_text()
+            parse_s = perf_counter() - t0
+            pages = len(pdf.pages)
+
+            old_items, old_s = extract(pdf, page_to_items_baseline)
+            new_items, new_s = extract(pdf, page_to_items)
+
+    print(f"pages: {pages}, lines: {len(new_items)}")
+    print(f"pdfplumber parsing (shared): {parse_s:.2f}s")
+    print(f"line/font extraction, baseline: {old_s:.3f}s")
+    print(f"line/font extraction, current:  {new_s:.3f}s  ({old_s / new_s:.1f}x)")
+    print(f"end to end: {parse_s + old_s:.2f}s -> {parse_s + new_s:.2f}s")
+
+    mismatches = [(o, n) for o, n in zip(old_items, new_items) if o != n]
+    if len(old_items) != len(new_items) or mismatches:
+        print(f"MISMATCH: {len(mismatches)} items differ")
+        for old, new in mismatches[:10]:
+            print(f"  {old}\n  {new}")
+    else:
+        levels = sorted({item["level"] for item in new_items})
+        print(f"identical output (heading levels {levels})")
+
+
+if __name__ == "__main__":
+    main()
@@ -65,6 +65,8 @@ class Config:
                 "llm_api_key": llm_api_key,
                 "backup_llm": "Qwen/Qwen3.6-35B-A3B",
                 "backup_llm_url": "http://localhost:18085/v1",
+                "llm_urls": [],  # More endpoints serving `llm`, see chatdku/core/llm_router.py
+                "llm_health_interval": 10,  # Seconds between endpoint health checks
                 "llm_temperature": 1.0,
                 "top_p": 1.0,
                 "top_k": 40,
@@ -86,11 +88,39 @@ class Config:
                 "reranker_base_url": "http://localhost:6767",
                 "reranker_model": "Qwen/Qwen3-VL-Reranker-8B",
                 "reranker_api_key": None,
+                # Tools
+                "tool_executor_workers": 16,  # Concurrent blocking tool calls per process
+                "tool_executor_queue": 32,  # Calls allowed to wait before shedding load
+                # Seconds results stay cached per tool, see chatdku/core/tools/tool_cache.py.
+                # Tools not listed are not cached.
+                "tool_cache_ttls": {
+                    "MajorRequirementsLookup": 24 * 60 * 60,
+                    "PrerequisiteLookup": 24 * 60 * 60,
+                    "CourseScheduleLookup": 60 * 60,
+                    "CourseRecommender": 60 * 60,
+                    "VectorRetriever": 10 * 60,
+                    "KeywordRetriever": 10 * 60,
+                },
+                "tool_cache_bypass": [],  # Tools never cached, e.g. while debugging one
+                "tool_cache_size": 1024,  # Results kept per process
+                "tool_cache_redis": False,  # Share results between processes through Redis
+                # Config keys of the files each tool reads. Results are not reused
+                # once one of them was modified.
+                "tool_cache_sources": {
+                    "PrerequisiteLookup": ["prereq_csv_path"],
+                    "CourseScheduleLookup": ["classdata_csv_path"],
+                    "CourseRecommender": ["prereq_csv_path", "classdata_csv_path"],
+                },
+                # Query embeddings, see chatdku/core/tools/query_embedding_cache.py
+                "query_embedding_cache_size": 4096,  # Embeddings kept per process
+                "query_embedding_cache_ttl": 7 * 24 * 60 * 60,  # Seconds kept in Redis
+                "query_embedding_cache_redis": True,  # Share embeddings between processes through Redis
                 # Data
                 "data_dir": "/datapool/chat_dku_advising",
                 "documents_path": "/datapool/chat_dku_advising/parsed.pkl",  # This is Deprecated use nodes instead
-                "nodes_path": "/datapool/chat_dku_advising/nodes.json",
+                "nodes_path": "/datapool/chat_dku_advising/nodes",
                 "pipeline_cache": "./pipeline_cache",
+                "embedding_cache": "./embedding_cache",  # Shared by the loaders
                 "url_csv_path": "/datapool/url_csv/url_database.csv",
                 "event_path": "/datapool/chat_dku_advising/event_data",
                 "event_homepage_path": "/datapool/chat_dku_advising/event_homepage",
@@ -12,11 +12,11 @@ import dspy
 from openinference.semconv.trace import OpenInferenceSpanKindValues, SpanAttributes
 from opentelemetry.trace import Status, StatusCode, use_span
 
-from chatdku.config import config
 from chatdku.core.dspy_classes.conversation_memory import ConversationMemory
 from chatdku.core.dspy_classes.executor import Executor
 from chatdku.core.dspy_classes.plan import Planner
 from chatdku.core.dspy_classes.synthesizer import Synthesizer
+from chatdku.core.llm_router import routed_lm
 from chatdku.core.tools.course_recommender import CourseRecommender
 from chatdku.core.tools.course_schedule import CourseScheduleLookup
 from chatdku.core.tools.get_prerequisites import PrerequisiteLookup
@@ -61,11 +61,15 @@ class Agent(dspy.Module):
         self.get_intermediate = get_intermediate
         self.rewrite_query = rewrite_query
         # Store information not accessible to the LLM.
-        # Currently, only `ids` is stored, which tracks the documents already retrieved,
-        # so they can be excluded in the subsequent retrievals.
-        # NOTE: `VectorRetriever` and `KeywordRetriever` currently uses two different id formats,
-        # but mixing them appears to not cause any issues.
-        # Edit (Temuulen): nahhh it is causing issues.
+        # The retrieval tools track the chunks already returned in this turn:
+        #   - `ids`: node ids, also used as `PostgresRetriever.exclude`
+        #   - `hashes`: content hash -> node id, since `VectorRetriever` and
+        #     `KeywordRetriever` use two different id formats for the same chunk
+        #   - `source_ids` / `tags`: source ids of the turn and the `S1 p.3` tag
+        #     each node was shown with, cited by the back-references
+        #   - `duplicates` / `saved_tokens`: how many repeated chunks were replaced
+        #     by a back-reference and the trajectory tokens this saved
+        # See `chatdku.core.tools.utils.split_seen_nodes`.
         self.internal_memory = {}
 
         self.planner = Planner(tools)
@@ -138,6 +142,7 @@ class Agent(dspy.Module):
                     plan=plan_result.action,
                     current_user_message=current_user_message,
                     conversation_memory=self.conversation_memory,
+                    internal_memory=self.internal_memory,
                 )
                 synthesizer_args = dict(
                     current_user_message=current_user_message,
@@ -187,23 +192,8 @@ def build_agent(streaming: bool = True, max_iterations: int = 10) -> "Agent":
     setup()
     use_phoenix()
 
-    lm = dspy.LM(
-        model="openai/" + config.llm,
-        api_base=config.llm_url,
-        api_key=config.llm_api_key,
-        model_type="chat",
-        max_tokens=config.output_window,
-        top_p=config.top_p,
-        min_p=config.min_p,
-        presence_penalty=config.presence_penalty,
-        repetition_penalty=config.repetition_penalty,
-        temperature=config.llm_temperature,
-        extra_body={
-            "top_k": config.top_k,
-            "chat_template_kwargs": {"enable_thinking": False},
-        },
-        enable_thinking=False,
-    )
+    # Least-loaded of the configured endpoints, with failover
+    lm = routed_lm()
     dspy.configure(lm=lm)
 
     # To disable cache:
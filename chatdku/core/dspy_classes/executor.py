@@ -15,6 +15,8 @@ from chatdku.core.dspy_classes.prompt_settings import (
     role_str,
 )
 from chatdku.core.dspy_common import get_template
+from chatdku.core.tools.tool_cache import get_tool_cache
+from chatdku.core.tools.utils import use_internal_memory
 from chatdku.core.utils import (
     format_trajectory,
     span_ctx_start,
@@ -245,12 +247,14 @@ class Executor(dspy.Module):
         plan: str,
         current_user_message: str,
         conversation_memory: ConversationMemory,
+        internal_memory: dict | None = None,
     ) -> dspy.Prediction:
         # current_agenda starts as the original plan and grows as the Executor
         # discovers new investigation areas from tool results.
         current_agenda = plan
 
         trajectory = {}
+        cache_hits = 0
         with span_ctx_start("Executor", SpanKind.AGENT) as span:
             for idx in range(self.max_iterations):
                 executor_inputs = dict(
@@ -292,9 +296,15 @@ class Executor(dspy.Module):
                 trajectory[f"tool_args_{idx}"] = executor_result.next_tool_args
 
                 try:
-                    trajectory[f"observation_{idx}"] = self.tools[
-                        executor_result.next_tool_name
-                    ](**executor_result.next_tool_args)
+                    # Retrieval tools use `internal_memory` to skip chunks
+                    # already present in the trajectory.
+                    with use_internal_memory(internal_memory):
+                        observation, hit = self._call_tool(
+                            executor_result.next_tool_name,
+                            executor_result.next_tool_args,
+                        )
+                    trajectory[f"observation_{idx}"] = observation
+                    cache_hits += hit
                 except Exception as err:
                     trajectory[f"observation_{idx}"] = (
                         f"Execution error in {executor_result.next_tool_name}: {_fmt_exc(err)}"
@@ -316,12 +326,35 @@ class Executor(dspy.Module):
             distill_result = self.distiller(**distill_inputs)
 
             span.set_attribute("output.value", safe_json_dumps(trajectory))
+            span.set_attribute("tool_cache.hits", cache_hits)
+            if internal_memory:
+                span.set_attribute(
+                    "retrieval.duplicates", internal_memory.get("duplicates", 0)
+                )
+                span.set_attribute(
+                    "retrieval.dedup_saved_tokens",
+                    internal_memory.get("saved_tokens", 0),
+                )
 
         return dspy.Prediction(
             relevant_context=distill_result.relevant_context,
             summary=self.trajectory_summary,
         )
 
+    def _call_tool(self, name: str, args: dict):
+        """
+        Call a tool through the tool cache, see `tool_cache.ToolCache`.
+        Returns the result and whether it was cached.
+        """
+        result, hit = get_tool_cache().call(name, self.tools[name], args)
+        if hit:
+            # The tool's own span is not created, so record the call here
+            with span_ctx_start(name, SpanKind.TOOL) as tool_span:
+                tool_span.set_attribute("tool_cache.hit", True)
+                tool_span.set_attribute("input.value", safe_json_dumps(args))
+                tool_span.set_attribute("output.value", safe_json_dumps(result))
+        return result, hit
+
     def _distill_token_limits(self, **kwargs) -> dict[str, int]:
         template_len = len(get_template(self.distiller, **kwargs))
         return token_limit_ratio_to_count(self.distill_token_ratios, template_len)
@@ -0,0 +1,328 @@
+"""
+Client-side routing over several OpenAI-compatible vLLM endpoints.
+
+`LLMRouter` sends each call to the healthy endpoint with the fewest requests
+in flight, weighted by its recent latency, and fails over to the next one on
+connection errors and 5xx responses. Endpoints that fail are skipped for
+`cooldown` seconds, or until a health check sees them answer again.
+
+`RoutedLM` is a `dspy.LM` whose requests go through a router, so
+`dspy.configure(lm=RoutedLM(...))` is all callers need. A streamed call only
+fails over until its first chunk was sent to the client, after that the
+error is raised so the client does not get a second answer appended.
+"""
+
+import logging
+import threading
+import time
+from typing import Any, Awaitable, Callable, Optional, TypeVar
+
+import dspy
+import openai
+import requests
+
+from chatdku.config import config
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+
+def is_retriable(exc: BaseException) -> bool:
+    """Whether `exc` means the endpoint, not the request, is at fault."""
+    # litellm's connection and timeout errors subclass openai.APIConnectionError
+    if isinstance(exc, (openai.APIConnectionError, ConnectionError)):
+        return True
+    status = getattr(exc, "status_code", None)
+    return isinstance(status, int) and status >= 500
+
+
+class Endpoint:
+    """Load and health of one endpoint. Mutated under `LLMRouter._lock`."""
+
+    def __init__(self, url: str):
+        self.url = url.rstrip("/")
+        self.in_flight = 0
+        # Exponentially weighted latency of successful calls, in seconds
+        self.latency: Optional[float] = None
+        self.down_until = 0.0
+        self.requests = 0
+        self.failures = 0
+
+    def healthy(self, now: float) -> bool:
+        return now >= self.down_until
+
+    def metrics(self, now: float) -> dict:
+        return {
+            "url": self.url,
+            "healthy": self.healthy(now),
+            "in_flight": self.in_flight,
+            "latency": self.latency,
+            "requests": self.requests,
+            "failures": self.failures,
+        }
+
+
+class LLMRouter:
+    """
+    Args:
+        urls: Base URLs of the endpoints, e.g. "http://localhost:18085/v1".
+        cooldown: Seconds a failed endpoint is skipped for.
+        alpha: Weight of the newest sample in the latency average.
+    """
+
+    def __init__(self, urls: list[str], cooldown: float = 10.0, alpha: float = 0.2):
+        if not urls:
+            raise ValueError("LLMRouter needs at least one endpoint")
+        self.endpoints = [Endpoint(url) for url in dict.fromkeys(urls)]
+        self.cooldown = cooldown
+        self.alpha = alpha
+        self._lock = threading.Lock()
+        self._health_thread = None
+
+    def __deepcopy__(self, memo):
+        # `dspy.LM.copy()` deep-copies the LM; its copies share the router
+        return self
+
+    def _score(self, endpoint: Endpoint) -> float:
+        # Unmeasured endpoints count as fastest so that they get tried
+        latency = endpoint.latency or 0.0
+        return (endpoint.in_flight + 1) * (1.0 + latency)
+
+    def acquire(self, exclude: tuple = ()) -> Optional[Endpoint]:
+        """
+        Take the least loaded healthy endpoint not in `exclude`. When all are
+        down, the one that comes back first is tried anyway.
+        """
+        now = time.monotonic()
+        with self._lock:
+            candidates = [e for e in self.endpoints if e not in exclude]
+            if not candidates:
+                return None
+            healthy = [e for e in candidates if e.healthy(now)]
+            if healthy:
+                endpoint = min(healthy, key=self._score)
+            else:
+                endpoint = min(candidates, key=lambda e: e.down_until)
+            endpoint.in_flight += 1
+            endpoint.requests += 1
+            return endpoint
+
+    def release(self, endpoint: Endpoint, started: float, error=None) -> None:
+        elapsed = time.monotonic() - started
+        with self._lock:
+            endpoint.in_flight -= 1
+            if error is None:
+                endpoint.down_until = 0.0
+                if endpoint.latency is None:
+                    endpoint.latency = elapsed
+                else:
+                    endpoint.latency += self.alpha * (elapsed - endpoint.latency)
+            else:
+                endpoint.failures += 1
+                endpoint.down_until = time.monotonic() + self.cooldown
+        if error is not None:
+            logger.warning(f"LLM endpoint {endpoint.url} failed: {error!r}")
+
+    def _fail(self, endpoint, started, error, tried, can_retry) -> bool:
+        """Release `endpoint` after `error` and tell whether to fail over."""
+        retriable = is_retriable(error)
+        self.release(endpoint, started, error=error if retriable else None)
+        return (
+            retriable
+            and len(tried) < len(self.endpoints)
+            and (can_retry is None or can_retry())
+        )
+
+    def call(
+        self,
+        fn: Callable[[str], T],
+        can_retry: Optional[Callable[[], bool]] = None,
+    ) -> T:
+        """
+        Call `fn(url)`, failing over to the other endpoints while
+        `can_retry()` is true.
+        """
+        tried = ()
+        while (endpoint := self.acquire(tried)) is not None:
+            tried += (endpoint,)
+            started = time.monotonic()
+            try:
+                result = fn(endpoint.url)
+            except Exception as e:
+                if not self._fail(endpoint, started, e, tried, can_retry):
+                    raise
+                continue
+            self.release(endpoint, started)
+            return result
+
+    async def acall(
+        self,
+        fn: Callable[[str], Awaitable[T]],
+        can_retry: Optional[Callable[[], bool]] = None,
+    ) -> T:
+        """Async version of `call`."""
+        tried = ()
+        while (endpoint := self.acquire(tried)) is not None:
+            tried += (endpoint,)
+            started = time.monotonic()
+            try:
+                result = await fn(endpoint.url)
+            except Exception as e:
+                if not self._fail(endpoint, started, e, tried, can_retry):
+                    raise
+                continue
+            self.release(endpoint, started)
+            return result
+
+    def check_health(self, timeout: float = 2.0) -> None:
+        """GET /models on every endpoint and mark it up or down."""
+        for endpoint in self.endpoints:
+            try:
+                response = requests.get(
+                    f"{endpoint.url}/models",
+                    headers={"Authorization": f"Bearer {config.llm_api_key}"},
+                    timeout=timeout,
+                )
+                ok = response.status_code < 500
+            except requests.RequestException:
+                ok = False
+            with self._lock:
+                if ok:
+                    endpoint.down_until = 0.0
+                elif endpoint.healthy(time.monotonic()):
+                    endpoint.down_until = time.monotonic() + self.cooldown
+            if not ok:
+                logger.warning(f"LLM endpoint {endpoint.url} failed its health check")
+
+    def start_health_checks(self, interval: float = 10.0) -> None:
+        if self._health_thread is not None:
+            return
+
+        def run():
+            while True:
+                self.check_health()
+                time.sleep(interval)
+
+        self._health_thread = threading.Thread(
+            target=run, name="llm-router-health", daemon=True
+        )
+        self._health_thread.start()
+
+    def metrics(self) -> list[dict]:
+        """Per-endpoint state, see `Endpoint.metrics`."""
+        now = time.monotonic()
+        with self._lock:
+            return [e.metrics(now) for e in self.endpoints]
+
+
+class _TrackedStream:
+    """
+    The send stream of `dspy.streamify`, recording whether a chunk of the
+    current call was sent to the client.
+    """
+
+    def __init__(self, stream):
+        self.stream = stream
+        self.sent = False
+
+    async def send(self, item):
+        self.sent = True
+        await self.stream.send(item)
+
+    def __getattr__(self, name):
+        return getattr(self.stream, name)
+
+
+class RoutedLM(dspy.LM):
+    """
+    `dspy.LM` sending each request to an endpoint picked by `router`.
+    Without a router, `get_router()` is used from the first call on, so that
+    processes never calling the LM do not start the health checks.
+    """
+
+    def __init__(self, model: str, router: Optional[LLMRouter] = None, **kwargs: Any):
+        # Failing over is cheaper than litellm retrying a dead endpoint
+        kwargs.setdefault("num_retries", 0)
+        super().__init__(model, **kwargs)
+        self._router = router
+
+    @property
+    def router(self) -> LLMRouter:
+        if self._router is None:
+            self._router = get_router()
+        return self._router
+
+    @staticmethod
+    def _tracked_stream() -> Optional[_TrackedStream]:
+        stream = dspy.settings.send_stream
+        return None if stream is None else _TrackedStream(stream)
+
+    def forward(self, prompt=None, messages=None, **kwargs):
+        stream = self._tracked_stream()
+        with dspy.context(send_stream=stream):
+            return self.router.call(
+                lambda url: super(RoutedLM, self).forward(
+                    prompt, messages, **{**kwargs, "api_base": url}
+                ),
+                can_retry=lambda: stream is None or not stream.sent,
+            )
+
+    async def aforward(self, prompt=None, messages=None, **kwargs):
+        stream = self._tracked_stream()
+        with dspy.context(send_stream=stream):
+            return await self.router.acall(
+                lambda url: super(RoutedLM, self).aforward(
+                    prompt, messages, **{**kwargs, "api_base": url}
+                ),
+                can_retry=lambda: stream is None or not stream.sent,
+            )
+
+
+_router = None
+_router_lock = threading.Lock()
+
+
+def get_router() -> LLMRouter:
+    """
+    Process-wide router over `llm_url` and `llm_urls`, plus `backup_llm_url`
+    when it serves the same model. Starts the health checks.
+    """
+    global _router
+    with _router_lock:
+        if _router is None:
+            urls = [config.llm_url, *config.llm_urls]
+            if config.backup_llm == config.llm:
+                urls.append(config.backup_llm_url)
+            _router = LLMRouter(urls)
+            _router.start_health_checks(config.llm_health_interval)
+        return _router
+
+
+def current_router() -> Optional[LLMRouter]:
+    """The router of `get_router()`, or None when it was not started yet."""
+    return _router
+
+
+def routed_lm(**kwargs: Any) -> RoutedLM:
+    """
+    The agent's LM, see `build_agent`, routed over `get_router()`. The router
+    is created on the first call.
+    """
+    return RoutedLM(
+        "openai/" + config.llm,
+        api_key=config.llm_api_key,
+        model_type="chat",
+        max_tokens=config.output_window,
+        top_p=config.top_p,
+        min_p=config.min_p,
+        presence_penalty=config.presence_penalty,
+        repetition_penalty=config.repetition_penalty,
+        temperature=config.llm_temperature,
+        extra_body={
+            "top_k": config.top_k,
+            "chat_template_kwargs": {"enable_thinking": False},
+        },
+        enable_thinking=False,
+        **kwargs,
+    )
@@ -10,6 +10,7 @@ from openinference.semconv.trace import (
 )
 from opentelemetry.trace import Status, StatusCode
 
+from chatdku.core.tools.tool_cache import UncachedResult
 from chatdku.core.utils import span_ctx_start
 from chatdku.config import config
 
@@ -47,7 +48,7 @@ def get_prereq(course: str, data_file_path: str) -> str:
         raise FileNotFoundError("Could not find the prerequisites data file")
     except Exception as e:
         logger.error("ERROR IN PREREQUISITE LOOKUP: %s", e)
-        return f"Unknown error in finding prerequisite for {course}."
+        return UncachedResult(f"Unknown error in finding prerequisite for {course}.")
 
 
 def PrerequisiteLookup(course_names: list[str]) -> str:
@@ -81,6 +82,9 @@ def PrerequisiteLookup(course_names: list[str]) -> str:
         try:
             results = [get_prereq(course, prereq_csv_path) for course in course_names]
             result = "\n".join(results)
+            # A course that failed is looked up again on the next call
+            if any(isinstance(r, UncachedResult) for r in results):
+                result = UncachedResult(result)
             span.set_attributes(
                 {
                     SpanAttributes.OUTPUT_VALUE: safe_json_dumps(dict(result=result)),
@@ -1,12 +1,22 @@
+import logging
 import uuid
 from contextlib import suppress
 from time import perf_counter
 
 from chatdku.config import config
-from chatdku.core.tools.utils import nodes_to_dicts
+from chatdku.core.tools.utils import (
+    check_observation_format,
+    get_internal_memory,
+    mark_seen_nodes,
+    nodes_to_dicts,
+    nodes_to_observation,
+    split_seen_nodes,
+)
 from chatdku.core.tools.retriever.postgres_retriever import PostgresRetriever
 from chatdku.core.tools.retriever.reranker import rerank
 
+logger = logging.getLogger(__name__)
+
 
 def DocRetrieverOuter(
     retriever_top_k: int = 25,
@@ -17,7 +27,10 @@ def DocRetrieverOuter(
     user_id: str = "Chat_DKU",
     search_mode: int = 0,
     files: list | None = None,
+    observation_format: str = "compact",
 ):
+    observation_format = check_observation_format(observation_format)
+
     # Keep this call keyword-based so it stays compatible if the retriever's
     # signature evolves (we've recently added permission + partition args).
     vector_retriever = PostgresRetriever(
@@ -31,8 +44,14 @@ def DocRetrieverOuter(
 
     def DocumentRetriever(
         semantic_query: str,
-    ) -> list:
+    ) -> list | str:
         vector_result: list = []
+        back_refs: list = []
+
+        # Let the database skip chunks already returned in this turn,
+        # so the freed top-k slots are filled with new chunks instead.
+        memory = get_internal_memory()
+        vector_retriever.exclude = set(memory.get("ids", ())) if memory else set()
 
         try:
             # Fixed budgets (do not rely on config having timeout fields)
@@ -45,6 +64,8 @@ def DocRetrieverOuter(
 
             t0 = perf_counter()
             vector_result = vector_retriever.query_with_tell(query=tagged_query)
+            # Same text can still come back under another id (mirrored pages).
+            vector_result, back_refs = split_seen_nodes(vector_result)
 
             elapsed = perf_counter() - t0
 
@@ -82,14 +103,9 @@ def DocRetrieverOuter(
                 # else: skip rerank (degrade gracefully)
         except Exception as e:
             raise e
-        # We aren't using intern tool results for now
-        # internal_result = {
-        #     "ids": {
-        #         node.node_id
-        #         for node in vector_result
-        #         if isinstance(node, NodeWithScore)
-        #     }
-        # }
-        return nodes_to_dicts(vector_result)
+        mark_seen_nodes(vector_result)
+        if observation_format == "raw":
+            return nodes_to_dicts(vector_result + back_refs)
+        return nodes_to_observation(vector_result + back_refs)
 
     return DocumentRetriever
@@ -5,11 +5,46 @@ from opentelemetry.trace import get_current_span
 from chatdku.core.tools.retriever.keyword_retriever import KeywordRetriever
 from chatdku.core.tools.retriever.reranker import rerank
 from chatdku.core.tools.retriever.vector_retriever import VectorRetriever
-from chatdku.core.tools.utils import QueryTimeoutError, timeout
+from chatdku.core.tools.tool_cache import get_tool_cache
+from chatdku.core.tools.utils import (
+    QueryTimeoutError,
+    check_observation_format,
+    mark_seen_nodes,
+    nodes_to_observation,
+    split_seen_nodes,
+    timeout,
+)
 
 logger = logging.getLogger(__name__)
 
 
+def _cached_query(name, retriever, query, parent_span) -> list:
+    """
+    Query `retriever` through the tool cache. The cached nodes are the ones
+    before `split_seen_nodes`, which depends on the turn. Only the public
+    corpus is cached, user uploads change without a corpus version bump.
+    """
+
+    def run(query):
+        with timeout() as ctx:
+            return ctx.run(
+                retriever.query_with_tell, query=query, parent_span=parent_span
+            )
+
+    if retriever.search_mode != 0:
+        return run(query)
+
+    result, hit = get_tool_cache().call(
+        name,
+        run,
+        {"query": query},
+        scope=f"{retriever.user_id}:{retriever.retriever_top_k}",
+    )
+    if hit:
+        parent_span.set_attribute(f"tool_cache.{name}.hit", True)
+    return list(result)
+
+
 def VectorRetrieverOuter(
     retriever_top_k: int = 25,
     use_reranker: bool = True,
@@ -17,6 +52,7 @@ def VectorRetrieverOuter(
     user_id: str = "Chat_DKU",
     search_mode: int = 0,
     files: list = [],
+    observation_format: str = "compact",
 ):
     """
     Retrieve reranked relevant documents using semantic search.
@@ -27,6 +63,8 @@ def VectorRetrieverOuter(
         search_mode: 0 for searching  the default corpus | 1 for searching the user
             corpus | 2 for searching both
         docs: Names of documents searching. Required for search_mode 1 or 2.
+        observation_format: "compact" for source ids and a source table,
+            "raw" for the full `NodeWithScore` reprs
 
     """
     if not (0 <= search_mode <= 2):
@@ -36,6 +74,8 @@ def VectorRetrieverOuter(
         )
         search_mode = 0
 
+    observation_format = check_observation_format(observation_format)
+
     if search_mode != 0 and not files:
         logger.warning("`docs` must be provided when search_mode is 1 or 2.")
         search_mode = 0
@@ -51,7 +91,7 @@ def VectorRetrieverOuter(
     # Had to name this differently from VectorRetriever
     def VectorQuery(
         semantic_query: str,
-    ) -> list:
+    ) -> str:
         """
         Retrieve reranked relevant documents using semantic search.
 
@@ -66,16 +106,17 @@ def VectorRetrieverOuter(
         """
         parent_span = get_current_span()
         vector_result = []
+        back_refs = []
         # Retrieve documents with individual error handling
         try:
-            with timeout() as ctx:
-                vector_result = ctx.run(
-                    vector_retriever.query_with_tell,
-                    query=semantic_query,
-                    parent_span=parent_span,
-                )
-            if use_reranker:
+            vector_result = _cached_query(
+                "VectorRetriever", vector_retriever, semantic_query, parent_span
+            )
+            # Chunks already returned earlier in this turn are only referenced.
+            vector_result, back_refs = split_seen_nodes(vector_result)
+            if use_reranker and vector_result:
                 vector_result = rerank(vector_result, semantic_query, reranker_top_n)
+            mark_seen_nodes(vector_result)
         except ValueError as e:
             raise e
         except QueryTimeoutError as e:
@@ -83,7 +124,9 @@ def VectorRetrieverOuter(
         except Exception as e:
             raise Exception(f"Vector retrieval failed: {e}")
 
-        return str(vector_result)
+        if observation_format == "raw":
+            return str(vector_result + back_refs)
+        return nodes_to_observation(vector_result + back_refs)
 
     return VectorQuery
 
@@ -95,6 +138,7 @@ def KeywordRetrieverOuter(
     user_id: str = "Chat_DKU",
     search_mode: int = 0,
     files: list = [],
+    observation_format: str = "compact",
 ):
     """
     Retrieve relevant documents using BM25 keyword matching.
@@ -105,6 +149,8 @@ def KeywordRetrieverOuter(
         search_mode: 0 for searching  the default corpus | 1 for searching the user
             corpus | 2 for searching both
         docs: Names of documents searching. Required for search_mode 1 or 2.
+        observation_format: "compact" for source ids and a source table,
+            "raw" for the full `NodeWithScore` reprs
 
     """
     if not (0 <= search_mode <= 2):
@@ -114,6 +160,8 @@ def KeywordRetrieverOuter(
         )
         search_mode = 0
 
+    observation_format = check_observation_format(observation_format)
+
     if search_mode != 0 and not files:
         logger.warning("`docs` must be provided when search_mode is 1 or 2.")
         search_mode = 0
@@ -128,7 +176,7 @@ def KeywordRetrieverOuter(
 
     def KeywordQuery(
         keyword_query: str | list[str],
-    ) -> list:
+    ) -> str:
         """
         Retrieve relevant documents using BM25 keyword matching.
 
@@ -147,23 +195,25 @@ def KeywordRetrieverOuter(
                 keyword_query[i] = str(keyword_query[i])
 
         keyword_result = []
+        back_refs = []
 
         try:
-            with timeout() as ctx:
-                keyword_result = ctx.run(
-                    keyword_retriever.query_with_tell,
-                    query=keyword_query,
-                    parent_span=parent_span,
-                )
-            if use_reranker:
+            keyword_result = _cached_query(
+                "KeywordRetriever", keyword_retriever, keyword_query, parent_span
+            )
+            keyword_result, back_refs = split_seen_nodes(keyword_result)
+            if use_reranker and keyword_result:
                 keyword_result = rerank(
                     keyword_result, str(keyword_query), reranker_top_n
                 )
+            mark_seen_nodes(keyword_result)
         except QueryTimeoutError as e:
             raise Exception(f"Keyword retriever timeout: {e}")
         except Exception as e:
             raise Exception(f"Keyword retrieval failed: {e}")
 
-        return str(keyword_result)
+        if observation_format == "raw":
+            return str(keyword_result + back_refs)
+        return nodes_to_observation(keyword_result + back_refs)
 
     return KeywordQuery
@@ -0,0 +1,230 @@
+"""
+Cache of query embeddings.
+
+Every vector search embeds its query with TEI, and the popular questions are
+asked again and again in every Django worker. `QueryEmbeddingCache` keeps the
+embeddings in a per-process LRU in front of Redis, where they are shared by
+all workers and hosts. Keys are made of the embedding model and the sha1 of
+the query with its whitespace collapsed, and vectors are stored in Redis as
+float16 (half the size of float32, and still exact enough for ranking).
+
+Concurrent misses of the same query are embedded once: threads of a process
+wait for the one already embedding it, and processes wait for the one holding
+the Redis lock of the key. A waiter that gives up after `wait` seconds embeds
+the query itself. After a Redis error the cache skips Redis for
+`retry_after` seconds and acts as a plain LRU, so an unavailable Redis costs
+one failed call, not one per lookup.
+"""
+
+import hashlib
+import logging
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, Sequence
+
+import numpy as np
+from redis import Redis, RedisError
+
+from chatdku.config import config
+from chatdku.core.tools.tool_cache import canonicalize
+
+logger = logging.getLogger(__name__)
+
+KEY_PREFIX = "query_embedding"
+
+Embedding = tuple[float, ...]
+
+# Returned by `_redis_call` instead of raising
+_FAILED = object()
+
+
+class QueryEmbeddingCache:
+    """
+    Args:
+        model: Name of the embedding model, part of every key.
+        redis_client: Shared tier. Without it only the LRU is used.
+        maxsize: Embeddings kept per process.
+        ttl: Seconds an embedding stays in Redis.
+        wait: Seconds to wait for another thread or process embedding the
+            same query before embedding it here.
+        poll_interval: Seconds between reads of Redis while waiting.
+        retry_after: Seconds Redis is skipped after an error.
+    """
+
+    def __init__(
+        self,
+        model: str,
+        redis_client: Redis | None = None,
+        maxsize: int = 4096,
+        ttl: float = 7 * 24 * 60 * 60,
+        wait: float = 2.0,
+        poll_interval: float = 0.02,
+        retry_after: float = 5.0,
+    ):
+        self.model = model
+        self.redis = redis_client
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.wait = wait
+        self.poll_interval = poll_interval
+        self.retry_after = retry_after
+        self._redis_down_until = 0.0
+        self._local: OrderedDict[str, Embedding] = OrderedDict()
+        self._pending: dict[str, threading.Event] = {}
+        self._lock = threading.Lock()
+        self._counts = {
+            "local_hits": 0,
+            "redis_hits": 0,
+            "coalesced": 0,
+            "misses": 0,
+            "redis_errors": 0,
+        }
+
+    def key(self, text: str) -> str:
+        digest = hashlib.sha1(text.encode()).hexdigest()
+        return f"{KEY_PREFIX}:{self.model}:{digest}"
+
+    def _count(self, name: str):
+        with self._lock:
+            self._counts[name] += 1
+
+    def _local_get(self, key: str) -> Embedding | None:
+        with self._lock:
+            embedding = self._local.get(key)
+            if embedding is not None:
+                self._local.move_to_end(key)
+            return embedding
+
+    def _remember(self, key: str, embedding: Embedding):
+        with self._lock:
+            self._local[key] = embedding
+            self._local.move_to_end(key)
+            while len(self._local) > self.maxsize:
+                self._local.popitem(last=False)
+
+    def _redis_available(self) -> bool:
+        return self.redis is not None and time.monotonic() >= self._redis_down_until
+
+    def _redis_call(self, method: str, *args, **kwargs):
+        """Result of the Redis command, or `_FAILED` if Redis is unavailable."""
+        if not self._redis_available():
+            return _FAILED
+        try:
+            return getattr(self.redis, method)(*args, **kwargs)
+        except RedisError as e:
+            self._count("redis_errors")
+            self._redis_down_until = time.monotonic() + self.retry_after
+            logger.warning(f"Query embedding cache {method} failed: {e}")
+            return _FAILED
+
+    def _redis_get(self, key: str) -> Embedding | None:
+        data = self._redis_call("get", key)
+        if data is None or data is _FAILED:
+            return None
+        return tuple(np.frombuffer(data, dtype=np.float16).astype(np.float32).tolist())
+
+    def embed(
+        self, query: str, embed_fn: Callable[[str], Sequence[float]]
+    ) -> Embedding:
+        """
+        Return the embedding of `query`, calling `embed_fn` with the
+        normalized query on a miss.
+        """
+        text = canonicalize(query)
+        key = self.key(text)
+
+        embedding = self._local_get(key)
+        if embedding is not None:
+            self._count("local_hits")
+            return embedding
+
+        # Only one thread per process goes on to Redis and TEI for a key
+        with self._lock:
+            event = self._pending.get(key)
+            leader = event is None
+            if leader:
+                event = self._pending[key] = threading.Event()
+        if not leader:
+            event.wait(self.wait)
+            embedding = self._local_get(key)
+            if embedding is not None:
+                self._count("coalesced")
+                return embedding
+            self._count("misses")
+            return self._compute(key, text, embed_fn)
+
+        try:
+            embedding = self._redis_get(key)
+            if embedding is not None:
+                self._count("redis_hits")
+            else:
+                embedding = self._fetch(key, text, embed_fn)
+            self._remember(key, embedding)
+            return embedding
+        finally:
+            with self._lock:
+                del self._pending[key]
+            event.set()
+
+    def _fetch(self, key, text, embed_fn) -> Embedding:
+        """Embed `text` unless another process is already embedding it."""
+        lock_key = f"{key}:lock"
+        locked = self._redis_call(
+            "set", lock_key, "1", nx=True, px=int(self.wait * 1000)
+        )
+        if locked is None:
+            # Another process holds the lock. Stop waiting if Redis fails.
+            deadline = time.monotonic() + self.wait
+            while time.monotonic() < deadline and self._redis_available():
+                time.sleep(self.poll_interval)
+                embedding = self._redis_get(key)
+                if embedding is not None:
+                    self._count("coalesced")
+                    return embedding
+        self._count("misses")
+        try:
+            return self._compute(key, text, embed_fn)
+        finally:
+            if locked is True:
+                self._redis_call("delete", lock_key)
+
+    def _compute(self, key, text, embed_fn) -> Embedding:
+        vector = np.asarray(embed_fn(text), dtype=np.float16)
+        self._redis_call("set", key, vector.tobytes(), px=int(self.ttl * 1000))
+        # Return what Redis serves, so every worker ranks with the same vector
+        return tuple(vector.astype(np.float32).tolist())
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {**self._counts, "size": len(self._local)}
+
+
+_query_embedding_cache: QueryEmbeddingCache | None = None
+_query_embedding_cache_lock = threading.Lock()
+
+
+def get_query_embedding_cache() -> QueryEmbeddingCache:
+    """Return the process-wide `QueryEmbeddingCache`, creating it on first use."""
+    global _query_embedding_cache
+    if _query_embedding_cache is None:
+        with _query_embedding_cache_lock:
+            if _query_embedding_cache is None:
+                redis_client = None
+                if config.redis_host and config.query_embedding_cache_redis:
+                    redis_client = Redis(
+                        host=config.redis_host,
+                        port=config.redis_port,
+                        username="default",
+                        password=config.redis_password,
+                        # A slow cache must not be slower than TEI
+                        socket_timeout=0.5,
+                        socket_connect_timeout=0.5,
+                    )
+                _query_embedding_cache = QueryEmbeddingCache(
+                    model=config.embedding,
+                    redis_client=redis_client,
+                    maxsize=config.query_embedding_cache_size,
+                    ttl=config.query_embedding_cache_ttl,
+                )
+    return _query_embedding_cache
@@ -0,0 +1,159 @@
+"""
+async_postgres_retriever.py
+
+Async variant of PostgresRetriever for the asyncio code paths.
+
+Differences from the psycopg2 retriever:
+  1. psycopg 3 `AsyncConnectionPool`  → waiters queue on the event loop,
+     not on a global semaphore + blocked threads
+  2. Dense/sparse SQL executed with `prepare=True`  → planned once per
+     connection instead of on every query
+  3. Embedding sent as a binary pgvector parameter (`%b`)  → no
+     `repr`-joined string literal to build and parse
+  4. Sparse starts while the query is embedded, dense runs as soon as
+     the embedding is ready
+
+Same SQL, permission filter, timeouts and RRF fusion as PostgresRetriever;
+the sync `query()` is inherited unchanged.
+"""
+
+from __future__ import annotations
+
+import asyncio
+from time import perf_counter
+
+import numpy as np
+
+try:
+    from pgvector.psycopg import register_vector_async
+    from psycopg_pool import AsyncConnectionPool
+except ImportError:
+    raise ImportError(
+        "`psycopg` or `pgvector` not installed. Please install using "
+        '`pip install -e ".[postgres-async]"`'
+    )
+
+from chatdku.config import config
+from chatdku.core.tools.retriever.base_retriever import NodeWithScore
+from chatdku.core.tools.retriever.postgres_retriever import PostgresRetriever, _Hit
+
+# One pool per event loop (a psycopg pool can't be shared across loops).
+_apools: dict[asyncio.AbstractEventLoop, AsyncConnectionPool] = {}
+
+
+async def _configure(conn) -> None:
+    await register_vector_async(conn)
+
+
+async def _get_apool() -> AsyncConnectionPool:
+    loop = asyncio.get_running_loop()
+    pool = _apools.get(loop)
+    if pool is None:
+        pool = AsyncConnectionPool(
+            conninfo=config.pg_ingest_uri,
+            min_size=1,
+            max_size=int(getattr(config, "postgres_maxconn", 20)),
+            # Waiting for a connection counts against the query budget.
+            timeout=float(getattr(config, "postgres_pool_timeout_s", 5.0)),
+            configure=_configure,
+            open=False,
+        )
+        _apools[loop] = pool
+        await pool.open()
+    return pool
+
+
+async def close_apool() -> None:
+    """Close the pool of the running event loop, e.g. on shutdown."""
+    pool = _apools.pop(asyncio.get_running_loop(), None)
+    if pool is not None:
+        await pool.close()
+
+
+class AsyncPostgresRetriever(PostgresRetriever):
+    """PostgresRetriever with a native async `aquery()`."""
+
+    async def _aexecute(self, sql: str, params: list, timeout_ms: int) -> list[_Hit]:
+        pool = await _get_apool()
+        async with pool.connection() as conn:
+            async with conn.transaction():
+                async with conn.cursor() as cur:
+                    # `SET LOCAL` can't take bind parameters, set_config(..., true)
+                    # is the transaction-local equivalent.
+                    await cur.execute(
+                        "SELECT set_config('statement_timeout', %s, true),"
+                        " set_config('lock_timeout', '500', true),"
+                        " set_config('hnsw.ef_search', %s, true)",
+                        (str(timeout_ms), str(self.ef_search)),
+                    )
+                    await cur.execute(sql, params, prepare=True)
+                    rows = await cur.fetchall()
+        return [
+            _Hit(id=row[0], text=row[1], metadata=row[2], file_name=row[3])
+            for row in rows
+        ]
+
+    async def _adense(
+        self, embedding: tuple[float, ...], timeout_ms: int
+    ) -> list[_Hit]:
+        sql, params = self._dense_sql(
+            np.asarray(embedding, dtype=np.float32), placeholder="%b"
+        )
+        return await self._aexecute(sql, params, timeout_ms)
+
+    async def _asparse(self, query: str, timeout_ms: int) -> list[_Hit]:
+        sql, params = self._sparse_sql(query)
+        return await self._aexecute(sql, params, timeout_ms)
+
+    async def aquery(self, query: str, verbose: bool = False) -> list[NodeWithScore]:
+        """
+        Async hybrid search:
+          1) Sparse starts right away (best-effort)
+          2) Meanwhile the query is embedded, then dense runs (must succeed)
+          3) Fuse with RRF in Python
+        """
+        t0 = perf_counter()
+
+        sparse_task = None
+        sparse_timeout_ms = self._timeout_ms(self.sparse_timeout_ms)
+        if self.sparse_enabled:
+            sparse_task = asyncio.create_task(self._asparse(query, sparse_timeout_ms))
+
+        try:
+            # The embedding client is sync, keep it off the event loop.
+            embedding = await asyncio.to_thread(self._embed, query)
+            embed_s = perf_counter() - t0
+
+            t_dense0 = perf_counter()
+            dense_hits = await self._adense(
+                embedding, self._timeout_ms(self.statement_timeout_ms)
+            )
+            dense_s = perf_counter() - t_dense0
+        except BaseException:
+            # psycopg cancels the running statement on the server when the
+            # task awaiting it is cancelled
+            if sparse_task is not None:
+                sparse_task.cancel()
+            raise
+
+        # Best-effort: sparse may timeout or error; dense still returns.
+        sparse_hits: list[_Hit] = []
+        t_wait0 = perf_counter()
+        if sparse_task is not None:
+            try:
+                sparse_hits = await asyncio.wait_for(
+                    sparse_task, timeout=sparse_timeout_ms / 1000 + 0.5
+                )
+            except Exception:
+                pass
+        sparse_wait = perf_counter() - t_wait0
+
+        fused = self._rrf_fuse(dense_hits, sparse_hits)
+
+        if verbose or self.verbose:
+            print(
+                "[pg-async] "
+                f"embed={embed_s:.3f}s dense={dense_s:.3f}s sparse_wait={sparse_wait:.3f}s "
+                f"total={perf_counter() - t0:.3f}s q='{query[:40]}'"
+            )
+        return self._to_nodes(fused)
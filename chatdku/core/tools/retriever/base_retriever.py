@@ -1,5 +1,7 @@
 "By: Temuulen. Ask him if you don't understand"
 
+import asyncio
+from contextlib import contextmanager
 from dataclasses import dataclass
 from enum import Enum
 from typing import Any, Iterator, Mapping
@@ -56,6 +58,15 @@ class BaseDocRetriever:
         """
         raise NotImplementedError
 
+    async def aquery(self, query) -> list[NodeWithScore]:
+        """
+        Async version of `self.query`.
+
+        Runs `self.query` in a worker thread by default. Retrievers with
+        a native async client should override this.
+        """
+        return await asyncio.to_thread(self.query, query)
+
     def query_with_tell(self, query, parent_span=None) -> list:
         """
         Retrieve texts from the database with telemetry enabled.
@@ -63,6 +74,20 @@ class BaseDocRetriever:
 
         Uses opentelemetry to track the query and the response.
         """
+        with self._tell_span(query, parent_span) as tell:
+            return tell(self.query(query))
+
+    async def aquery_with_tell(self, query, parent_span=None) -> list:
+        """Async version of `self.query_with_tell`, uses `self.aquery`."""
+        with self._tell_span(query, parent_span) as tell:
+            return tell(await self.aquery(query))
+
+    @contextmanager
+    def _tell_span(self, query, parent_span=None):
+        """
+        Start the retriever span and yield a function that records
+        the retrieved nodes on it. Errors are recorded and re-raised.
+        """
         context = None
         if parent_span is not None:
             context = set_span_in_context(parent_span)
@@ -82,10 +107,8 @@ class BaseDocRetriever:
                     SpanAttributes.INPUT_MIME_TYPE: OpenInferenceMimeTypeValues.JSON.value,
                 }
             )
-            retrieved_nodes = []
 
-            try:
-                retrieved_nodes = self.query(query)
+            def tell(retrieved_nodes: list) -> list:
                 span.set_attributes(nodes_to_OTLP(retrieved_nodes))
                 span.set_attributes(
                     {
@@ -97,6 +120,9 @@ class BaseDocRetriever:
                 )
                 span.set_status(Status(StatusCode.OK))
                 return retrieved_nodes
+
+            try:
+                yield tell
             except Exception as e:
                 span.set_attributes(
                     {
@@ -108,7 +134,6 @@ class BaseDocRetriever:
                 )
                 span.set_status(Status(StatusCode.ERROR))
                 raise e
-            return retrieved_nodes
 
 
 def nodes_to_OTLP(nodes: list[NodeWithScore]) -> dict[str, Any]:
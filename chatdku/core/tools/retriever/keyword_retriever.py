@@ -9,7 +9,7 @@ from redis.commands.search.query import Query
 
 from chatdku.config import config
 from chatdku.core.tools.retriever.base_retriever import BaseDocRetriever, NodeWithScore
-from chatdku.core.tools.utils import get_url
+from chatdku.core.tools.utils import get_url, remaining_time
 
 
 def _ensure_nltk_resource(resource_path: str, download_name: str) -> None:
@@ -81,6 +81,9 @@ class KeywordRetriever(BaseDocRetriever):
             username="default",
             password=config.redis_password,
             db=0,
+            # Stop at the deadline of the calling tool, if any.
+            socket_timeout=remaining_time(),
+            socket_connect_timeout=remaining_time(),
         )
 
         index_name = f"idx:{config.index_name}"
@@ -17,6 +17,8 @@ Performance fixes applied vs original:
   4. Module-level SimpleConnectionPool  → no per-query TCP handshake
   5. Embedding passed as native Python list  → no manual string serialisation
   6. RRF via UNION ALL + GROUP BY  → replaces expensive FULL OUTER JOIN
+  7. Sparse runs on its own pooled connection while the query is embedded
+     and the dense branch runs  → latency is max(dense, sparse), not the sum
 """
 
 from __future__ import annotations
@@ -27,13 +29,14 @@ from psycopg2.pool import SimpleConnectionPool
 from llama_index.core import Settings
 
 from chatdku.config import config
+from chatdku.core.tools.query_embedding_cache import get_query_embedding_cache
 from chatdku.core.tools.retriever.base_retriever import BaseDocRetriever, NodeWithScore
-from chatdku.core.tools.utils import get_url
+from chatdku.core.tools.utils import get_url, remaining_time
 
-from contextlib import suppress
+from concurrent.futures import Future, ThreadPoolExecutor
+from concurrent.futures import TimeoutError as FuturesTimeoutError
 from dataclasses import dataclass
-from functools import lru_cache
-from threading import BoundedSemaphore
+from threading import BoundedSemaphore, Lock
 from typing import Any
 
 
@@ -45,8 +48,16 @@ _pool: SimpleConnectionPool | None = None
 
 # +++ added: global concurrency limiter (prevents DB overload under concurrency)
 # Keep this <= maxconn. Default to a conservative value.
-_DB_QUERY_SEMAPHORE = BoundedSemaphore(
-    value=int(getattr(config, "postgres_max_concurrent_queries", 8)),
+_MAX_CONCURRENT_QUERIES = int(getattr(config, "postgres_max_concurrent_queries", 8))
+_DB_QUERY_SEMAPHORE = BoundedSemaphore(value=_MAX_CONCURRENT_QUERIES)
+
+
+# Sparse branch runs here while the calling thread embeds + runs dense.
+# One worker per semaphore slot, so a sparse query never waits for a thread.
+# Each query inside the semaphore holds up to 2 connections (keep 2x <= maxconn).
+_SPARSE_EXECUTOR = ThreadPoolExecutor(
+    max_workers=_MAX_CONCURRENT_QUERIES,
+    thread_name_prefix="pg-sparse",
 )
 
 
@@ -72,6 +83,39 @@ def _return(p: SimpleConnectionPool, conn: pg_ext.connection) -> None:
     p.putconn(conn)
 
 
+class _SparseCall:
+    """
+    The sparse branch submitted to `_SPARSE_EXECUTOR`. `cancel()` drops it
+    while it is queued and cancels its query on the server once it runs,
+    which `Future.cancel()` cannot do.
+    """
+
+    def __init__(self):
+        self.future: Future | None = None
+        self._conn: pg_ext.connection | None = None
+        self._cancelled = False
+        self._lock = Lock()
+
+    def start(self, conn: pg_ext.connection) -> bool:
+        """Attach the borrowed connection. False if already cancelled."""
+        with self._lock:
+            self._conn = conn
+            return not self._cancelled
+
+    def finish(self) -> None:
+        # Before the connection goes back to the pool and another query
+        with self._lock:
+            self._conn = None
+
+    def cancel(self) -> None:
+        with self._lock:
+            self._cancelled = True
+            if self.future is not None:
+                self.future.cancel()
+            if self._conn is not None:
+                self._conn.cancel()
+
+
 class _VectorAdapter:
     def __init__(self, v: list[float] | tuple[float, ...]):
         self._v = v
@@ -166,14 +210,11 @@ class PostgresRetriever(BaseDocRetriever):
     # Helpers
     # ------------------------------------------------------------------
 
-    # +++ added: cache embeddings (good for repeated queries / concurrent same query)
-    @staticmethod
-    @lru_cache(maxsize=2048)
-    def _embed_cached(query: str) -> tuple[float, ...]:
-        return tuple(Settings.embed_model.get_query_embedding(query))
-
+    # cache embeddings across workers (repeated queries / concurrent same query)
     def _embed(self, query: str) -> tuple[float, ...]:
-        return self._embed_cached(query)
+        return get_query_embedding_cache().embed(
+            query, Settings.embed_model.get_query_embedding
+        )
 
     def _build_where(self) -> tuple[str, list]:
         """
@@ -273,35 +314,25 @@ class PostgresRetriever(BaseDocRetriever):
         # HNSW probe width
         cur.execute("SET LOCAL hnsw.ef_search = %s", (self.ef_search,))
 
-    # +++ added: dense branch
-    def _dense(self, conn: pg_ext.connection, query: str) -> list[_Hit]:
-        embedding = self._embed(query)
+    def _dense_sql(self, embedding: Any, placeholder: str = "%s") -> tuple[str, list]:
+        """SQL + params of the dense branch.
+
+        `placeholder` is the embedding's placeholder, e.g. "%b" to send it
+        in binary with psycopg 3.
+        """
         where, base_params = self._build_where()
         where, base_params = self._wrap_access_filter(where, base_params)
         sql = f"""
         SELECT id, text, metadata, file_name
         FROM   {self.table_name}
         {where}
-        ORDER  BY embedding <=> (%s)::vector
+        ORDER  BY embedding <=> ({placeholder})::vector
         LIMIT  %s;
         """
-        params = base_params + [embedding, self.dense_top_k]
-
-        with conn.cursor() as cur:
-            self._apply_session_settings(cur, self.statement_timeout_ms)
-            cur.execute(sql, params)
-            rows = cur.fetchall()
-
-        hits: list[_Hit] = []
-        for row in rows:
-            hits.append(_Hit(id=row[0], text=row[1], metadata=row[2], file_name=row[3]))
-        # debug
-        # print("FINAL SQL:", sql)
-        # print("PARAMS:", params)
-        return hits
+        return sql, base_params + [embedding, self.dense_top_k]
 
-    # +++ added: sparse branch (can be disabled / short-timeout / best-effort)
-    def _sparse(self, conn: pg_ext.connection, query: str) -> list[_Hit]:
+    def _sparse_sql(self, query: str) -> tuple[str, list]:
+        """SQL + params of the sparse branch."""
         where, base_params = self._build_where()
         where, base_params = self._wrap_access_filter(where, base_params)
         tsquery_cond = "text_search @@ plainto_tsquery('english', %s)"
@@ -316,11 +347,36 @@ class PostgresRetriever(BaseDocRetriever):
         ORDER  BY ts_rank(text_search, plainto_tsquery('english', %s)) DESC
         LIMIT  %s;
         """
-        params = base_params + [query, query, self.sparse_top_k]
+        return sql, base_params + [query, query, self.sparse_top_k]
+
+    # +++ added: dense branch
+    def _dense(
+        self, conn: pg_ext.connection, embedding: tuple[float, ...], timeout_ms: int
+    ) -> list[_Hit]:
+        sql, params = self._dense_sql(embedding)
+
+        with conn.cursor() as cur:
+            self._apply_session_settings(cur, timeout_ms)
+            cur.execute(sql, params)
+            rows = cur.fetchall()
+
+        hits: list[_Hit] = []
+        for row in rows:
+            hits.append(_Hit(id=row[0], text=row[1], metadata=row[2], file_name=row[3]))
+        # debug
+        # print("FINAL SQL:", sql)
+        # print("PARAMS:", params)
+        return hits
+
+    # +++ added: sparse branch (can be disabled / short-timeout / best-effort)
+    def _sparse(
+        self, conn: pg_ext.connection, query: str, timeout_ms: int
+    ) -> list[_Hit]:
+        sql, params = self._sparse_sql(query)
 
         with conn.cursor() as cur:
             # give sparse a tighter timeout so it can't dominate end-to-end latency
-            self._apply_session_settings(cur, self.sparse_timeout_ms)
+            self._apply_session_settings(cur, timeout_ms)
             cur.execute(sql, params)
             rows = cur.fetchall()
 
@@ -329,6 +385,35 @@ class PostgresRetriever(BaseDocRetriever):
             hits.append(_Hit(id=row[0], text=row[1], metadata=row[2], file_name=row[3]))
         return hits
 
+    def _sparse_on_own_conn(
+        self, query: str, timeout_ms: int, call: _SparseCall
+    ) -> tuple[list[_Hit], float, float]:
+        """Run `_sparse` on a separately borrowed connection.
+
+        Returns the hits and the start/end `perf_counter()` of the branch.
+        """
+        start = perf_counter()
+        pool, conn = _borrow()
+        try:
+            if not call.start(conn):
+                return [], start, perf_counter()
+            hits = self._sparse(conn, query, timeout_ms)
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            call.finish()
+            _return(pool, conn)
+        return hits, start, perf_counter()
+
+    def _timeout_ms(self, cap_ms: int) -> int:
+        """`cap_ms`, shortened to what is left of the tool call's deadline."""
+        remaining = remaining_time()
+        if remaining is None:
+            return cap_ms
+        return max(1, min(cap_ms, int(remaining * 1000)))
+
     # +++ added: Python-side RRF merge (tiny compute: O(k))
     def _rrf_fuse(
         self,
@@ -358,8 +443,8 @@ class PostgresRetriever(BaseDocRetriever):
     def query(self, query: str, verbose: bool = False) -> list[NodeWithScore]:
         """
         Concurrency-safe hybrid search:
-          1) Dense must succeed (fast with HNSW)
-          2) Sparse is best-effort (short timeout + error suppression)
+          1) Sparse starts first on its own connection (best-effort)
+          2) Meanwhile the query is embedded and dense runs (must succeed)
           3) Fuse with RRF in Python
         """
         t0 = perf_counter()
@@ -370,49 +455,88 @@ class PostgresRetriever(BaseDocRetriever):
         with _DB_QUERY_SEMAPHORE:
             sem_wait = perf_counter() - t_sem0
 
-            # 2) pool wait
-            t_pool0 = perf_counter()
-            pool, conn = _borrow()
-            pool_wait = perf_counter() - t_pool0
+            # 2) sparse in the background, it doesn't need the embedding.
+            # The executor's threads don't see the deadline, so the timeout
+            # is computed here.
+            sparse_call: _SparseCall | None = None
+            sparse_timeout_ms = self._timeout_ms(self.sparse_timeout_ms)
+            if self.sparse_enabled:
+                sparse_call = _SparseCall()
+                sparse_call.future = _SPARSE_EXECUTOR.submit(
+                    self._sparse_on_own_conn, query, sparse_timeout_ms, sparse_call
+                )
 
+            # 3) embedding + dense on the calling thread. Sparse is cancelled
+            # when any of it fails, the embedding included.
             try:
-                # 3) dense/sparse + RRF
-                t_dense0 = perf_counter()
-                dense_hits = self._dense(conn, query)
-                dense_s = perf_counter() - t_dense0
-
-                sparse_hits: list[_Hit] = []
-                sparse_s = 0.0
-                if self.sparse_enabled:
-                    t_sparse0 = perf_counter()
-                    # Best-effort: sparse may timeout or error; dense still returns.
-                    with suppress(Exception):
-                        sparse_hits = self._sparse(conn, query)
-                    sparse_s = perf_counter() - t_sparse0
-
-                t_fuse0 = perf_counter()
-                fused = self._rrf_fuse(dense_hits, sparse_hits)
-                fuse_s = perf_counter() - t_fuse0
-
-                t_commit0 = perf_counter()
-                conn.commit()
-                commit_s = perf_counter() - t_commit0
-
+                t_embed0 = perf_counter()
+                embedding = self._embed(query)
+                embed_s = perf_counter() - t_embed0
+
+                t_pool0 = perf_counter()
+                pool, conn = _borrow()
+                pool_wait = perf_counter() - t_pool0
+
+                try:
+                    t_dense0 = perf_counter()
+                    dense_hits = self._dense(
+                        conn, embedding, self._timeout_ms(self.statement_timeout_ms)
+                    )
+                    t_dense1 = perf_counter()
+
+                    t_commit0 = perf_counter()
+                    conn.commit()
+                    commit_s = perf_counter() - t_commit0
+                except Exception:
+                    conn.rollback()
+                    raise
+                finally:
+                    _return(pool, conn)
             except Exception:
-                conn.rollback()
+                if sparse_call is not None:
+                    sparse_call.cancel()
                 raise
-            finally:
-                _return(pool, conn)
+
+            # 4) collect sparse. Best-effort: it may timeout or error;
+            # dense still returns. Bounded by the DB-side sparse timeout.
+            sparse_hits: list[_Hit] = []
+            sparse_s = overlap_s = 0.0
+            t_wait0 = perf_counter()
+            if sparse_call is not None:
+                try:
+                    sparse_hits, t_sparse0, t_sparse1 = sparse_call.future.result(
+                        timeout=sparse_timeout_ms / 1000 + 0.5
+                    )
+                    sparse_s = t_sparse1 - t_sparse0
+                    # Time sparse ran alongside embedding + dense
+                    overlap_s = max(
+                        0.0, min(t_sparse1, t_dense1) - max(t_sparse0, t_embed0)
+                    )
+                except FuturesTimeoutError:
+                    sparse_call.cancel()
+                except Exception:
+                    pass
+            sparse_wait = perf_counter() - t_wait0
+
+            t_fuse0 = perf_counter()
+            fused = self._rrf_fuse(dense_hits, sparse_hits)
+            fuse_s = perf_counter() - t_fuse0
 
         total = perf_counter() - t0
         if verbose or self.verbose:
             print(
                 "[pg] "
-                f"sem_wait={sem_wait:.3f}s pool_wait={pool_wait:.3f}s "
-                f"dense={dense_s:.3f}s sparse={sparse_s:.3f}s fuse={fuse_s:.3f}s commit={commit_s:.3f}s "
+                f"sem_wait={sem_wait:.3f}s embed={embed_s:.3f}s pool_wait={pool_wait:.3f}s "
+                f"dense={t_dense1 - t_dense0:.3f}s sparse={sparse_s:.3f}s "
+                f"overlap={overlap_s:.3f}s sparse_wait={sparse_wait:.3f}s "
+                f"fuse={fuse_s:.3f}s commit={commit_s:.3f}s "
                 f"total={total:.3f}s q='{query[:40]}'"
             )
 
+        return self._to_nodes(fused)
+
+    @staticmethod
+    def _to_nodes(fused: list[tuple[_Hit, float]]) -> list[NodeWithScore]:
         results: list[NodeWithScore] = []
         for hit, score in fused:
             md = hit.metadata or {}
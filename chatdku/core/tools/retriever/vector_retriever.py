@@ -1,9 +1,11 @@
 import chromadb
+import requests
 from chromadb.utils.embedding_functions import HuggingFaceEmbeddingServer
 
 from chatdku.config import config
+from chatdku.core.tools.query_embedding_cache import get_query_embedding_cache
 from chatdku.core.tools.retriever.base_retriever import BaseDocRetriever, NodeWithScore
-from chatdku.core.tools.utils import get_url
+from chatdku.core.tools.utils import get_url, remaining_time
 
 
 class VectorRetriever(BaseDocRetriever):
@@ -34,14 +36,29 @@ class VectorRetriever(BaseDocRetriever):
             ),
         )
 
+        # Embed with the deadline of the calling tool as the request timeout,
+        # and skip the Chroma query if the deadline already passed.
+        embedding = get_query_embedding_cache().embed(query, self._embed)
+        remaining_time()
+
         query_result = collection.query(
-            query_texts=query,
+            query_embeddings=[list(embedding)],
             n_results=self.retriever_top_k,
             where=self.__get_chroma_filter(),
         )
         retrieved_nodes = self.chroma_result_to_nodes(query_result)
         return retrieved_nodes
 
+    @staticmethod
+    def _embed(query: str) -> list[float]:
+        response = requests.post(
+            config.tei_url + "/" + config.embedding + "/embed",
+            json={"inputs": [query]},
+            timeout=remaining_time(),
+        )
+        response.raise_for_status()
+        return response.json()[0]
+
     def __get_chroma_filter(
         self,
     ) -> dict:
@@ -0,0 +1,241 @@
+"""
+Cache of tool results.
+
+The lookup tools (major requirements, prerequisites, class schedule, course
+recommendations) and the retrievers return the same result for the same
+arguments until the data is ingested again. `ToolCache` keeps their results
+in a per-process LRU and, with `tool_cache_redis`, in Redis so that all
+workers share them. Values stored in Redis are pickled.
+
+Keys are made of the tool name, the canonicalized arguments, an optional
+scope (e.g. the user and documents a retriever searches) and the corpus
+version, which the ingestion scripts bump (see
+`chatdku.ingestion.corpus_version`). Tools reading files that are replaced
+outside of the ingestion scripts, such as the prerequisites CSV, list them
+in `tool_cache_sources`, and their keys also contain the modification time
+of those files. Entries also expire after the tool's TTL in
+`tool_cache_ttls`. Tools without a TTL, and tools listed in
+`tool_cache_bypass`, are never cached. Neither are exceptions and results
+wrapped in `UncachedResult`, such as the error message of a failed lookup.
+"""
+
+import hashlib
+import json
+import logging
+import os
+import pickle
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable
+
+from redis import Redis, RedisError
+
+from chatdku.config import config
+from chatdku.ingestion.corpus_version import get_corpus_version
+
+logger = logging.getLogger(__name__)
+
+KEY_PREFIX = "tool_cache"
+
+# Results of a call are the same for strings differing only in whitespace
+_WHITESPACE = str.maketrans({"\t": " ", "\n": " ", "\r": " "})
+
+
+class UncachedResult(str):
+    """A tool result returned to the caller but not cached."""
+
+
+def canonicalize(value: Any) -> Any:
+    if isinstance(value, str):
+        return " ".join(value.translate(_WHITESPACE).split())
+    if isinstance(value, dict):
+        return {str(k): canonicalize(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [canonicalize(v) for v in value]
+    return value
+
+
+class ToolCache:
+    """
+    Args:
+        ttls: Seconds a result of each tool stays valid. Tools not listed
+            are not cached.
+        bypass: Tools that are never cached.
+        maxsize: Entries of the in-process LRU.
+        redis_client: Where the corpus version is read from. Without it,
+            entries are only invalidated by their TTL.
+        shared: Also store the results in `redis_client`.
+        version_ttl: Seconds the corpus version is reused before it is read
+            from Redis again.
+        sources: Files each tool reads. A result is not reused after one of
+            them changed.
+    """
+
+    def __init__(
+        self,
+        ttls: dict[str, float],
+        bypass: tuple = (),
+        maxsize: int = 1024,
+        redis_client: Redis | None = None,
+        shared: bool = False,
+        version_ttl: float = 5.0,
+        sources: dict[str, list[str]] | None = None,
+    ):
+        self.ttls = dict(ttls)
+        self.bypass = set(bypass)
+        self.maxsize = maxsize
+        self.redis = redis_client
+        self.shared = shared and redis_client is not None
+        self.version_ttl = version_ttl
+        self.sources = {tool: list(paths) for tool, paths in (sources or {}).items()}
+        self._local: OrderedDict[str, tuple[float, Any]] = OrderedDict()
+        self._lock = threading.Lock()
+        self._version = ("0", 0.0)
+        self._hits = 0
+        self._misses = 0
+
+    def enabled(self, tool_name: str) -> bool:
+        return tool_name in self.ttls and tool_name not in self.bypass
+
+    def _corpus_version(self) -> str:
+        version, read_at = self._version
+        if self.redis is None or time.monotonic() - read_at < self.version_ttl:
+            return version
+        try:
+            version = get_corpus_version(self.redis)
+        except RedisError as e:
+            logger.warning(f"Could not read the corpus version: {e}")
+        self._version = (version, time.monotonic())
+        return version
+
+    def _source_mtimes(self, tool_name: str) -> list[int]:
+        mtimes = []
+        for path in self.sources.get(tool_name, ()):
+            try:
+                mtimes.append(os.stat(path).st_mtime_ns)
+            except OSError:
+                mtimes.append(0)
+        return mtimes
+
+    def key(self, tool_name: str, args: dict, scope: str = "") -> str:
+        canonical = json.dumps(
+            [canonicalize(args), scope, self._source_mtimes(tool_name)],
+            sort_keys=True,
+            default=str,
+        )
+        digest = hashlib.sha1(canonical.encode()).hexdigest()
+        return f"{KEY_PREFIX}:{self._corpus_version()}:{tool_name}:{digest}"
+
+    def get(self, key: str):
+        """Return `(True, value)` on a hit and `(False, None)` on a miss."""
+        now = time.time()
+        with self._lock:
+            entry = self._local.get(key)
+            if entry is not None:
+                if entry[0] > now:
+                    self._local.move_to_end(key)
+                    return True, entry[1]
+                del self._local[key]
+
+        if self.shared:
+            try:
+                pipe = self.redis.pipeline(transaction=False)
+                pipe.get(key)
+                pipe.pttl(key)
+                data, pttl = pipe.execute()
+            except RedisError as e:
+                logger.warning(f"Tool cache read failed: {e}")
+            else:
+                if data is not None:
+                    value = pickle.loads(data)
+                    self._remember(key, value, now + max(pttl, 0) / 1000)
+                    return True, value
+        return False, None
+
+    def set(self, key: str, value: Any, ttl: float) -> None:
+        self._remember(key, value, time.time() + ttl)
+        if self.shared:
+            try:
+                self.redis.set(key, pickle.dumps(value), px=int(ttl * 1000))
+            except RedisError as e:
+                logger.warning(f"Tool cache write failed: {e}")
+
+    def _remember(self, key, value, expires_at):
+        with self._lock:
+            self._local[key] = (expires_at, value)
+            self._local.move_to_end(key)
+            while len(self._local) > self.maxsize:
+                self._local.popitem(last=False)
+
+    def call(
+        self,
+        tool_name: str,
+        func: Callable[..., Any],
+        args: dict,
+        scope: str = "",
+    ) -> tuple[Any, bool]:
+        """
+        Return `(result, hit)` of `func(**args)`. Exceptions and
+        `UncachedResult`s are not cached.
+        """
+        if not self.enabled(tool_name):
+            return func(**args), False
+
+        key = self.key(tool_name, args, scope)
+        hit, value = self.get(key)
+        with self._lock:
+            if hit:
+                self._hits += 1
+            else:
+                self._misses += 1
+        if hit:
+            return value, True
+
+        value = func(**args)
+        if not isinstance(value, UncachedResult):
+            self.set(key, value, self.ttls[tool_name])
+        return value, False
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "hits": self._hits,
+                "misses": self._misses,
+                "size": len(self._local),
+            }
+
+
+_tool_cache: ToolCache | None = None
+_tool_cache_lock = threading.Lock()
+
+
+def get_tool_cache() -> ToolCache:
+    """Return the process-wide `ToolCache`, creating it on first use."""
+    global _tool_cache
+    if _tool_cache is None:
+        with _tool_cache_lock:
+            if _tool_cache is None:
+                redis_client = None
+                if config.redis_host:
+                    redis_client = Redis(
+                        host=config.redis_host,
+                        port=config.redis_port,
+                        username="default",
+                        password=config.redis_password,
+                        # A slow cache must not be slower than the tool
+                        socket_timeout=0.5,
+                        socket_connect_timeout=0.5,
+                    )
+                _tool_cache = ToolCache(
+                    ttls=config.tool_cache_ttls,
+                    bypass=tuple(config.tool_cache_bypass),
+                    maxsize=config.tool_cache_size,
+                    redis_client=redis_client,
+                    shared=config.tool_cache_redis,
+                    sources={
+                        tool: [getattr(config, key) for key in keys]
+                        for tool, keys in config.tool_cache_sources.items()
+                    },
+                )
+    return _tool_cache
@@ -1,13 +1,22 @@
+import hashlib
+import logging
 import re
-from concurrent.futures import ThreadPoolExecutor
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
 from concurrent.futures import TimeoutError as FuturesTimeoutError
 from contextlib import contextmanager
+from contextvars import ContextVar, copy_context
 
 import pandas as pd
+from llama_index.core import Settings
+from opentelemetry.trace import get_current_span
 
 from chatdku.config import config
 from chatdku.core.tools.retriever.base_retriever import NodeWithScore
 
+logger = logging.getLogger(__name__)
+
 
 class QueryTimeoutError(Exception):
     """Raised when a query exceeds the timeout limit."""
@@ -15,14 +24,146 @@ class QueryTimeoutError(Exception):
     pass
 
 
+class ToolOverloadedError(Exception):
+    """Raised when the shared tool executor has no capacity left."""
+
+    pass
+
+
+class ToolExecutor:
+    """
+    Process-wide, size-bounded executor for blocking tool calls.
+
+    At most `max_workers` calls run at once and at most `max_queue` more
+    wait for a worker. Submissions beyond that are rejected with
+    `ToolOverloadedError` instead of piling up on the backends.
+    The context (e.g. the deadline set by `timeout()`) is copied into
+    the worker thread.
+
+    Args:
+        max_workers (int): Number of worker threads.
+        max_queue (int): Number of calls allowed to wait for a worker.
+    """
+
+    def __init__(self, max_workers: int = 16, max_queue: int = 32):
+        self.max_workers = max_workers
+        self.max_queue = max_queue
+        self._pool = ThreadPoolExecutor(
+            max_workers=max_workers, thread_name_prefix="chatdku-tool"
+        )
+        self._slots = threading.BoundedSemaphore(max_workers + max_queue)
+        self._lock = threading.Lock()
+        self._pending = 0  # Accepted and not finished yet
+        self._in_flight = 0
+        self._rejected = 0
+        self._timed_out = 0
+
+    def submit(self, func, *args, **kwargs) -> Future:
+        if not self._slots.acquire(blocking=False):
+            with self._lock:
+                self._rejected += 1
+            raise ToolOverloadedError(
+                f"Tool executor saturated ({self.max_workers} running,"
+                f" {self.max_queue} queued)"
+            )
+
+        ctx = copy_context()
+
+        def _call():
+            with self._lock:
+                self._in_flight += 1
+            try:
+                return ctx.run(func, *args, **kwargs)
+            finally:
+                with self._lock:
+                    self._in_flight -= 1
+                self._release()
+
+        with self._lock:
+            self._pending += 1
+        try:
+            future = self._pool.submit(_call)
+        except BaseException:
+            self._release()
+            raise
+        # A call cancelled while queued never reaches `_call()`.
+        future.add_done_callback(lambda f: f.cancelled() and self._release())
+        return future
+
+    def _release(self):
+        with self._lock:
+            self._pending -= 1
+        self._slots.release()
+
+    def record_timeout(self):
+        with self._lock:
+            self._timed_out += 1
+
+    def stats(self) -> dict:
+        """Return the current gauges and counters of the executor."""
+        with self._lock:
+            return {
+                "in_flight": self._in_flight,
+                "queue_depth": self._pending - self._in_flight,
+                "rejected": self._rejected,
+                "timed_out": self._timed_out,
+                "max_workers": self.max_workers,
+                "max_queue": self.max_queue,
+            }
+
+
+_tool_executor: ToolExecutor | None = None
+_tool_executor_lock = threading.Lock()
+
+
+def get_tool_executor() -> ToolExecutor:
+    """Return the process-wide `ToolExecutor`, creating it on first use."""
+    global _tool_executor
+    if _tool_executor is None:
+        with _tool_executor_lock:
+            if _tool_executor is None:
+                _tool_executor = ToolExecutor(
+                    max_workers=config.tool_executor_workers,
+                    max_queue=config.tool_executor_queue,
+                )
+    return _tool_executor
+
+
+# Absolute `time.monotonic()` deadline of the current tool call, see `timeout()`.
+_deadline: ContextVar[float | None] = ContextVar("chatdku_tool_deadline", default=None)
+
+
+def remaining_time(default: float | None = None) -> float | None:
+    """
+    Seconds left until the deadline set by `timeout()`.
+
+    Backends should use this as their socket or request timeout so that
+    a timed-out call stops instead of running on in the background.
+
+    Args:
+        default (float | None): Returned when no deadline is set.
+
+    Raises:
+        QueryTimeoutError: If the deadline has already passed.
+    """
+    deadline = _deadline.get()
+    if deadline is None:
+        return default
+    remaining = deadline - time.monotonic()
+    if remaining <= 0:
+        raise QueryTimeoutError("Query deadline exceeded")
+    return remaining
+
+
 @contextmanager
 def timeout(seconds: int = 5):
     """
-    Thread-safe timeout using concurrent.futures.
+    Thread-safe timeout using the shared `ToolExecutor`.
 
     This function is used as a wrapper context around functions to
     time their response. If there is no response in `seconds`,
-    it will trigger `QueryTimeoutError`.
+    it will trigger `QueryTimeoutError`. The deadline is visible to
+    the function through `remaining_time()`.
 
     Args:
         seconds (int): The amount of seconds it should take until \
@@ -32,24 +173,31 @@ def timeout(seconds: int = 5):
 
     class TimeoutContext:
         def __init__(self):
-            self.executor = ThreadPoolExecutor(max_workers=1)
+            self.executor = get_tool_executor()
             self.future = None
 
         def run(self, func, *args, **kwargs):
             self.future = self.executor.submit(func, *args, **kwargs)
+            span = get_current_span()
+            for key, value in self.executor.stats().items():
+                span.set_attribute(f"tool_executor.{key}", value)
             try:
-                return self.future.result(timeout=seconds)
-            except FuturesTimeoutError:
+                return self.future.result(timeout=remaining_time(seconds))
+            except (FuturesTimeoutError, QueryTimeoutError):
+                # Drops the call if it is still queued, a running call
+                # stops at its own socket timeout.
+                self.future.cancel()
+                self.executor.record_timeout()
                 raise QueryTimeoutError(f"Query exceeded {seconds} second timeout")
-            finally:
-                self.executor.shutdown(wait=False)
 
-    ctx = TimeoutContext()
+    # A nested timeout can only shorten the deadline of the outer one.
+    deadline = time.monotonic() + seconds
+    outer = _deadline.get()
+    token = _deadline.set(deadline if outer is None else min(outer, deadline))
     try:
-        yield ctx
+        yield TimeoutContext()
     finally:
-        if ctx.executor:
-            ctx.executor.shutdown(wait=False)
+        _deadline.reset(token)
 
 
 def get_url(metadata: dict):
@@ -84,6 +232,86 @@ def get_url(metadata: dict):
         return f"no url, error: {str(e)}"
 
 
+OBSERVATION_FORMATS = ("compact", "raw")
+
+
+def check_observation_format(observation_format: str) -> str:
+    """Return `observation_format`, or "compact" if it is not a known format."""
+    if observation_format not in OBSERVATION_FORMATS:
+        logger.warning(
+            f"Invalid observation_format: {observation_format}."
+            " Defaulting to compact."
+        )
+        return "compact"
+    return observation_format
+
+
+def _source_of(metadata: dict) -> tuple[str, str]:
+    # `VectorRetriever` uses "file_name" while `KeywordRetriever` uses "filename".
+    name = metadata.get("file_name") or metadata.get("filename") or "Unknown"
+    url = metadata.get("url") or ""
+    if url.startswith("no url"):
+        url = ""
+    return str(name), str(url)
+
+
+def _source_ids() -> dict[tuple[str, str], str]:
+    """Source ids of the turn, so that a source keeps its id across tool calls."""
+    memory = get_internal_memory()
+    if memory is None:
+        return {}
+    return memory.setdefault("source_ids", {})
+
+
+def _source_tag(node: NodeWithScore, source_ids: dict[tuple[str, str], str]) -> str:
+    """The `S1 p.3` tag of `node`, giving its source the next id if it has none."""
+    source = _source_of(node.metadata or {})
+    if source not in source_ids:
+        source_ids[source] = f"S{len(source_ids) + 1}"
+    tag = source_ids[source]
+    page = (node.metadata or {}).get("page_number")
+    if page and not str(page).startswith("Not given"):
+        tag += f" p.{page}"
+    return tag
+
+
+def nodes_to_observation(nodes: list[NodeWithScore | str]) -> str:
+    """
+    Render retrieved nodes as a compact, token-efficient observation.
+
+    Each chunk is prefixed with a short source id and its page numbers,
+    e.g. `[S1 p.3]`. The file name and URL of every source are listed once
+    in a table at the end. Scores and the other metadata are dropped.
+    Strings in `nodes` (e.g. back-references) are kept as-is. While an
+    internal memory is bound, source ids stay the same for the whole turn.
+
+    Args:
+        nodes (list[NodeWithScore | str]): The nodes to render.
+
+    Returns:
+        str: The observation text.
+    """
+    source_ids = _source_ids()
+    shown = {}
+    lines = []
+    for node in nodes:
+        if isinstance(node, str):
+            lines.append(node)
+            continue
+        lines.append(f"[{_source_tag(node, source_ids)}] {node.text.strip()}")
+        source = _source_of(node.metadata or {})
+        shown[source] = source_ids[source]
+
+    if not lines:
+        return "No documents found."
+
+    if shown:
+        lines.append("Sources:")
+        for (name, url), source_id in shown.items():
+            lines.append(f"{source_id}: {name} {url}".rstrip())
+    return "\n".join(lines)
+
+
 def nodes_to_dicts(nodes: list[NodeWithScore]) -> list:
     """
     Convert nodes to a list of dictionaries.
@@ -101,3 +329,114 @@ def nodes_to_dicts(nodes: list[NodeWithScore]) -> list:
         if isinstance(node, str):
             result.append(node)
     return result
+
+
+# Per-turn memory shared by all retrieval tools, see `Agent.internal_memory`.
+# The executor binds it around each tool call with `use_internal_memory()`.
+_internal_memory: ContextVar[dict | None] = ContextVar(
+    "chatdku_internal_memory", default=None
+)
+
+
+@contextmanager
+def use_internal_memory(memory: dict | None):
+    """
+    Make `memory` visible to the retrieval tools called inside the context.
+
+    Args:
+        memory (dict | None): The agent's internal memory for the current
+            user message. `None` disables deduplication.
+    """
+    token = _internal_memory.set(memory)
+    try:
+        yield memory
+    finally:
+        _internal_memory.reset(token)
+
+
+def get_internal_memory() -> dict | None:
+    """Return the internal memory bound by `use_internal_memory()`, if any."""
+    return _internal_memory.get()
+
+
+def content_hash(text: str) -> str:
+    """Hash of the whitespace-normalized text, used to spot the same chunk under different ids."""
+    normalized = " ".join(text.split()).lower()
+    return hashlib.sha1(normalized.encode("utf-8")).hexdigest()
+
+
+def _count_tokens(text: str) -> int:
+    try:
+        return len(Settings.tokenizer(text))
+    except Exception:
+        # Rough fallback when no tokenizer is configured.
+        return len(text) // 4
+
+
+def split_seen_nodes(
+    nodes: list[NodeWithScore],
+) -> tuple[list[NodeWithScore], list[str]]:
+    """
+    Separate nodes already shown to the LLM in this turn from the new ones.
+
+    A node counts as seen when its id or its content hash is in the internal
+    memory. Seen nodes are replaced by a back-reference to the source tag they
+    were shown with, e.g. `[Already retrieved: S1 p.3]`, and the tokens they
+    would have added to the trajectory are added to `memory["saved_tokens"]`.
+    Repeats within `nodes` are dropped. Does nothing when no memory is bound.
+
+    Args:
+        nodes (list[NodeWithScore]): The retrieved nodes.
+
+    Returns:
+        tuple(fresh_nodes, back_references)
+    """
+    memory = get_internal_memory()
+    if memory is None:
+        return nodes, []
+
+    ids = memory.setdefault("ids", set())
+    hashes = memory.setdefault("hashes", {})
+    tags = memory.setdefault("tags", {})
+
+    fresh = []
+    back_refs = []
+    fresh_hashes = set()
+    duplicates = 0
+    for node in nodes:
+        if not isinstance(node, NodeWithScore):
+            fresh.append(node)
+            continue
+        digest = content_hash(node.text)
+        if node.node_id in ids or digest in hashes or digest in fresh_hashes:
+            seen_id = node.node_id if node.node_id in ids else hashes.get(digest)
+            ref = f"[Already retrieved: {tags[seen_id]}]" if seen_id in tags else None
+            if ref is not None and ref not in back_refs:
+                back_refs.append(ref)
+            duplicates += 1
+            memory["saved_tokens"] = memory.get("saved_tokens", 0) + _count_tokens(
+                node.text
+            )
+            continue
+        fresh_hashes.add(digest)
+        fresh.append(node)
+
+    memory["duplicates"] = memory.get("duplicates", 0) + duplicates
+    return fresh, back_refs
+
+
+def mark_seen_nodes(nodes: list[NodeWithScore]) -> None:
+    """Record the nodes returned to the LLM in the internal memory, if one is bound."""
+    memory = get_internal_memory()
+    if memory is None:
+        return
+
+    ids = memory.setdefault("ids", set())
+    hashes = memory.setdefault("hashes", {})
+    tags = memory.setdefault("tags", {})
+    source_ids = _source_ids()
+    for node in nodes:
+        if isinstance(node, NodeWithScore):
+            ids.add(node.node_id)
+            hashes.setdefault(content_hash(node.text), node.node_id)
+            tags.setdefault(node.node_id, _source_tag(node, source_ids))
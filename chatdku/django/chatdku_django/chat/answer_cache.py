@@ -0,0 +1,178 @@
+"""
+Semantic answer cache.
+
+Many users ask the same few questions, and each of them ran the Planner,
+Executor and Synthesizer from scratch. With `ANSWER_CACHE_ENABLED`, the
+answer to a first turn over the public corpus is stored with the embedding
+of the question, and a later question whose embedding has a cosine
+similarity of at least `ANSWER_CACHE_THRESHOLD` gets the stored answer,
+citations included, streamed back instead.
+
+Entries are appended to a Redis list per corpus version and chat mode. Each
+process keeps the vectors of the current lists in a numpy matrix and only
+reads the entries added since its last lookup. Ingestion bumps the corpus
+version (see `chatdku.ingestion.corpus_version`), after which the old lists
+are no longer read and expire after `ANSWER_CACHE_TTL`.
+"""
+
+import base64
+import json
+import logging
+import threading
+from typing import NamedTuple, Optional
+
+import numpy as np
+import requests
+from django.conf import settings
+from prometheus_client import Counter
+
+from chatdku.config import config
+from chatdku.core.tools.query_embedding_cache import get_query_embedding_cache
+from chatdku.ingestion.corpus_version import get_corpus_version
+from chatdku_django.celery import redis_client
+
+logger = logging.getLogger(__name__)
+
+KEY_PREFIX = "answer_cache"
+
+LOOKUPS = Counter(
+    "chatdku_answer_cache_lookups",
+    "Answer cache lookups by result",
+    ["result"],
+)
+SAVED_SECONDS = Counter(
+    "chatdku_answer_cache_saved_seconds",
+    "Generation time of the cached answers that were served",
+)
+
+
+class Lookup(NamedTuple):
+    key: str
+    embedding: np.ndarray
+    # Set on a hit
+    answer: Optional[str] = None
+    seconds: float = 0.0
+    similarity: float = 0.0
+
+
+class _Index:
+    def __init__(self):
+        self.loaded = 0
+        self.vectors = None
+        self.entries = []
+
+    def extend(self, items):
+        entries = [json.loads(item) for item in items]
+        vectors = np.stack(
+            [
+                np.frombuffer(base64.b64decode(e.pop("embedding")), dtype=np.float32)
+                for e in entries
+            ]
+        )
+        self.vectors = (
+            vectors if self.vectors is None else np.vstack([self.vectors, vectors])
+        )
+        self.entries.extend(entries)
+        self.loaded += len(entries)
+
+
+def replay(answer: str, chunk_size: int = 64):
+    """Stream a cached answer the way the Synthesizer streams a new one."""
+    for start in range(0, len(answer), chunk_size):
+        yield answer[start : start + chunk_size]
+
+
+def _tei_embed(question: str) -> list[float]:
+    response = requests.post(
+        f"{config.tei_url}/{config.embedding}/embed",
+        json={"inputs": [question]},
+        timeout=5,
+    )
+    response.raise_for_status()
+    return response.json()[0]
+
+
+def embed(question: str) -> np.ndarray:
+    # Shared with the retrievers, which often search with the question itself
+    vector = np.asarray(
+        get_query_embedding_cache().embed(question, _tei_embed), dtype=np.float32
+    )
+    return vector / np.linalg.norm(vector)
+
+
+class AnswerCache:
+    def __init__(self, redis, threshold, ttl, max_entries):
+        self.redis = redis
+        self.threshold = threshold
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._indexes = {}
+        self._lock = threading.Lock()
+
+    def _index(self, key):
+        """Local index of `key`, with the entries other processes added."""
+        pipe = self.redis.pipeline(transaction=False)
+        with self._lock:
+            index = self._indexes.get(key)
+            if index is None:
+                # Indexes of older corpus versions are never read again
+                version_prefix = key.rsplit(":", 1)[0] + ":"
+                self._indexes = {
+                    k: v
+                    for k, v in self._indexes.items()
+                    if k.startswith(version_prefix)
+                }
+                index = self._indexes[key] = _Index()
+            pipe.llen(key)
+            pipe.lrange(key, index.loaded, -1)
+            length, items = pipe.execute()
+            if length < index.loaded:
+                # The list expired and was started again
+                index = self._indexes[key] = _Index()
+                items = self.redis.lrange(key, 0, -1)
+            if items:
+                index.extend(items)
+            return index
+
+    def lookup(self, question: str, mode: str) -> Lookup:
+        key = f"{KEY_PREFIX}:{get_corpus_version(self.redis)}:{mode}"
+        embedding = embed(question)
+        index = self._index(key)
+        if index.vectors is not None:
+            similarities = index.vectors @ embedding
+            best = int(np.argmax(similarities))
+            if similarities[best] >= self.threshold:
+                entry = index.entries[best]
+                return Lookup(
+                    key,
+                    embedding,
+                    answer=entry["answer"],
+                    seconds=entry["seconds"],
+                    similarity=float(similarities[best]),
+                )
+        return Lookup(key, embedding)
+
+    def store(self, lookup: Lookup, question: str, answer: str, seconds: float):
+        """Add the answer generated after the missed `lookup`."""
+        if self.redis.llen(lookup.key) >= self.max_entries:
+            return
+        entry = {
+            "question": question,
+            "answer": answer,
+            "seconds": seconds,
+            "embedding": base64.b64encode(
+                lookup.embedding.astype(np.float32).tobytes()
+            ).decode(),
+        }
+        pipe = self.redis.pipeline(transaction=False)
+        pipe.rpush(lookup.key, json.dumps(entry))
+        pipe.expire(lookup.key, self.ttl)
+        pipe.execute()
+
+
+answer_cache = AnswerCache(
+    redis_client,
+    threshold=getattr(settings, "ANSWER_CACHE_THRESHOLD", 0.95),
+    ttl=getattr(settings, "ANSWER_CACHE_TTL", 60 * 60 * 24),
+    max_entries=getattr(settings, "ANSWER_CACHE_MAX_ENTRIES", 5000),
+)
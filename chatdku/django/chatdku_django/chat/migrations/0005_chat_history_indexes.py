@@ -0,0 +1,25 @@
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("chat", "0004_alter_usersession_user"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="usersession",
+            index=models.Index(
+                fields=["user", "created_at"], name="chat_session_user_created_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="chatmessages",
+            index=models.Index(
+                fields=["session", "created_at"], name="chat_msg_session_created_idx"
+            ),
+        ),
+    ]
@@ -25,6 +25,13 @@ class UserSession(ExportModelOperationsMixin("usersession"), models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     title = models.CharField(max_length=100, null=False)
 
+    class Meta:
+        indexes = [
+            models.Index(
+                fields=["user", "created_at"], name="chat_session_user_created_idx"
+            ),
+        ]
+
     def __str__(self):
         return f"Session {self.id} - {self.title}"
 
@@ -40,7 +47,15 @@ class ChatMessages(ExportModelOperationsMixin("chat"), models.Model):
     )
     role = models.CharField(max_length=20, choices=ROLE_CHOICES)
     message = models.TextField()
-    created_at = models.DateTimeField(auto_now_add=True)
+    # Set when the message is queued, see chat.write_behind
+    created_at = models.DateTimeField(default=timezone.now, editable=False)
+
+    class Meta:
+        indexes = [
+            models.Index(
+                fields=["session", "created_at"], name="chat_msg_session_created_idx"
+            ),
+        ]
 
 class WeeklyEvent(models.Model):
     title = models.CharField(max_length=500)
@@ -0,0 +1,41 @@
+from rest_framework.pagination import CursorPagination
+
+
+class OptInCursorPagination(CursorPagination):
+    """
+    Cursor pagination for clients that ask for it by sending `cursor` or
+    `page_size`. They get `{"next", "previous", "results"}`, where `next`
+    and `previous` are the URLs of the adjacent pages. Other requests get the
+    whole list, as before pagination was added.
+    """
+
+    def paginate_queryset(self, queryset, request, view=None):
+        params = request.query_params
+        if (
+            self.cursor_query_param not in params
+            and self.page_size_query_param not in params
+        ):
+            return None
+        return super().paginate_queryset(queryset, request, view)
+
+
+class SessionCursorPagination(OptInCursorPagination):
+    """
+    Keyset pagination over a user's sessions, newest first. Pages are read
+    with `WHERE created_at < cursor` on the (user, created_at) index, so the
+    cost does not grow with the length of the history.
+    """
+
+    ordering = "-created_at"
+    page_size = 20
+    page_size_query_param = "page_size"
+    max_page_size = 100
+
+
+class MessageCursorPagination(OptInCursorPagination):
+    """Keyset pagination over the messages of a session, oldest first."""
+
+    ordering = "created_at"
+    page_size = 50
+    page_size_query_param = "page_size"
+    max_page_size = 200
@@ -10,6 +10,7 @@ from chat.mail import EmailUtil
 import os
 from django.core.cache import cache
 from chat.models import UserSession
+from chat.write_behind import flush_all, recover_stale_batches
 from django.contrib.auth import get_user_model
 
 from django.db.models import Q
@@ -223,3 +224,16 @@ def lm_test(self):
                 logger.info(f"Email sent on: {datetime.datetime.now()}")
             raise e
         raise self.retry(exc=e, countdown=5)
+
+
+@shared_task
+def flush_chat_messages():
+    """
+    Safety net for the write-behind buffer: writes messages left on the queue
+    and batches of web workers that died while writing them.
+    """
+    recovered = recover_stale_batches()
+    if recovered:
+        logger.warning(f"Recovered {recovered} unwritten chat messages")
+    written = flush_all()
+    return f"Flushed {written} chat messages"
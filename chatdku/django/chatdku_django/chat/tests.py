@@ -1,3 +1,344 @@
-from django.test import TestCase
+import zlib
+from unittest import mock
 
-# Create your tests here.
+import fakeredis
+import numpy as np
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+
+from chat import answer_cache, weekly_events, write_behind
+from chat.models import ChatMessages, UserSession
+from chat.utils import load_conversation
+from chatdku.ingestion.corpus_version import CORPUS_VERSION_KEY
+
+User = get_user_model()
+
+LOCMEM_CACHES = {
+    "default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}
+}
+# The rate limiter needs a real Redis connection
+MIDDLEWARE = [m for m in settings.MIDDLEWARE if "RateLimit" not in m]
+
+
+@override_settings(CACHES=LOCMEM_CACHES, MIDDLEWARE=MIDDLEWARE)
+class ChatHistoryTests(TestCase):
+    def setUp(self):
+        # Log the test client in through NetIDMiddleware
+        self.client.get("/user/health", HTTP_UID="ab123")
+        self.user = User.get_by_netid("ab123")
+        patches = [
+            mock.patch.object(write_behind, "redis_client", fakeredis.FakeRedis()),
+            mock.patch.object(write_behind._flusher, "wake"),
+        ]
+        for patch in patches:
+            patch.start()
+            self.addCleanup(patch.stop)
+
+    def make_sessions(self, n, messages=0):
+        sessions = [
+            UserSession.objects.create(user=self.user, title=f"s{i}") for i in range(n)
+        ]
+        for session in sessions:
+            ChatMessages.objects.bulk_create(
+                ChatMessages(session=session, role="user", message=f"m{i}")
+                for i in range(messages)
+            )
+        return sessions
+
+    def get(self, url, **params):
+        return self.client.get(url, params, HTTP_UID="ab123")
+
+    def test_session_pages_do_not_grow_with_history(self):
+        self.make_sessions(45)
+        # Session, request.user and one keyset page
+        with self.assertNumQueries(3):
+            first = self.get("/api/c/", page_size=20).json()
+        with self.assertNumQueries(3):
+            second = self.client.get(first["next"], HTTP_UID="ab123").json()
+
+        self.assertEqual(len(first["results"]), 20)
+        self.assertEqual(len(second["results"]), 20)
+        ids = [s["id"] for s in first["results"] + second["results"]]
+        self.assertEqual(len(set(ids)), 40)
+
+    def test_messages_are_paginated(self):
+        (session,) = self.make_sessions(1, messages=60)
+
+        # Session, request.user, the session and one page of messages
+        with self.assertNumQueries(4):
+            page = self.get(f"/api/c/{session.id}/messages/", page_size=50).json()
+
+        self.assertEqual(len(page["results"]), 50)
+        self.assertIsNotNone(page["next"])
+        rest = self.client.get(page["next"], HTTP_UID="ab123").json()
+        self.assertEqual(len(rest["results"]), 10)
+
+    def test_lists_are_not_paginated_unless_asked(self):
+        (session,) = self.make_sessions(25, messages=60)[:1]
+
+        sessions = self.get("/api/c/").json()
+        messages = self.get(f"/api/c/{session.id}/messages/").json()
+
+        self.assertEqual(len(sessions), 25)
+        self.assertEqual(len(messages), 60)
+
+    def test_load_conversation_is_one_query(self):
+        (session,) = self.make_sessions(1, messages=15)
+
+        with self.assertNumQueries(1):
+            conversation = load_conversation(self.user, session.id)
+
+        self.assertEqual(len(conversation), 10)
+
+    def test_queued_messages_are_read(self):
+        (session,) = self.make_sessions(1, messages=1)
+        write_behind.enqueue_message(session.id, ChatMessages.USER, "q")
+        write_behind.enqueue_message(session.id, ChatMessages.BOT, "a")
+
+        expected = [("user", "m0"), ("user", "q"), ("bot", "a")]
+        self.assertEqual(load_conversation(self.user, session.id), expected)
+        messages = self.get(f"/api/c/{session.id}/messages/").json()
+        self.assertEqual([m["message"] for m in messages], ["m0", "q", "a"])
+        page = self.get(f"/api/c/{session.id}/messages/", page_size=10).json()
+        self.assertEqual([m["message"] for m in page["results"]], ["m0", "q", "a"])
+
+        write_behind.flush_all()
+        self.assertEqual(load_conversation(self.user, session.id), expected)
+
+    def test_message_written_while_read_is_returned_once(self):
+        (session,) = self.make_sessions(1)
+        write_behind.enqueue_message(session.id, ChatMessages.USER, "q")
+        # Committed, but not yet removed from the session's queued messages
+        (message,) = write_behind.pending_messages(session.id)
+        message.save()
+
+        self.assertEqual(load_conversation(self.user, session.id), [("user", "q")])
+
+
+class WriteBehindTests(TestCase):
+    def setUp(self):
+        self.redis = fakeredis.FakeRedis()
+        patches = [
+            mock.patch.object(write_behind, "redis_client", self.redis),
+            mock.patch.object(write_behind._flusher, "wake"),
+        ]
+        for patch in patches:
+            patch.start()
+            self.addCleanup(patch.stop)
+        user, _ = User.objects.get_or_create_by_netid("ab123")
+        self.session = UserSession.objects.create(user=user, title="s")
+
+    def test_flush_writes_queued_messages_in_order(self):
+        write_behind.enqueue_message(self.session.id, ChatMessages.USER, "q")
+        write_behind.enqueue_message(self.session.id, ChatMessages.BOT, "a")
+        self.assertFalse(ChatMessages.objects.exists())
+
+        # Deleted-session check and one INSERT
+        with self.assertNumQueries(2):
+            self.assertEqual(write_behind.flush_all(), 2)
+
+        self.assertEqual(
+            list(self.session.messages.order_by("created_at").values_list("message")),
+            [("q",), ("a",)],
+        )
+        # Nothing left on the queue, in a batch or in the session's list
+        self.assertEqual(self.redis.dbsize(), 0)
+
+    def test_failed_insert_is_requeued(self):
+        write_behind.enqueue_message(self.session.id, ChatMessages.BOT, "a")
+
+        with mock.patch.object(
+            ChatMessages.objects, "bulk_create", side_effect=RuntimeError
+        ):
+            with self.assertRaises(RuntimeError):
+                write_behind.flush()
+
+        self.assertEqual(self.redis.llen(write_behind.QUEUE_KEY), 1)
+        self.assertEqual(write_behind.flush_all(), 1)
+        self.assertEqual(self.session.messages.count(), 1)
+
+    def test_stale_batches_are_recovered(self):
+        write_behind.enqueue_message(self.session.id, ChatMessages.BOT, "a")
+        stale = f"{write_behind.BATCH_PREFIX}0:dead"
+        self.redis.lmove(write_behind.QUEUE_KEY, stale, "LEFT", "RIGHT")
+
+        self.assertEqual(write_behind.recover_stale_batches(), 1)
+        self.assertEqual(write_behind.flush_all(), 1)
+        self.assertEqual(self.session.messages.count(), 1)
+
+
+@override_settings(CACHES=LOCMEM_CACHES, MIDDLEWARE=MIDDLEWARE)
+class WeeklyEventsTests(TestCase):
+    EVENTS = [{"title": "Talk", "date": "2025-09-01", "start_time": "10:00:00"}]
+
+    def setUp(self):
+        cache.clear()
+        self.version = {}
+        redis = mock.Mock()
+        redis.get.side_effect = lambda key: self.version.get(key)
+        self.query = mock.Mock(return_value=self.EVENTS)
+        patches = [
+            mock.patch.object(weekly_events, "redis_client", redis),
+            mock.patch.object(weekly_events, "query_events", self.query),
+        ]
+        for patch in patches:
+            patch.start()
+            self.addCleanup(patch.stop)
+
+    def get(self, **headers):
+        return self.client.get(
+            "/api/events",
+            {"start_date": "2025-09-01", "end_date": "2025-09-07"},
+            HTTP_UID="ab123",
+            **headers,
+        )
+
+    def test_events_are_cached_per_version(self):
+        first = self.get()
+        second = self.get()
+
+        self.assertEqual(first.json(), {"events": self.EVENTS})
+        self.assertEqual(second.json(), first.json())
+        self.assertEqual(self.query.call_count, 1)
+
+        # What the ingestion script does after inserting the new week
+        self.version[weekly_events.EVENTS_VERSION_KEY] = b"1"
+        self.get()
+        self.assertEqual(self.query.call_count, 2)
+
+    def test_matching_etag_gets_304(self):
+        etag = self.get()["ETag"]
+
+        response = self.get(HTTP_IF_NONE_MATCH=f'"other", W/{etag}')
+
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response["ETag"], etag)
+        self.assertEqual(response.content, b"")
+
+    def test_changed_events_get_new_etag(self):
+        etag = self.get()["ETag"]
+        self.query.return_value = []
+        self.version[weekly_events.EVENTS_VERSION_KEY] = b"1"
+
+        response = self.get(HTTP_IF_NONE_MATCH=etag)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response["ETag"], etag)
+        self.assertEqual(response.json(), {"events": []})
+
+
+def fake_embed(question):
+    # Questions starting with the same word are near duplicates
+    vector = np.zeros(64, dtype=np.float32)
+    vector[zlib.crc32(question.split()[0].encode()) % 64] = 1.0
+    vector[zlib.crc32(question.encode()) % 64] += 0.1
+    return vector / np.linalg.norm(vector)
+
+
+class AnswerCacheTests(TestCase):
+    def setUp(self):
+        self.redis = fakeredis.FakeRedis()
+        patch = mock.patch.object(answer_cache, "embed", fake_embed)
+        patch.start()
+        self.addCleanup(patch.stop)
+        self.cache = self.make_cache()
+
+    def make_cache(self):
+        return answer_cache.AnswerCache(
+            self.redis, threshold=0.9, ttl=60, max_entries=10
+        )
+
+    def test_similar_question_hits(self):
+        miss = self.cache.lookup("graduation requirements?", "default")
+        self.assertIsNone(miss.answer)
+        self.cache.store(miss, "graduation requirements?", "34 courses [1]", 12.0)
+
+        hit = self.cache.lookup("graduation requirements for me?", "default")
+        self.assertEqual(hit.answer, "34 courses [1]")
+        self.assertEqual(hit.seconds, 12.0)
+        self.assertIsNone(self.cache.lookup("cr/nc rules?", "default").answer)
+        self.assertIsNone(self.cache.lookup("graduation requirements?", "agent").answer)
+
+    def test_entries_of_other_processes_are_read(self):
+        other = self.make_cache()
+        self.assertIsNone(self.cache.lookup("cr/nc rules?", "default").answer)
+
+        other.store(
+            other.lookup("cr/nc rules?", "default"), "cr/nc rules?", "Use the form", 3
+        )
+
+        self.assertEqual(
+            self.cache.lookup("cr/nc rules?", "default").answer, "Use the form"
+        )
+
+    def test_corpus_version_bump_invalidates(self):
+        miss = self.cache.lookup("cr/nc rules?", "default")
+        self.cache.store(miss, "cr/nc rules?", "Use the form", 3)
+
+        self.redis.incr(CORPUS_VERSION_KEY)
+
+        self.assertIsNone(self.cache.lookup("cr/nc rules?", "default").answer)
+
+
+@override_settings(
+    CACHES=LOCMEM_CACHES, MIDDLEWARE=MIDDLEWARE, ANSWER_CACHE_ENABLED=True
+)
+class ChatViewAnswerCacheTests(TestCase):
+    def setUp(self):
+        self.redis = fakeredis.FakeRedis()
+        self.agent = mock.Mock()
+        self.agent.return_value.return_value.response = iter(["34 ", "courses"])
+        patches = [
+            mock.patch.object(answer_cache, "embed", fake_embed),
+            mock.patch(
+                "chat.views.answer_cache",
+                answer_cache.AnswerCache(
+                    self.redis, threshold=0.9, ttl=60, max_entries=10
+                ),
+            ),
+            mock.patch("chat.views.get_tools"),
+            mock.patch("chat.views.Agent", self.agent),
+            mock.patch.object(write_behind, "redis_client", self.redis),
+            mock.patch.object(write_behind._flusher, "wake"),
+        ]
+        for patch in patches:
+            patch.start()
+            self.addCleanup(patch.stop)
+
+        self.client.get("/user/health", HTTP_UID="ab123")
+        self.session = UserSession.objects.create(
+            user=User.get_by_netid("ab123"), title="s"
+        )
+
+    def ask(self, question):
+        response = self.client.post(
+            "/api/chat",
+            {
+                "messages": [{"content": question}],
+                "chatHistoryId": str(self.session.id),
+                "mode": "default",
+            },
+            content_type="application/json",
+            HTTP_UID="ab123",
+        )
+        return b"".join(response.streaming_content).decode()
+
+    def test_second_asker_gets_cached_answer(self):
+        self.assertEqual(self.ask("graduation requirements?"), "34 courses")
+        self.assertEqual(self.agent.call_count, 1)
+
+        self.session = UserSession.objects.create(
+            user=User.get_by_netid("ab123"), title="t"
+        )
+        self.assertEqual(self.ask("graduation requirements please?"), "34 courses")
+        self.assertEqual(self.agent.call_count, 1)
+
+    def test_follow_up_turns_are_not_cached(self):
+        # The first turn is still queued
+        self.ask("graduation requirements?")
+
+        self.agent.return_value.return_value.response = iter(["more"])
+        self.assertEqual(self.ask("graduation requirements?"), "more")
+        self.assertEqual(self.agent.call_count, 2)
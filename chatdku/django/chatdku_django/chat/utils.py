@@ -2,12 +2,12 @@ import pandas as pd
 from django.utils.text import slugify
 from django.utils import timezone
 from django.conf import settings
-from chat.models import Feedback
+from chat.models import ChatMessages, Feedback
+from chat.write_behind import with_pending
 from chatdku.config import config
 import dspy
 
 
-from django.db.models import Q
 from chatdku.config import config
 from openai import OpenAI
 
@@ -164,12 +164,16 @@ def ping_lm(message: str):
 
 
 def load_conversation(user, session_id):
-    objects = user.usersession
-    sessions = objects.filter(Q(id=session_id)).first()
-    messages = sessions.messages.order_by("-created_at")[1:11]
-    return_message = list(messages.values_list("role", "message"))
-    return_message = return_message[::-1]
-    return return_message
+    # One query on the (session, created_at) index, plus the messages still
+    # queued by chat.write_behind. Called before the new user message is
+    # queued, see ChatView.
+    messages = (
+        ChatMessages.objects.filter(session_id=session_id, session__user=user)
+        .only("role", "message", "created_at")
+        .order_by("-created_at")[:10]
+    )
+    messages = with_pending(list(messages), session_id)[-10:]
+    return [(m.role, m.message) for m in messages]
 
 
 # NOTE: This function is not being used
@@ -1,7 +1,10 @@
 import asyncio
 import logging
+import time
 
+from chat.answer_cache import LOOKUPS, SAVED_SECONDS, answer_cache, replay
 from chat.models import ChatMessages, UserSession
+from chat.pagination import MessageCursorPagination, SessionCursorPagination
 from chat.serializer import (
     ChatMessageSerializer,
     FeedbackSerializer,
@@ -10,7 +13,10 @@ from chat.serializer import (
     SourceSerializer,
 )
 from chat.utils import load_conversation, title_gen
+from chat.weekly_events import etag_matches, get_weekly_events
+from chat.write_behind import STREAM_CLOSE_SECONDS, enqueue_message, with_pending
 from chatdku_django.celery import redis_client
+from django.conf import settings
 from django.contrib.auth import get_user_model
 from django.db.models import Q
 from django.http import StreamingHttpResponse
@@ -33,7 +39,6 @@ from chatdku.core.agent import Agent
 from chat.tools import get_tools
 
 from datetime import datetime
-from .models import WeeklyEvent
 
 logger = logging.getLogger(__name__)
 
@@ -148,7 +153,11 @@ class ChatView(APIView):
                 data={"role": ChatMessages.USER, "message": message_content}
             )
             chat_serializer.is_valid(raise_exception=True)
-            chat_serializer.save(session=session)
+
+            # Read before the new message is queued, so it is not part of
+            # the previous conversation
+            conversation = load_conversation(request.user, chatHistoryId)
+            enqueue_message(session.id, ChatMessages.USER, message_content)
             if not session.title:
 
                 try:
@@ -159,11 +168,45 @@ class ChatView(APIView):
                 except Exception as e:  # Fallback incase error
                     logger.error(f"Error in title Generation: {e}")
                     title = message_content
-            # Create a new Agent instance per request
-
-            conversation = load_conversation(request.user, chatHistoryId)
-            if test:
-                with suppress_tracing():
+            started = time.perf_counter()
+            # Only a first turn over the public corpus has the same answer
+            # for everyone
+            lookup = None
+            if (
+                getattr(settings, "ANSWER_CACHE_ENABLED", False)
+                and search_mode == 0
+                and not conversation
+                and not test
+            ):
+                try:
+                    lookup = answer_cache.lookup(message_content, mode)
+                except Exception as e:
+                    logger.error(f"Answer cache lookup failed: {e}")
+
+            if lookup is not None and lookup.answer is not None:
+                LOOKUPS.labels("hit").inc()
+                SAVED_SECONDS.inc(
+                    max(lookup.seconds - (time.perf_counter() - started), 0)
+                )
+                stream = replay(lookup.answer)
+            else:
+                if lookup is not None:
+                    LOOKUPS.labels("miss").inc()
+                # Create a new Agent instance per request
+                if test:
+                    with suppress_tracing():
+                        agent = Agent(
+                            max_iterations=max_iteration,
+                            streaming=True,
+                            get_intermediate=False,
+                            previous_conversation=conversation,
+                            tools=tools,
+                        )
+                        responses_gen = agent(
+                            current_user_message=message_content,
+                            question_id=chatHistoryId,
+                        )
+                else:
                     agent = Agent(
                         max_iterations=max_iteration,
                         streaming=True,
@@ -175,38 +218,37 @@ class ChatView(APIView):
                         current_user_message=message_content,
                         question_id=chatHistoryId,
                     )
-            else:
-                agent = Agent(
-                    max_iterations=max_iteration,
-                    streaming=True,
-                    get_intermediate=False,
-                    previous_conversation=conversation,
-                    tools=tools,
-                )
-                responses_gen = agent(
-                    current_user_message=message_content,
-                    question_id=chatHistoryId,
-                )
+                stream = responses_gen.response
             if not session.title:
                 UserSession.objects.filter(id=session.id, title="").update(title=title)
 
             def generate():
-                response_text = ""
+                chunks = []
+                completed = False
 
                 try:
 
-                    for response in responses_gen.response:
-                        response_text += response
+                    for response in stream:
+                        chunks.append(response)
                         yield response
+                    completed = True
 
                 finally:
-                    if response_text:
-
-                        bot_serializer = ChatMessageSerializer(
-                            data={"role": ChatMessages.BOT, "message": response_text}
-                        )
-                        bot_serializer.is_valid(raise_exception=True)
-                        bot_serializer.save(session=session)
+                    if chunks:
+                        answer = "".join(chunks)
+                        with STREAM_CLOSE_SECONDS.time():
+                            enqueue_message(session.id, ChatMessages.BOT, answer)
+                    # Partial answers of aborted streams are not cached
+                    if completed and chunks and lookup and lookup.answer is None:
+                        try:
+                            answer_cache.store(
+                                lookup,
+                                message_content,
+                                answer,
+                                time.perf_counter() - started,
+                            )
+                        except Exception as e:
+                            logger.error(f"Answer cache store failed: {e}")
 
             return StreamingHttpResponse(generate(), content_type="text/plain")
 
@@ -285,14 +327,22 @@ class FeedbackView(APIView):
 )
 class SessionViewSet(viewsets.ModelViewSet):
     serializer_class = SessionSerializer
+    pagination_class = SessionCursorPagination
 
     http_method_names = ["get", "head", "options", "post", "delete", "patch"]
 
-    @extend_schema(description="All the session_id for a user", parameters=PARAMETERS)
+    @extend_schema(
+        description=(
+            "All the session_id for a user, newest first. With `page_size` or "
+            "`cursor`, one page as {next, previous, results}."
+        ),
+        parameters=PARAMETERS,
+    )
     def get_queryset(self):
         return (
             UserSession.objects.filter(Q(user=self.request.user))
             .exclude(Q(title="") | Q(title__isnull=True))
+            .only("id", "title", "created_at")
             .order_by("-created_at")
         )
 
@@ -310,7 +360,10 @@ class SessionViewSet(viewsets.ModelViewSet):
         raise MethodNotAllowed("Cannot Create a Session!")
 
     @extend_schema(
-        description="Messages from a session_id",
+        description=(
+            "Messages from a session_id, oldest first. With `page_size` or "
+            "`cursor`, one page as {next, previous, results}."
+        ),
         parameters=PARAMETERS,
         responses={
             200: OpenApiResponse(
@@ -331,9 +384,19 @@ class SessionViewSet(viewsets.ModelViewSet):
     @action(methods=["GET"], detail=True)
     def messages(self, request, pk=None):
         session = self.get_object()
-        msgs = session.messages.all()
-        serializer = ChatMessageSerializer(msgs, many=True)
-        return Response(serializer.data)
+        msgs = ChatMessages.objects.filter(session_id=session.id).only(
+            "id", "role", "message", "created_at"
+        )
+        paginator = MessageCursorPagination()
+        page = paginator.paginate_queryset(msgs, request, view=self)
+        if page is None:
+            messages = with_pending(list(msgs.order_by("created_at")), session.id)
+            return Response(ChatMessageSerializer(messages, many=True).data)
+        if not paginator.has_next:
+            # The newest messages may not be written yet
+            page = with_pending(page, session.id)
+        serializer = ChatMessageSerializer(page, many=True)
+        return paginator.get_paginated_response(serializer.data)
 
     @extend_schema(
         description="Rename a chat session (ensure trailing slash in URL; without it Django may resolve to GET)",
@@ -408,25 +471,10 @@ class WeeklyEventsView(APIView):
                 {"error": "Invalid date format, use YYYY-MM-DD"}, status=400
             )
 
-        events = (
-            WeeklyEvent.objects.using("ingestion")
-            .filter(event_date__range=(start, end))
-            .order_by("event_date", "start_time")
-        )
-        data = [
-            {
-                "title": e.title,
-                "date": e.event_date.isoformat(),
-                "start_time": (
-                    e.start_time.strftime("%H:%M:%S") if e.start_time else None
-                ),
-                "end_time": e.end_time.strftime("%H:%M:%S") if e.end_time else None,
-                "location": e.location,
-                "sponsor": e.sponsor,
-                "open_to": e.open_to,
-                "speaker": e.speaker,
-                "url": e.url,
-            }
-            for e in events
-        ]
-        return Response({"events": data})
+        payload, etag = get_weekly_events(start, end)
+        # Browsers revalidate on every page load and get a 304 until the
+        # event ingestion bumps the version.
+        headers = {"ETag": etag, "Cache-Control": "private, no-cache"}
+        if etag_matches(request.headers.get("If-None-Match"), etag):
+            return Response(status=304, headers=headers)
+        return Response(payload, headers=headers)
@@ -0,0 +1,86 @@
+"""
+Cached weekly events.
+
+`weekly_events` only changes when `insert_events_to_weekly_table.py` runs,
+which bumps `EVENTS_VERSION_KEY` in Redis afterwards. Responses are cached
+per date range under the current version, so a new version makes every old
+entry unreachable and they expire on their own.
+"""
+
+import hashlib
+import json
+
+from django.core.cache import cache
+
+from chat.models import WeeklyEvent
+from chatdku_django.celery import redis_client
+
+# Raw Redis key, shared with chatdku/ingestion/insert_events_to_weekly_table.py
+EVENTS_VERSION_KEY = "weekly_events:version"
+CACHE_TIMEOUT = 60 * 60 * 24
+
+FIELDS = (
+    "title",
+    "event_date",
+    "start_time",
+    "end_time",
+    "location",
+    "sponsor",
+    "open_to",
+    "speaker",
+    "url",
+)
+
+
+def _time(value):
+    return value.strftime("%H:%M:%S") if value else None
+
+
+def query_events(start, end):
+    rows = (
+        WeeklyEvent.objects.using("ingestion")
+        .filter(event_date__range=(start, end))
+        .order_by("event_date", "start_time")
+        .values(*FIELDS)
+    )
+    return [
+        {
+            "title": row["title"],
+            "date": row["event_date"].isoformat(),
+            "start_time": _time(row["start_time"]),
+            "end_time": _time(row["end_time"]),
+            "location": row["location"],
+            "sponsor": row["sponsor"],
+            "open_to": row["open_to"],
+            "speaker": row["speaker"],
+            "url": row["url"],
+        }
+        for row in rows
+    ]
+
+
+def get_weekly_events(start, end):
+    """Return `({"events": [...]}, etag)` for the date range."""
+    version = (redis_client.get(EVENTS_VERSION_KEY) or b"0").decode()
+    cache_key = f"weekly_events:{version}:{start.isoformat()}:{end.isoformat()}"
+
+    cached = cache.get(cache_key)
+    if cached is not None:
+        return cached
+
+    payload = {"events": query_events(start, end)}
+    body = json.dumps(payload, sort_keys=True).encode()
+    etag = f'"{hashlib.sha1(body).hexdigest()}"'
+    cache.set(cache_key, (payload, etag), timeout=CACHE_TIMEOUT)
+    return payload, etag
+
+
+def etag_matches(if_none_match, etag):
+    """Whether an If-None-Match header covers `etag` (weak comparison)."""
+    if not if_none_match:
+        return False
+    for candidate in if_none_match.split(","):
+        candidate = candidate.strip()
+        if candidate == "*" or candidate.removeprefix("W/") == etag:
+            return True
+    return False
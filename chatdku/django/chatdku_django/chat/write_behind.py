@@ -0,0 +1,208 @@
+"""
+Write-behind buffer for chat messages.
+
+`ChatView` used to INSERT each message in the request, so a streamed answer
+was only closed once the database had written the bot message. Messages are
+now pushed to a Redis list (one RPUSH) and written with `bulk_create` by a
+background thread of the same process, or by the `flush_chat_messages`
+Celery task if the process dies first.
+
+Delivery is at-least-once: a batch is moved to its own Redis list before it
+is written and the list is only deleted after the commit. Batches left
+behind by a crash are put back on the queue by `recover_stale_batches()`.
+A crash between the commit and the delete writes the batch twice.
+
+Until a message is committed it is also kept in a list of its session, so
+that `pending_messages()` can return it to readers of the conversation.
+"""
+
+import json
+import logging
+import threading
+import time
+import uuid
+
+from django.conf import settings
+from django.db import close_old_connections
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from prometheus_client import Histogram
+from redis import RedisError
+
+from chat.models import ChatMessages, UserSession
+from chatdku_django.celery import redis_client
+
+logger = logging.getLogger(__name__)
+
+QUEUE_KEY = "chat:write_behind"
+BATCH_PREFIX = f"{QUEUE_KEY}:batch:"
+PENDING_PREFIX = f"{QUEUE_KEY}:session:"
+# Messages are normally written within a second, this only bounds leftovers
+PENDING_TTL = 24 * 60 * 60
+
+# Time from the last streamed chunk until the response is closed, i.e. what
+# persisting the answer costs the streaming worker.
+STREAM_CLOSE_SECONDS = Histogram(
+    "chatdku_chat_stream_close_seconds",
+    "Time spent persisting a streamed answer before closing the stream",
+    buckets=getattr(settings, "PROMETHEUS_LATENCY_BUCKETS", Histogram.DEFAULT_BUCKETS),
+)
+
+
+def enqueue_message(session_id, role, message):
+    """Queue a message. Its created_at is taken now, not when it is written."""
+    record = {
+        "session_id": str(session_id),
+        "role": role,
+        "message": message,
+        "created_at": timezone.now().isoformat(),
+    }
+    item = json.dumps(record)
+    pending_key = f"{PENDING_PREFIX}{session_id}"
+    pipe = redis_client.pipeline(transaction=False)
+    pipe.rpush(QUEUE_KEY, item)
+    pipe.rpush(pending_key, item)
+    pipe.expire(pending_key, PENDING_TTL)
+    pipe.execute()
+    _flusher.wake()
+
+
+def pending_messages(session_id):
+    """
+    Messages of the session that are queued but not written yet, as
+    `ChatMessages` that are not saved, oldest first.
+    """
+    try:
+        items = redis_client.lrange(f"{PENDING_PREFIX}{session_id}", 0, -1)
+    except RedisError as e:
+        logger.warning(f"Could not read queued messages of {session_id}: {e}")
+        return []
+    return [_to_message(json.loads(item)) for item in items]
+
+
+def with_pending(messages, session_id):
+    """
+    `messages` of the session read from the database and its queued
+    messages, oldest first. A message written while it is read is kept once.
+    """
+    written = {(m.role, m.message, m.created_at) for m in messages}
+    pending = [
+        m
+        for m in pending_messages(session_id)
+        if (m.role, m.message, m.created_at) not in written
+    ]
+    return sorted([*messages, *pending], key=lambda m: m.created_at)
+
+
+def _to_message(record):
+    return ChatMessages(
+        session_id=record["session_id"],
+        role=record["role"],
+        message=record["message"],
+        created_at=parse_datetime(record["created_at"]),
+    )
+
+
+def flush(batch_size=500):
+    """
+    Write up to `batch_size` queued messages in one bulk INSERT. Returns the
+    number of messages taken off the queue.
+    """
+    batch_key = f"{BATCH_PREFIX}{int(time.time())}:{uuid.uuid4().hex}"
+    pipe = redis_client.pipeline(transaction=False)
+    for _ in range(batch_size):
+        pipe.lmove(QUEUE_KEY, batch_key, "LEFT", "RIGHT")
+    items = [item for item in pipe.execute() if item is not None]
+    if not items:
+        return 0
+
+    records = [json.loads(item) for item in items]
+    # Sessions deleted in the meantime would fail the whole batch
+    session_ids = {r["session_id"] for r in records}
+    existing = {
+        str(pk)
+        for pk in UserSession.objects.filter(id__in=session_ids).values_list(
+            "id", flat=True
+        )
+    }
+    if len(existing) < len(session_ids):
+        logger.warning(
+            f"Dropping messages of deleted sessions: {session_ids - existing}"
+        )
+        records = [r for r in records if r["session_id"] in existing]
+
+    try:
+        ChatMessages.objects.bulk_create(_to_message(r) for r in records)
+    except Exception:
+        _requeue(batch_key)
+        raise
+
+    pipe = redis_client.pipeline(transaction=False)
+    for item in items:
+        session_id = json.loads(item)["session_id"]
+        pipe.lrem(f"{PENDING_PREFIX}{session_id}", 1, item)
+    pipe.delete(batch_key)
+    pipe.execute()
+    return len(items)
+
+
+def flush_all(batch_size=500):
+    total = 0
+    while flushed := flush(batch_size):
+        total += flushed
+    return total
+
+
+def _requeue(batch_key):
+    # LMOVE keeps every message in exactly one of the two lists
+    while redis_client.lmove(batch_key, QUEUE_KEY, "LEFT", "RIGHT") is not None:
+        pass
+
+
+def recover_stale_batches(max_age=60):
+    """Put batches of writers that died more than `max_age` seconds ago back."""
+    now = time.time()
+    recovered = 0
+    for key in redis_client.scan_iter(match=f"{BATCH_PREFIX}*", count=100):
+        key = key.decode() if isinstance(key, bytes) else key
+        started = int(key[len(BATCH_PREFIX) :].split(":", 1)[0])
+        if now - started > max_age:
+            recovered += redis_client.llen(key)
+            _requeue(key)
+    return recovered
+
+
+class _Flusher:
+    """Daemon thread that flushes the queue shortly after messages arrive."""
+
+    def __init__(self, linger=0.05):
+        self.linger = linger
+        self._event = threading.Event()
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def wake(self):
+        if self._thread is None:
+            with self._lock:
+                if self._thread is None:
+                    self._thread = threading.Thread(
+                        target=self._run, name="chat-write-behind", daemon=True
+                    )
+                    self._thread.start()
+        self._event.set()
+
+    def _run(self):
+        while True:
+            self._event.wait()
+            # Messages arriving together go into the same INSERT
+            time.sleep(self.linger)
+            self._event.clear()
+            close_old_connections()
+            try:
+                flush_all()
+            except Exception as e:
+                # Left on the queue for the next wake-up or the Celery task
+                logger.error(f"Write-behind flush failed: {e}")
+
+
+_flusher = _Flusher()
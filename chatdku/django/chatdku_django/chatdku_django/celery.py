@@ -47,6 +47,10 @@ app.conf.beat_schedule = {
         "task": "chat.tasks.clean_admin_session",
         "schedule": crontab(minute=00, hour="*/12"),  # Every 22hr
     },
+    "flush-chat-messages": {
+        "task": "chat.tasks.flush_chat_messages",
+        "schedule": crontab(),  # Every minute, web workers flush right away
+    },
     "session-clean-empty": {
         "task": "chat.tasks.clean_empty_sessions",
         "schedule": crontab(minute=00, hour="*/1"),  # Every 1 hour everyday
@@ -332,6 +332,14 @@ RATE_LIMIT_API = 60  # API endpoints: 60 requests per minute
 RATE_LIMIT_STRICT = 20  # Strict operations: 20 requests per 30 seconds
 RATE_LIMIT_WINDOW = 60  # Default window: 60 seconds
 RATE_LIMIT_STRICT_WINDOW = 30  # Strict window: 30 seconds
+RATE_LIMIT_ALGORITHM = "sliding_window"  # or "token_bucket"
+
+# Semantic answer cache, see chat/answer_cache.py
+
+ANSWER_CACHE_ENABLED = os.getenv("ANSWER_CACHE_ENABLED", "false").lower() == "true"
+ANSWER_CACHE_THRESHOLD = 0.95  # Cosine similarity of questions sharing an answer
+ANSWER_CACHE_TTL = 60 * 60 * 24  # Seconds an unused corpus version is kept
+ANSWER_CACHE_MAX_ENTRIES = 5000  # Per corpus version and chat mode
 
 # Paths exempt from rate limiting
 RATE_LIMIT_EXEMPT_PATHS = [
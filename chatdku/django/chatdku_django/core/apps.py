@@ -8,8 +8,6 @@ os.environ.setdefault("LITELLM_LOCAL_MODEL_COST_MAP", "True")  # noqa: E402,E401
 import dspy
 from django.apps import AppConfig
 
-from chatdku.config import config
-
 logger = logging.getLogger(__name__)
 
 
@@ -18,27 +16,20 @@ class CoreConfig(AppConfig):
     name = "core"
 
     def ready(self):
+        from prometheus_client import REGISTRY
+
+        from chatdku.core.llm_router import current_router, routed_lm
+        from chatdku.core.tools.query_embedding_cache import get_query_embedding_cache
         from chatdku.setup import setup, use_phoenix
+        from core.collectors import LLMRouterCollector, QueryEmbeddingCacheCollector
 
         setup()
         use_phoenix()
-        lm = dspy.LM(
-            model="openai/" + config.llm,
-            api_base=config.llm_url,
-            api_key=config.llm_api_key,
-            model_type="chat",
-            max_tokens=config.output_window,
-            top_p=config.top_p,
-            min_p=config.min_p,
-            presence_penalty=config.presence_penalty,
-            repetition_penalty=config.repetition_penalty,
-            temperature=config.llm_temperature,
-            extra_body={
-                "top_k": config.top_k,
-                "chat_template_kwargs": {"enable_thinking": False},
-            },
-            enable_thinking=False,
-        )
+        # The router and its health checks start on the first LLM call, not
+        # in every process loading the apps (migrate, shell, celery, tests)
+        lm = routed_lm()
         dspy.configure(lm=lm)
+        REGISTRY.register(LLMRouterCollector(current_router))
+        REGISTRY.register(QueryEmbeddingCacheCollector(get_query_embedding_cache()))
 
         dspy.configure_cache(enable_disk_cache=True, enable_memory_cache=True)
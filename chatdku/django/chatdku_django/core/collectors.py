@@ -0,0 +1,78 @@
+from prometheus_client.core import CounterMetricFamily, GaugeMetricFamily
+
+
+class LLMRouterCollector:
+    """
+    Exports `LLMRouter.metrics()` on /metrics, labelled by endpoint URL.
+    `get_router` returns the router, or None before the first LLM call.
+    """
+
+    def __init__(self, get_router):
+        self.get_router = get_router
+
+    def collect(self):
+        healthy = GaugeMetricFamily(
+            "chatdku_llm_endpoint_healthy",
+            "Whether the LLM endpoint is receiving requests",
+            labels=["endpoint"],
+        )
+        in_flight = GaugeMetricFamily(
+            "chatdku_llm_endpoint_in_flight",
+            "Requests currently sent to the LLM endpoint",
+            labels=["endpoint"],
+        )
+        latency = GaugeMetricFamily(
+            "chatdku_llm_endpoint_latency_seconds",
+            "Moving average latency of successful LLM calls",
+            labels=["endpoint"],
+        )
+        requests = CounterMetricFamily(
+            "chatdku_llm_endpoint_requests",
+            "LLM calls sent to the endpoint",
+            labels=["endpoint"],
+        )
+        failures = CounterMetricFamily(
+            "chatdku_llm_endpoint_failures",
+            "LLM calls that failed over to another endpoint",
+            labels=["endpoint"],
+        )
+
+        router = self.get_router()
+        for endpoint in router.metrics() if router is not None else []:
+            labels = [endpoint["url"]]
+            healthy.add_metric(labels, float(endpoint["healthy"]))
+            in_flight.add_metric(labels, endpoint["in_flight"])
+            if endpoint["latency"] is not None:
+                latency.add_metric(labels, endpoint["latency"])
+            requests.add_metric(labels, endpoint["requests"])
+            failures.add_metric(labels, endpoint["failures"])
+
+        yield from (healthy, in_flight, latency, requests, failures)
+
+
+class QueryEmbeddingCacheCollector:
+    """Exports `QueryEmbeddingCache.stats()` on /metrics."""
+
+    def __init__(self, cache):
+        self.cache = cache
+
+    def collect(self):
+        stats = self.cache.stats()
+        lookups = CounterMetricFamily(
+            "chatdku_query_embedding_cache_lookups",
+            "Query embedding lookups by the tier that answered them",
+            labels=["result"],
+        )
+        for result in ("local_hits", "redis_hits", "coalesced", "misses"):
+            lookups.add_metric([result], stats[result])
+        errors = CounterMetricFamily(
+            "chatdku_query_embedding_cache_redis_errors",
+            "Failed Redis calls of the query embedding cache",
+            value=stats["redis_errors"],
+        )
+        size = GaugeMetricFamily(
+            "chatdku_query_embedding_cache_size",
+            "Query embeddings kept in this process",
+            value=stats["size"],
+        )
+        yield from (lookups, errors, size)
@@ -1,36 +1,114 @@
-from django.contrib.auth import get_user_model, login
+from collections import OrderedDict
+import threading
+
+from django.contrib.auth import SESSION_KEY, get_user_model, login
+from django.core.cache import cache
 from django.http import JsonResponse
-from core.models import hash_netid
+from core.models import username_for_netid
 
 User = get_user_model()
 
+# Session key holding the pk that NetIDMiddleware logged the session in with
+NETID_USER_SESSION_KEY = "netid_user"
+
+
+class NetIDUserCache:
+    """
+    Username to user pk, in a per-process LRU in front of the shared Redis
+    cache. Users are never renamed, so entries only go stale when a user is
+    deleted, which `NetIDMiddleware` detects and discards.
+    """
+
+    def __init__(self, maxsize: int = 4096, timeout: int = 60 * 60 * 24):
+        self.maxsize = maxsize
+        self.timeout = timeout
+        self._local = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _key(username: str) -> str:
+        return f"netid_user:{username}"
+
+    def _remember(self, username, pk):
+        with self._lock:
+            self._local[username] = pk
+            self._local.move_to_end(username)
+            if len(self._local) > self.maxsize:
+                self._local.popitem(last=False)
+
+    def get(self, username: str):
+        with self._lock:
+            pk = self._local.get(username)
+            if pk is not None:
+                self._local.move_to_end(username)
+                return pk
+        pk = cache.get(self._key(username))
+        if pk is not None:
+            self._remember(username, pk)
+        return pk
+
+    def set(self, username: str, pk) -> None:
+        cache.set(self._key(username), pk, timeout=self.timeout)
+        self._remember(username, pk)
+
+    def discard(self, username: str) -> None:
+        cache.delete(self._key(username))
+        with self._lock:
+            self._local.pop(username, None)
+
 
 class NetIDMiddleware:
     def __init__(self, get_response):
         self.get_response = get_response
+        self.user_cache = NetIDUserCache()
+
+    def get_user(self, netid, username):
+        """
+        User of `netid`, loaded by pk when it is cached. Only the first
+        request of a NetID creates the user.
+        """
+        pk = self.user_cache.get(username)
+        if pk is not None:
+            user = User.objects.filter(pk=pk).first()
+            if user is not None:
+                return user
+            self.user_cache.discard(username)
+
+        user, created = User.objects.get_or_create_by_netid(netid)
+        self.user_cache.set(username, user.pk)
+        return user
 
     def __call__(self, request):
         path_parts = [p for p in request.path.strip("/").split("/")]
         if any(part in ("admin", "doc", "metrics") for part in path_parts):
             return self.get_response(request)
 
-        netid = request.META.get("HTTP_UID") or request.session.get("netid")
+        session = request.session
+        netid = request.META.get("HTTP_UID") or session.get("netid")
         display_name = request.META.get("HTTP_X_DISPLAYNAME")
         setattr(request, "_dont_enforce_csrf_checks", True)
 
         if not netid:
             return JsonResponse({"message": "Unauthorized"}, status=401)
 
-        user, created = User.objects.get_or_create_by_netid(netid)
+        username = username_for_netid(netid)
 
-        if not request.user.is_authenticated or request.user.username != hash_netid(
-            netid
-        ):
+        # A session this middleware already logged in for the same NetID
+        # needs no database access; `request.user` stays lazy.
+        logged_in = (
+            session.get("netid") == netid
+            and session.get(SESSION_KEY) is not None
+            and session.get(SESSION_KEY) == session.get(NETID_USER_SESSION_KEY)
+        )
+        if not logged_in:
+            user = self.get_user(netid, username)
             login(request, user)
+            session["netid"] = netid
+            session[NETID_USER_SESSION_KEY] = session[SESSION_KEY]
 
-        request.netid = user.username
-        request.session["netid"] = netid
-        if display_name:
-            request.session["display_name"] = display_name
+        request.netid = username
+        # Only written when it changed, so the session is not saved every request
+        if display_name and session.get("display_name") != display_name:
+            session["display_name"] = display_name
 
         return self.get_response(request)
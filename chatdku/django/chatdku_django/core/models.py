@@ -10,6 +10,7 @@ import uuid
 import hashlib
 import os
 import re
+from functools import lru_cache
 from django_prometheus.models import ExportModelOperationsMixin
 
 
@@ -25,6 +26,14 @@ def hash_netid(netid: str) -> str:
     return hashlib.sha256(netid.encode("utf-8")).hexdigest()
 
 
+@lru_cache(maxsize=4096)
+def username_for_netid(netid: str) -> str:
+    """Username stored for `netid`: admin netids as they are, others hashed."""
+    if re.search(r"admin", netid):
+        return netid
+    return hash_netid(netid)
+
+
 # Create your models here.
 
 
@@ -54,11 +63,9 @@ class ChatDkuUserManager(BaseUserManager):
         return self.create_user(username, password=password, hash_user=False, **kwargs)
 
     def get_or_create_by_netid(self, netid, password=None, **kwargs):
-        if re.search(r"admin", netid):
-            hashed_netid = netid
-        else:
-            hashed_netid = hash_netid(netid)
-        user, created = self.get_or_create(username=hashed_netid, defaults={**kwargs})
+        user, created = self.get_or_create(
+            username=username_for_netid(netid), defaults={**kwargs}
+        )
         if created and password:
             user.set_password(password)
             user.save(using=self._db)
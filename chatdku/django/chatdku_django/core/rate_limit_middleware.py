@@ -1,10 +1,79 @@
-from django.core.cache import cache
 from django.http import JsonResponse
 from django.conf import settings
+from django.urls import Resolver404, resolve
+from django_redis import get_redis_connection
+from redis.exceptions import RedisError
+import math
 import time
+import uuid
 import logging
 
 
+# Both scripts take KEYS[1] = bucket key, ARGV[1] = max requests and
+# ARGV[2] = window in seconds, use the Redis clock so that every app server
+# agrees on the window, and return {allowed, count, reset_ms} where reset_ms
+# is the time until a denied request may be retried (or the window resets).
+
+# Sliding window log: one sorted-set member per accepted request.
+SLIDING_WINDOW_LUA = """
+local key = KEYS[1]
+local limit = tonumber(ARGV[1])
+local window = tonumber(ARGV[2]) * 1000
+local t = redis.call('TIME')
+local now = t[1] * 1000 + math.floor(t[2] / 1000)
+
+redis.call('ZREMRANGEBYSCORE', key, 0, now - window)
+local count = redis.call('ZCARD', key)
+local allowed = 0
+if count < limit then
+    redis.call('ZADD', key, now, ARGV[3])
+    count = count + 1
+    allowed = 1
+end
+redis.call('PEXPIRE', key, window)
+
+local reset_ms = window
+local oldest = redis.call('ZRANGE', key, 0, 0, 'WITHSCORES')
+if oldest[2] then
+    reset_ms = tonumber(oldest[2]) + window - now
+end
+return {allowed, count, reset_ms}
+"""
+
+# Token bucket: `limit` tokens, refilled continuously over the window.
+TOKEN_BUCKET_LUA = """
+local key = KEYS[1]
+local capacity = tonumber(ARGV[1])
+local window = tonumber(ARGV[2]) * 1000
+local rate = capacity / window
+local t = redis.call('TIME')
+local now = t[1] * 1000 + math.floor(t[2] / 1000)
+
+local state = redis.call('HMGET', key, 'tokens', 'ts')
+local tokens = tonumber(state[1]) or capacity
+local ts = tonumber(state[2]) or now
+tokens = math.min(capacity, tokens + (now - ts) * rate)
+
+local allowed = 0
+local reset_ms
+if tokens >= 1 then
+    tokens = tokens - 1
+    allowed = 1
+    reset_ms = math.ceil((capacity - tokens) / rate)
+else
+    reset_ms = math.ceil((1 - tokens) / rate)
+end
+redis.call('HSET', key, 'tokens', tostring(tokens), 'ts', now)
+redis.call('PEXPIRE', key, window)
+return {allowed, capacity - math.floor(tokens), reset_ms}
+"""
+
+RATE_LIMIT_SCRIPTS = {
+    "sliding_window": SLIDING_WINDOW_LUA,
+    "token_bucket": TOKEN_BUCKET_LUA,
+}
+
+
 class RateLimitMiddleware:
     """
     Rate limiting middleware - only applies to users already authenticated by NetIDMiddleware.
@@ -62,6 +131,14 @@ class RateLimitMiddleware:
             },
         )
 
+        # 'sliding_window' or 'token_bucket'. Each check is one EVALSHA.
+        self.algorithm = getattr(settings, "RATE_LIMIT_ALGORITHM", "sliding_window")
+        if self.algorithm not in RATE_LIMIT_SCRIPTS:
+            raise ValueError(f"Unknown RATE_LIMIT_ALGORITHM: {self.algorithm}")
+        self.script = get_redis_connection("default").register_script(
+            RATE_LIMIT_SCRIPTS[self.algorithm]
+        )
+
     def extract_netid(self, request):
         """
         Extract NetID from request.
@@ -115,6 +192,23 @@ class RateLimitMiddleware:
                 return limit_type
         return "default"
 
+    def get_route(self, request):
+        """
+        Route pattern of the request (e.g. 'api/chat/<uuid:pk>'), so that
+        URLs with ids share one bucket. Unknown URLs fall back to the path.
+
+        Args:
+            request: Django HttpRequest object
+
+        Returns:
+            str: Route pattern or path
+        """
+        try:
+            match = resolve(request.path_info)
+        except Resolver404:
+            return request.path
+        return match.route or match.view_name
+
     def is_path_exempt(self, path):
         """
         Check if path is exempt from rate limiting.
@@ -130,49 +224,39 @@ class RateLimitMiddleware:
                 return True
         return False
 
-    def check_rate_limit(self, netid, path, limit_type):
+    def check_rate_limit(self, netid, route, limit_type):
         """
-        Execute rate limit check using sliding window algorithm.
+        Count the request and check it against the limit, atomically and in
+        one round trip (see RATE_LIMIT_SCRIPTS).
 
         Important: netid is guaranteed to exist (validated by NetIDMiddleware).
 
         Args:
             netid: User NetID (guaranteed to exist)
-            path: Request path
+            route: Route pattern of the request
             limit_type: Type of rate limit ('default', 'api', 'strict')
 
         Returns:
-            tuple: (allowed, retry_after)
+            tuple: (allowed, count, reset_after)
                 - allowed: Boolean indicating if request is allowed
-                - retry_after: Seconds to wait before retry (if not allowed)
+                - count: Requests counted in the current window
+                - reset_after: Seconds until a denied request may be retried,
+                  or until the window resets
         """
         config = self.rate_limits[limit_type]
-        window = config["window"]
-        max_requests = config["requests"]
-
-        # Use sliding window algorithm
-        current_time = int(time.time())
-        window_key = current_time // window
-
-        # Generate cache key
-        cache_key = f"ratelimit:{netid}:{path}:{limit_type}:{window_key}"
+        cache_key = f"ratelimit:{self.algorithm}:{netid}:{route}:{limit_type}"
 
-        # Get current count
-        current_count = cache.get(cache_key, 0)
-
-        if current_count >= max_requests:
-            # Calculate remaining time
-            reset_time = (window_key + 1) * window
-            retry_after = reset_time - current_time
-            return False, retry_after
-
-        # Increment count
-        if current_count == 0:
-            cache.set(cache_key, 1, timeout=window * 2)
-        else:
-            cache.incr(cache_key)
+        try:
+            allowed, count, reset_ms = self.script(
+                keys=[cache_key],
+                args=[config["requests"], config["window"], uuid.uuid4().hex],
+            )
+        except RedisError as e:
+            # Fail open: an unavailable Redis should not take the API down
+            self.logger.error(f"Rate limit check failed: {e}")
+            return True, 0, config["window"]
 
-        return True, None
+        return bool(allowed), int(count), max(1, math.ceil(int(reset_ms) / 1000))
 
     def __call__(self, request):
         """
@@ -196,41 +280,37 @@ class RateLimitMiddleware:
         limit_type = self.get_limit_type_for_path(request.path)
 
         # 4. Check rate limit
-        allowed, retry_after = self.check_rate_limit(netid, request.path, limit_type)
+        route = self.get_route(request)
+        allowed, count, reset_after = self.check_rate_limit(netid, route, limit_type)
 
         if not allowed:
             # Log rate limit event
             self.logger.warning(
                 f"Rate limit exceeded: netid={netid}, "
-                f"path={request.path}, limit_type={limit_type}"
+                f"route={route}, limit_type={limit_type}"
             )
 
-            return JsonResponse(
+            response = JsonResponse(
                 {
                     "error": "rate_limit_exceeded",
-                    "message": f"Too many requests. Please try again in {retry_after} seconds.",
-                    "retry_after": retry_after,
+                    "message": f"Too many requests. Please try again in {reset_after} seconds.",
+                    "retry_after": reset_after,
                     "limit": self.rate_limits[limit_type]["requests"],
                     "window": self.rate_limits[limit_type]["window"],
                 },
                 status=429,
             )
+            response["Retry-After"] = str(reset_after)
+            return response
 
         # 5. Process request
         response = self.get_response(request)
 
-        # 6. Add rate limit headers
+        # 6. Add rate limit headers, from the count of the check above
         config = self.rate_limits[limit_type]
-        current_time = int(time.time())
-        window_key = current_time // config["window"]
-        cache_key = f"ratelimit:{netid}:{request.path}:{limit_type}:{window_key}"
-        current_count = cache.get(cache_key, 0)
-
         response["X-RateLimit-Limit"] = str(config["requests"])
-        response["X-RateLimit-Remaining"] = str(
-            max(0, config["requests"] - current_count)
-        )
-        response["X-RateLimit-Reset"] = str((window_key + 1) * config["window"])
+        response["X-RateLimit-Remaining"] = str(max(0, config["requests"] - count))
+        response["X-RateLimit-Reset"] = str(int(time.time()) + reset_after)
         response["X-RateLimit-Policy"] = f'{config["requests"]};w={config["window"]}'
 
         return response
@@ -1,7 +1,7 @@
 from core.models import UploadedFile, UserModel
 from celery import shared_task
 from django.db import transaction
-from chatdku.backend.user_data_interface import update
+from chatdku.ingestion.user_upload import update
 from core.set_lock import redis_lock
 from chatdku_django.celery import redis_client
 import sys
@@ -15,8 +15,6 @@ import shutil
 import logging
 
 
-from chatdku.backend.user_data_interface import update
-
 logger = logging.getLogger(__name__)
 
 dotenv.load_dotenv()
@@ -84,41 +82,63 @@ def update_user_embedding():
 # Redis queue for user upload
 
 
+def _drain_queue(netid):
+    queued = []
+    while metadata := redis_client.lpop(f"queue_key:{netid}"):
+        queued.append(metadata)
+    return queued
+
+
 @shared_task(bind=True, max_retries=5)
 def update_user_chroma(self, netid):
+    """
+    Ingest the uploads queued for `netid`. The files are already in the
+    user's folder, so one `update()` picks up every upload queued so far and
+    embeds their chunks together. Progress is written to each `task:{id}`.
+    """
     try:
-        while metadata := redis_client.lpop(f"queue_key:{netid}"):
-            metadata_info = json.loads(metadata.decode("utf-8"))
-            lock_key = metadata_info["lock_key"]
+        while queued := _drain_queue(netid):
+            tasks = [json.loads(m.decode("utf-8")) for m in queued]
+            task_keys = [f"task:{t['id']}" for t in tasks]
 
-            full_data = redis_client.hgetall(f"task:{metadata_info['id']}")
-            args = json.loads(full_data.get(b"args", b"[]").decode("utf-8"))
+            full_data = redis_client.hgetall(task_keys[0])
             kwargs = json.loads(full_data.get(b"kwargs", b"{}").decode("utf-8"))
+            folder = kwargs["user_folder_path"]
+
+            def set_status(**fields):
+                pipe = redis_client.pipeline(transaction=False)
+                for key in task_keys:
+                    pipe.hset(key, mapping=fields)
+                pipe.execute()
+
+            def progress(stage, done, total):
+                set_status(status="running", stage=stage, progress=f"{done}/{total}")
 
             try:
-                with redis_lock(lockkey=lock_key, expire=600):
-                    folder = kwargs["user_folder_path"]
-                    json_path = os.path.join(folder, "data_state.json")
+                with redis_lock(lockkey=tasks[0]["lock_key"], expire=600):
                     os.makedirs(folder, exist_ok=True)
-                    if not os.path.exists(json_path):
-                        with open(json_path, "w") as f:
-                            json.dump({}, f)
-
-                    redis_client.hset(
-                        f"task:{metadata_info['id']}", "status", "running"
+                    set_status(status="running")
+                    added, failed = update(
+                        user_id=str(netid), data_dir=folder, progress=progress
                     )
-                    update(user_id=str(netid), data_dir=folder)
-                    redis_client.hset(
-                        f"task:{metadata_info['id']}", "status", "completed"
+                    # Files that failed to parse are retried with the next
+                    # upload, retrying the task would not parse them either
+                    if failed:
+                        logger.warning(f"User {netid} files not loaded: {failed}")
+                    set_status(
+                        status="completed", nodes=added, failed=json.dumps(failed)
                     )
 
             except Exception as e:
                 logger.error(f"User {netid} task error: {e}")
-                redis_client.rpush(f"queue_key:{netid}", metadata)
-                self.retry(exc=e, countdown=5)
+                set_status(status="pending", error=str(e))
+                redis_client.rpush(f"queue_key:{netid}", *queued)
+                raise self.retry(exc=e, countdown=5)
 
             finally:
-                redis_client.delete(f"task:{metadata_info['id']}")
+                # Kept for a while so that clients can read the final status
+                for key in task_keys:
+                    redis_client.expire(key, 1200)
 
     finally:
         redis_client.delete(f"processing:{netid}")
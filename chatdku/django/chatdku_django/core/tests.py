@@ -1,3 +1,113 @@
-from django.test import TestCase
+import time
+from unittest import mock
 
-# Create your tests here.
+import fakeredis
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.http import HttpResponse
+from django.test import RequestFactory, SimpleTestCase, TestCase, override_settings
+
+from core.models import hash_netid
+from core.rate_limit_middleware import RateLimitMiddleware
+
+User = get_user_model()
+
+LOCMEM_CACHES = {
+    "default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}
+}
+# The rate limiter needs a real Redis connection
+MIDDLEWARE = [m for m in settings.MIDDLEWARE if "RateLimit" not in m]
+
+
+@override_settings(CACHES=LOCMEM_CACHES, MIDDLEWARE=MIDDLEWARE)
+class NetIDMiddlewareTests(TestCase):
+    def get(self, netid="ab123"):
+        return self.client.get("/user/health", HTTP_UID=netid)
+
+    def test_first_request_creates_user(self):
+        response = self.get()
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["netid"], "ab123")
+        self.assertTrue(User.objects.filter(username=hash_netid("ab123")).exists())
+
+    def test_logged_in_session_skips_user_lookup(self):
+        self.get()
+
+        # Session load and the view's request.user; previously also the
+        # get_or_create and a session save on every request.
+        with self.assertNumQueries(2):
+            self.assertEqual(self.get().status_code, 200)
+
+    def test_new_session_uses_cached_pk(self):
+        self.get()
+        self.client.logout()
+
+        with mock.patch.object(
+            User.objects, "get_or_create_by_netid", side_effect=AssertionError
+        ):
+            self.assertEqual(self.get().status_code, 200)
+
+    def test_other_netid_logs_in_again(self):
+        self.get("ab123")
+        self.get("cd456")
+
+        self.assertEqual(self.client.session["netid"], "cd456")
+        self.assertEqual(
+            User.objects.get(pk=self.client.session["_auth_user_id"]).username,
+            hash_netid("cd456"),
+        )
+
+
+@override_settings(RATE_LIMIT_API=2, RATE_LIMIT_WINDOW=0.5)
+class RateLimitMiddlewareTests(SimpleTestCase):
+    # Runs the Lua scripts on fakeredis' Lua interpreter
+    algorithm = "sliding_window"
+
+    def setUp(self):
+        self.server = fakeredis.FakeServer()
+        redis = fakeredis.FakeRedis(server=self.server)
+        with (
+            override_settings(RATE_LIMIT_ALGORITHM=self.algorithm),
+            mock.patch(
+                "core.rate_limit_middleware.get_redis_connection", return_value=redis
+            ),
+        ):
+            self.middleware = RateLimitMiddleware(lambda request: HttpResponse())
+
+    def get(self, netid="ab123"):
+        request = RequestFactory().get("/api/c/")
+        request.netid = netid
+        return self.middleware(request)
+
+    def test_limit_reached_gets_429_with_retry_after(self):
+        with self.assertLogs("app", "WARNING"):
+            first, second, third = self.get(), self.get(), self.get()
+
+        self.assertEqual(first["X-RateLimit-Remaining"], "1")
+        self.assertEqual(second["X-RateLimit-Remaining"], "0")
+        self.assertEqual(third.status_code, 429)
+        self.assertEqual(third["Retry-After"], "1")
+        # Other users have their own limit
+        self.assertEqual(self.get("cd456").status_code, 200)
+
+    def test_requests_are_allowed_again_after_the_window(self):
+        with self.assertLogs("app", "WARNING"):
+            self.get(), self.get()
+            self.assertEqual(self.get().status_code, 429)
+
+        time.sleep(0.6)
+
+        self.assertEqual(self.get().status_code, 200)
+
+    def test_unavailable_redis_fails_open(self):
+        self.server.connected = False
+
+        with self.assertLogs("app", "ERROR"):
+            responses = [self.get() for _ in range(3)]
+
+        self.assertEqual([r.status_code for r in responses], [200, 200, 200])
+
+
+class TokenBucketRateLimitTests(RateLimitMiddlewareTests):
+    algorithm = "token_bucket"
@@ -16,6 +16,8 @@ import argparse
 
 import pandas as pd
 
+from chatdku.ingestion.corpus_version import bump_corpus_version
+
 # ── Constants ────────────────────────────────────────────────────────────────
 INPUT_PATH = "/datapool/chatdku_external_data/DK_SR_CLASSDATA_CHATDKU.csv"
 OUTPUT_PATH = "/datapool/chatdku_external_data/cleaned_classdata.csv"  # TODO: set final output folder
@@ -106,6 +108,8 @@ def clean(input_path: str, output_path: str) -> None:
 
     df.to_csv(output_path, index=False)
     print(f"Wrote {len(df)} rows → {output_path}")
+    # Cached CourseScheduleLookup / CourseRecommender results are stale now
+    bump_corpus_version()
 
 
 if __name__ == "__main__":
@@ -0,0 +1,48 @@
+"""corpus_version.py
+
+Version number of the public corpus, kept in Redis.
+
+The Chroma, Postgres and Redis loaders increment it after they changed the
+public collection / table / index, and so do `clean_classdata.py` and `major_ingest.py` for
+the data of the lookup tools. Caches of answers, tool results or retrieval
+results key their entries by it, so an ingestion run invalidates them without
+having to know where they live.
+"""
+
+import logging
+
+from redis import Redis, RedisError
+
+from chatdku.config import config
+
+logger = logging.getLogger(__name__)
+
+CORPUS_VERSION_KEY = "corpus:version"
+
+
+def _redis() -> Redis:
+    return Redis(
+        host=config.redis_host,
+        port=config.redis_port,
+        username="default",
+        password=config.redis_password,
+    )
+
+
+def get_corpus_version(redis_client: Redis = None) -> str:
+    value = (redis_client or _redis()).get(CORPUS_VERSION_KEY)
+    return value.decode() if value else "0"
+
+
+def bump_corpus_version(redis_client: Redis = None):
+    """
+    Increment the version. A failure is only logged: the stores are already
+    loaded and the caches then expire on their own.
+    """
+    try:
+        version = (redis_client or _redis()).incr(CORPUS_VERSION_KEY)
+    except RedisError as e:
+        logger.warning(f"Could not bump the corpus version: {e}")
+        return None
+    logger.info(f"Corpus version is now {version}")
+    return version
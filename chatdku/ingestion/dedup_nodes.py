@@ -0,0 +1,504 @@
+#!/usr/bin/env python3
+"""dedup_nodes.py
+
+Near-duplicate elimination between chunking (`update_data.py`) and loading.
+
+The scraped site has many near-identical chunks (navigation-heavy HTML,
+mirrored PDFs, repeated footers). This stage reads a node store, collapses
+each cluster of duplicates into its first chunk and writes a new node store
+for the loaders:
+
+  1. Exact pass: sha1 of the whitespace/case-normalised text.
+  2. Near pass: MinHash signatures over word 5-gram shingles, with LSH
+     banding to find candidates. A candidate joins a cluster when the
+     estimated Jaccard similarity with the cluster's first chunk is at least
+     `--threshold`.
+
+Chunks are only compared with chunks that have the same permissions, and
+event nodes are kept as they are. The kept chunk records the files of the
+chunks it replaced in `duplicate_sources` and their number in
+`duplicate_count`.
+
+Both passes are streaming: the first keeps only hashes and signatures in
+memory, the second rewrites the shards. Time is linear in the number of
+chunks because every chunk is compared with at most one cluster per band.
+
+`update_data.py` also deduplicates the chunks of changed files with
+`DedupIndex`, so that incremental loads do not add copies of chunks already
+loaded. The index keeps the hashes and signatures of the whole store on
+disk, so a run only hashes the chunks of changed files.
+
+Usage:
+    python dedup_nodes.py --nodes_path /path/to/nodes --output_path /path/to/nodes_dedup
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import zlib
+from collections import defaultdict
+from time import perf_counter
+
+import numpy as np
+
+from chatdku.ingestion.node_store import SHARD_SUFFIX, NodeStore
+
+_MERSENNE_PRIME = (1 << 61) - 1
+_WORD_RE = re.compile(r"\w+")
+_PERMISSION_FIELDS = ("access_type", "role", "organization", "user_id")
+
+# Kept in the node store directory, see `DedupIndex`
+DEDUP_INDEX_NAME = "dedup.sqlite"
+
+
+def _words(text: str) -> list[str]:
+    return _WORD_RE.findall(text.lower())
+
+
+def _shingles(words: list[str], size: int) -> set[str]:
+    if len(words) <= size:
+        return {" ".join(words)}
+    return {" ".join(words[i : i + size]) for i in range(len(words) - size + 1)}
+
+
+class Deduplicator:
+    """
+    Assigns every chunk to a cluster, in the order the chunks are added.
+
+    `add()` returns the index of the chunk that represents the cluster (the
+    chunk's own index if it is the first of its kind) and whether it matched
+    exactly.
+    """
+
+    def __init__(
+        self,
+        threshold: float = 0.85,
+        num_perm: int = 128,
+        bands: int = 16,
+        shingle_size: int = 5,
+        seed: int = 1,
+    ):
+        if num_perm % bands:
+            raise ValueError("num_perm must be a multiple of bands")
+        self.threshold = threshold
+        self.num_perm = num_perm
+        self.bands = bands
+        self.rows = num_perm // bands
+        self.shingle_size = shingle_size
+
+        # (a * h + b) mod p with 32-bit shingle hashes h; a < 2**31 keeps the
+        # product within 64 bits.
+        rng = np.random.default_rng(seed)
+        self._a = rng.integers(1, 1 << 31, num_perm, dtype=np.uint64)[:, None]
+        self._b = rng.integers(0, _MERSENNE_PRIME, num_perm, dtype=np.uint64)[:, None]
+
+        self._exact: dict[tuple, int] = {}
+        self._buckets: list[dict[tuple, int]] = [{} for _ in range(bands)]
+        self._signatures: dict[int, np.ndarray] = {}
+
+    def signature(self, text: str) -> np.ndarray:
+        shingles = _shingles(_words(text), self.shingle_size)
+        hashes = np.fromiter(
+            (zlib.crc32(s.encode()) for s in shingles),
+            dtype=np.uint64,
+            count=len(shingles),
+        )
+        values = (self._a * hashes + self._b) % np.uint64(_MERSENNE_PRIME)
+        return values.min(axis=1)
+
+    def add(self, index: int, text: str, group: tuple = ()) -> tuple[int, bool]:
+        exact_key = (group, hashlib.sha1(" ".join(_words(text)).encode()).digest())
+        if exact_key in self._exact:
+            return self._exact[exact_key], True
+
+        signature = self.signature(text)
+        band_keys = [
+            (
+                group,
+                band,
+                signature[band * self.rows : (band + 1) * self.rows].tobytes(),
+            )
+            for band in range(self.bands)
+        ]
+        for band, key in enumerate(band_keys):
+            candidate = self._buckets[band].get(key)
+            if candidate is None:
+                continue
+            similarity = np.mean(self._signatures[candidate] == signature)
+            if similarity >= self.threshold:
+                # Later exact copies go straight to the same cluster
+                self._exact[exact_key] = candidate
+                return candidate, False
+
+        # A new cluster: only its first chunk is kept as the bucket entry
+        self._exact[exact_key] = index
+        self._signatures[index] = signature
+        for band, key in enumerate(band_keys):
+            self._buckets[band].setdefault(key, index)
+        return index, False
+
+
+def _permission_group(metadata: dict) -> tuple:
+    return tuple(metadata.get(f) for f in _PERMISSION_FIELDS)
+
+
+def dedup_store(
+    nodes_path: str, output_path: str, threshold: float = 0.85
+) -> dict[str, float]:
+    """Write a deduplicated copy of the node store and return a report."""
+    store = NodeStore(nodes_path)
+    dedup = Deduplicator(threshold=threshold)
+    t0 = perf_counter()
+
+    # Pass 1: cluster every chunk, remembering only its representative.
+    representative: list[int] = []
+    exact = near = chars = removed_chars = 0
+    duplicates_of: dict[int, list[str]] = defaultdict(list)
+    for index, d in enumerate(store.iter_dicts()):
+        metadata = d.get("metadata") or {}
+        text = d.get("text") or ""
+        chars += len(text)
+        if metadata.get("is_event"):
+            representative.append(index)
+            continue
+        rep, is_exact = dedup.add(index, text, _permission_group(metadata))
+        representative.append(rep)
+        if rep != index:
+            exact += is_exact
+            near += not is_exact
+            removed_chars += len(text)
+            duplicates_of[rep].append(metadata.get("file_path", ""))
+    cluster_s = perf_counter() - t0
+
+    # Pass 2: rewrite the shards without the duplicates.
+    os.makedirs(output_path, exist_ok=True)
+    for name in os.listdir(output_path):
+        if name.endswith(SHARD_SUFFIX):
+            os.remove(os.path.join(output_path, name))
+
+    index = 0
+    for shard in store._shards():
+        kept = []
+        for d in store._read_shard(shard):
+            if representative[index] == index:
+                sources = duplicates_of.get(index)
+                if sources:
+                    own = d["metadata"].get("file_path", "")
+                    others = sorted(set(sources) - {own})
+                    d["metadata"]["duplicate_count"] = len(sources)
+                    d["metadata"]["duplicate_sources"] = "; ".join(others)
+                kept.append(d)
+            index += 1
+        if kept:
+            with open(os.path.join(output_path, os.path.basename(shard)), "w") as f:
+                for d in kept:
+                    f.write(json.dumps(d))
+                    f.write("\n")
+
+    total = len(representative)
+    return {
+        "chunks": total,
+        "exact_duplicates": exact,
+        "near_duplicates": near,
+        "kept": total - exact - near,
+        "chunk_reduction": (exact + near) / total if total else 0.0,
+        "char_reduction": removed_chars / chars if chars else 0.0,
+        "cluster_seconds": cluster_s,
+        "total_seconds": perf_counter() - t0,
+    }
+
+
+class DedupIndex:
+    """
+    The clusters of the chunks in a node store, kept in `dedup.sqlite` in the
+    store directory so that `update_data.py` only hashes the chunks of
+    changed files.
+
+    Every chunk of a non-event shard has a row with its exact hash, MinHash
+    signature and the chunk it duplicates (NULL for a kept chunk). The LSH
+    buckets hold the kept chunks. Lookups go through SQLite, so memory does
+    not grow with the corpus.
+
+    `dedup_delta()` updates the index inside a transaction that `commit()`
+    ends once the shards of the delta are written. Shards written without
+    it, e.g. with `--no_dedup`, are noticed by their modification time and
+    indexed again.
+    """
+
+    def __init__(self, store: NodeStore, threshold: float = 0.85):
+        self.store = store
+        self.minhash = Deduplicator(threshold=threshold)
+        self._db = sqlite3.connect(
+            os.path.join(store.store_dir, DEDUP_INDEX_NAME),
+            isolation_level=None,  # Transactions are managed explicitly
+        )
+        self._db.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS shards (
+                shard    TEXT PRIMARY KEY,
+                mtime_ns INTEGER NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS chunks (
+                node_id   TEXT PRIMARY KEY,
+                shard     TEXT NOT NULL,
+                file_path TEXT NOT NULL,
+                grp       TEXT NOT NULL,
+                exact     BLOB NOT NULL,
+                signature BLOB NOT NULL,
+                canonical TEXT
+            );
+            CREATE INDEX IF NOT EXISTS chunks_shard ON chunks (shard);
+            CREATE INDEX IF NOT EXISTS chunks_exact ON chunks (grp, exact);
+            CREATE INDEX IF NOT EXISTS chunks_canonical ON chunks (canonical);
+            CREATE TABLE IF NOT EXISTS buckets (
+                band    INTEGER NOT NULL,
+                key     BLOB NOT NULL,
+                node_id TEXT NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS buckets_key ON buckets (band, key);
+            CREATE INDEX IF NOT EXISTS buckets_node ON buckets (node_id);
+            """
+        )
+        self._pending: set[str] = set()
+
+    def _shard(self, file_path: str) -> str:
+        return os.path.basename(self.store._shard_path(file_path))
+
+    def _disk_shards(self) -> dict[str, int]:
+        events = os.path.basename(self.store._shard_path(None))
+        return {
+            os.path.basename(path): os.stat(path).st_mtime_ns
+            for path in self.store._shards()
+            if os.path.basename(path) != events
+        }
+
+    def _keys(self, d: dict) -> tuple[str, bytes, bytes]:
+        metadata = d.get("metadata") or {}
+        text = d.get("text") or ""
+        group = json.dumps(_permission_group(metadata))
+        exact = hashlib.sha1(" ".join(_words(text)).encode()).digest()
+        return group, exact, self.minhash.signature(text).tobytes()
+
+    def _add(self, node_id, shard, file_path, group, exact, signature) -> str | None:
+        """Index a chunk and return the chunk it duplicates, or None if kept."""
+        row = self._db.execute(
+            "SELECT node_id, canonical FROM chunks WHERE grp = ? AND exact = ? LIMIT 1",
+            (group, exact),
+        ).fetchone()
+        canonical = (row[1] or row[0]) if row else None
+
+        values = np.frombuffer(signature, dtype=np.uint64)
+        rows = self.minhash.rows
+        band_keys = [
+            values[band * rows : (band + 1) * rows].tobytes()
+            for band in range(self.minhash.bands)
+        ]
+        if canonical is None:
+            for band, key in enumerate(band_keys):
+                for candidate, other in self._db.execute(
+                    "SELECT c.node_id, c.signature FROM buckets b"
+                    " JOIN chunks c ON c.node_id = b.node_id"
+                    " WHERE b.band = ? AND b.key = ? AND c.grp = ?",
+                    (band, key, group),
+                ):
+                    other = np.frombuffer(other, dtype=np.uint64)
+                    if np.mean(other == values) >= self.minhash.threshold:
+                        canonical = candidate
+                        break
+                if canonical is not None:
+                    break
+
+        self._db.execute(
+            "INSERT OR REPLACE INTO chunks VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (node_id, shard, file_path, group, exact, signature, canonical),
+        )
+        if canonical is None:
+            self._db.executemany(
+                "INSERT INTO buckets VALUES (?, ?, ?)",
+                [(band, key, node_id) for band, key in enumerate(band_keys)],
+            )
+        return canonical
+
+    def _remove(self, shard: str, touched: set[str]) -> None:
+        """Drop the rows of `shard`, adding the kept chunks it duplicated to `touched`."""
+        touched.update(
+            canonical
+            for (canonical,) in self._db.execute(
+                "SELECT DISTINCT canonical FROM chunks"
+                " WHERE shard = ? AND canonical IS NOT NULL",
+                (shard,),
+            )
+        )
+        self._db.execute(
+            "DELETE FROM buckets WHERE node_id IN"
+            " (SELECT node_id FROM chunks WHERE shard = ?)",
+            (shard,),
+        )
+        self._db.execute("DELETE FROM chunks WHERE shard = ?", (shard,))
+        self._db.execute("DELETE FROM shards WHERE shard = ?", (shard,))
+
+    def _read(self, shard: str, node_ids: set[str] | None = None) -> list[dict]:
+        path = os.path.join(self.store.store_dir, shard)
+        return [
+            d
+            for d in self.store._read_shard(path)
+            if node_ids is None or d["id_"] in node_ids
+        ]
+
+    def _with_duplicates(self, d: dict) -> dict:
+        """Copy of `d` with the files of the chunks it replaces in its metadata."""
+        sources = [
+            file_path
+            for (file_path,) in self._db.execute(
+                "SELECT file_path FROM chunks WHERE canonical = ?", (d["id_"],)
+            )
+        ]
+        metadata = dict(d.get("metadata") or {})
+        metadata.pop("duplicate_count", None)
+        metadata.pop("duplicate_sources", None)
+        if sources:
+            own = metadata.get("file_path", "")
+            metadata["duplicate_count"] = len(sources)
+            metadata["duplicate_sources"] = "; ".join(sorted(set(sources) - {own}))
+        return {**d, "metadata": metadata}
+
+    def dedup_delta(self, delta_files: list[dict]) -> tuple[list[dict], int, int]:
+        """
+        Return a copy of the delta entries (see `chatdku.ingestion.node_delta`)
+        without the upserts that duplicate a kept chunk, the number of upserts
+        dropped and the number of chunks admitted again.
+
+        A chunk dropped earlier is admitted again once the chunk it
+        duplicated is removed or modified, unless it duplicates another
+        chunk. Kept chunks whose duplicates changed are upserted again with
+        `duplicate_count` and `duplicate_sources`. Chunks of unchanged files
+        are returned in entries with the change "duplicates".
+        """
+        self._db.execute("BEGIN")
+        changed = {
+            self._shard(e["file_path"]) for e in delta_files if e["change"] != "events"
+        }
+        on_disk = self._disk_shards()
+        indexed = dict(self._db.execute("SELECT shard, mtime_ns FROM shards"))
+        stale = {
+            shard
+            for shard in on_disk.keys() | indexed.keys()
+            if shard not in changed and on_disk.get(shard) != indexed.get(shard)
+        }
+        self._pending = changed | stale
+
+        touched: set[str] = set()
+        for shard in sorted(self._pending):
+            self._remove(shard, touched)
+        orphans = self._db.execute(
+            "SELECT c.node_id, c.shard, c.file_path, c.grp, c.exact, c.signature"
+            " FROM chunks c LEFT JOIN chunks h ON h.node_id = c.canonical"
+            " WHERE c.canonical IS NOT NULL AND h.node_id IS NULL"
+            " ORDER BY c.rowid"
+        ).fetchall()
+        self._db.executemany(
+            "DELETE FROM chunks WHERE node_id = ?", [(row[0],) for row in orphans]
+        )
+
+        # Shards changed behind the index, or not indexed yet, are taken as
+        # they were loaded: their duplicates are only left out from now on
+        for shard in sorted(stale & on_disk.keys()):
+            for d in self._read(shard):
+                metadata = d.get("metadata") or {}
+                canonical = self._add(
+                    d["id_"], shard, metadata.get("file_path", ""), *self._keys(d)
+                )
+                if canonical is not None:
+                    touched.add(canonical)
+
+        # The new chunks before the orphans, so that a modified file keeps
+        # its chunks and their copies elsewhere stay dropped
+        deduplicated, dropped = [], 0
+        upserted: dict[str, tuple[int, int]] = {}
+        for entry in delta_files:
+            if entry["change"] == "events":
+                deduplicated.append(entry)
+                continue
+            shard = self._shard(entry["file_path"])
+            upserts = []
+            for d in entry["upserts"]:
+                metadata = d.get("metadata") or {}
+                canonical = self._add(
+                    d["id_"], shard, metadata.get("file_path", ""), *self._keys(d)
+                )
+                if canonical is None:
+                    upserted[d["id_"]] = (len(deduplicated), len(upserts))
+                    upserts.append(d)
+                else:
+                    touched.add(canonical)
+                    dropped += 1
+            deduplicated.append({**entry, "upserts": upserts})
+
+        readmitted = set()
+        for row in orphans:
+            canonical = self._add(*row)
+            if canonical is None:
+                readmitted.add(row[0])
+            else:
+                touched.add(canonical)
+
+        # Upsert the kept chunks whose duplicates changed, and the readmitted
+        refresh: dict[str, set[str]] = defaultdict(set)
+        for node_id in sorted(touched | readmitted):
+            row = self._db.execute(
+                "SELECT shard FROM chunks WHERE node_id = ? AND canonical IS NULL",
+                (node_id,),
+            ).fetchone()
+            if row is None:
+                continue
+            if node_id in upserted:
+                i, j = upserted[node_id]
+                upserts = deduplicated[i]["upserts"]
+                upserts[j] = self._with_duplicates(upserts[j])
+            else:
+                refresh[row[0]].add(node_id)
+        for shard, node_ids in sorted(refresh.items()):
+            nodes = [self._with_duplicates(d) for d in self._read(shard, node_ids)]
+            if nodes:
+                file_path = nodes[0]["metadata"].get("file_path", "")
+                deduplicated.append(
+                    {
+                        "file_path": os.path.abspath(file_path),
+                        "change": "duplicates",
+                        "doc_id": None,
+                        "deletes": [],
+                        "upserts": nodes,
+                    }
+                )
+        return deduplicated, dropped, len(readmitted)
+
+    def commit(self) -> None:
+        """Record the shards written for the delta and end the transaction."""
+        on_disk = self._disk_shards()
+        self._db.executemany(
+            "INSERT OR REPLACE INTO shards VALUES (?, ?)",
+            [(shard, on_disk[shard]) for shard in self._pending if shard in on_disk],
+        )
+        self._db.execute("COMMIT")
+        self._pending = set()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Collapse near-duplicate chunks of a node store."
+    )
+    parser.add_argument("--nodes_path", type=str, required=True)
+    parser.add_argument("--output_path", type=str, required=True)
+    parser.add_argument(
+        "--threshold",
+        type=float,
+        default=0.85,
+        help="Estimated Jaccard similarity to count as a duplicate.",
+    )
+    args = parser.parse_args()
+
+    report = dedup_store(args.nodes_path, args.output_path, args.threshold)
+    print(json.dumps(report, indent=2))
@@ -0,0 +1,180 @@
+"""embedding_cache.py
+
+Disk-backed embedding cache shared by the Redis, Chroma and Postgres loaders.
+
+Embeddings are keyed by (model name, sha256 of the embedded text), so a chunk
+is sent to TEI once no matter which loader sees it first, and rebuilding a
+store from an unchanged corpus makes no TEI calls.
+
+Layout, one directory per model under `config.embedding_cache`:
+
+    embedding_cache/BAAI__bge-m3/
+        vectors.f32     # float32 rows, appended, read through np.memmap
+        index.sqlite    # text_hash -> row, and the embedding dimension
+
+Writers take the SQLite write lock before appending rows, so several loaders
+can share the cache at the same time. An instance can be shared by threads;
+`embed_fn` runs outside its lock, so concurrent misses are embedded in
+parallel.
+"""
+
+import hashlib
+import os
+import sqlite3
+import threading
+from typing import Callable, Sequence
+
+import numpy as np
+
+from chatdku.config import config
+
+_SQLITE_MAX_VARS = 500
+
+
+def _text_hash(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+class EmbeddingCache:
+    def __init__(self, cache_dir: str, model_name: str):
+        self.model_name = model_name
+        self.cache_dir = os.path.join(cache_dir, model_name.replace("/", "__"))
+        os.makedirs(self.cache_dir, exist_ok=True)
+
+        self.vectors_path = os.path.join(self.cache_dir, "vectors.f32")
+        self._index = sqlite3.connect(
+            os.path.join(self.cache_dir, "index.sqlite"),
+            timeout=60,
+            isolation_level=None,  # Transactions are managed explicitly
+            check_same_thread=False,  # Guarded by self._lock
+        )
+        self._lock = threading.Lock()
+        self._index.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS embeddings (
+                text_hash TEXT PRIMARY KEY,
+                row       INTEGER NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS meta (
+                key   TEXT PRIMARY KEY,
+                value TEXT NOT NULL
+            );
+            """
+        )
+        self._vectors = None
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def dim(self) -> int | None:
+        row = self._index.execute("SELECT value FROM meta WHERE key = 'dim'").fetchone()
+        return int(row[0]) if row else None
+
+    def _rows(self, max_row: int) -> np.ndarray:
+        """Memory-map the vectors file, remapping if it grew past `max_row`."""
+        if self._vectors is None or self._vectors.shape[0] <= max_row:
+            self._vectors = np.memmap(
+                self.vectors_path, dtype=np.float32, mode="r"
+            ).reshape(-1, self.dim)
+        return self._vectors
+
+    def get_many(self, texts: Sequence[str]) -> list[list[float] | None]:
+        """Cached embedding of each text, or None if it is not cached."""
+        with self._lock:
+            return self._get_many(texts)
+
+    def put_many(self, texts: Sequence[str], vectors) -> None:
+        with self._lock:
+            self._put_many(texts, vectors)
+
+    def _get_many(self, texts: Sequence[str]) -> list[list[float] | None]:
+        hashes = [_text_hash(t) for t in texts]
+        found = {}
+        for start in range(0, len(hashes), _SQLITE_MAX_VARS):
+            chunk = hashes[start : start + _SQLITE_MAX_VARS]
+            found.update(
+                self._index.execute(
+                    "SELECT text_hash, row FROM embeddings WHERE text_hash IN "
+                    f"({','.join('?' * len(chunk))})",
+                    chunk,
+                ).fetchall()
+            )
+        if not found:
+            return [None] * len(texts)
+
+        vectors = self._rows(max(found.values()))
+        return [vectors[found[h]].tolist() if h in found else None for h in hashes]
+
+    def _put_many(self, texts: Sequence[str], vectors) -> None:
+        vectors = np.asarray(vectors, dtype=np.float32)
+        if vectors.ndim != 2 or vectors.shape[0] != len(texts):
+            raise ValueError(
+                f"Expected {len(texts)} embeddings, got an array of {vectors.shape}"
+            )
+
+        self._index.execute("BEGIN IMMEDIATE")
+        try:
+            dim = self.dim
+            if dim is None:
+                dim = vectors.shape[1]
+                self._index.execute(
+                    "INSERT INTO meta (key, value) VALUES ('dim', ?)", (str(dim),)
+                )
+            elif vectors.shape[1] != dim:
+                raise ValueError(
+                    f"Embedding cache for {self.model_name} has dim {dim}, "
+                    f"got {vectors.shape[1]}"
+                )
+
+            # Rows of a writer that died before committing stay in the file
+            # but no index entry refers to them. Only a partial last row is
+            # overwritten.
+            size = (
+                os.path.getsize(self.vectors_path)
+                if os.path.exists(self.vectors_path)
+                else 0
+            )
+            first_row = size // (dim * 4)
+            with open(self.vectors_path, "ab" if size == 0 else "r+b") as f:
+                f.seek(first_row * dim * 4)
+                f.write(vectors.tobytes())
+                f.truncate()
+
+            self._index.executemany(
+                "INSERT OR IGNORE INTO embeddings (text_hash, row) VALUES (?, ?)",
+                [(_text_hash(t), first_row + i) for i, t in enumerate(texts)],
+            )
+            self._index.execute("COMMIT")
+        except BaseException:
+            self._index.execute("ROLLBACK")
+            raise
+
+    def embed(
+        self,
+        texts: Sequence[str],
+        embed_fn: Callable[[list[str]], Sequence[Sequence[float]]],
+    ) -> list[list[float]]:
+        """
+        Embeddings of `texts`, calling `embed_fn` only for the texts that are
+        not cached yet (each distinct text once).
+        """
+        embeddings = self.get_many(texts)
+        missing = list(dict.fromkeys(t for t, e in zip(texts, embeddings) if e is None))
+        with self._lock:
+            self.hits += len(texts) - sum(e is None for e in embeddings)
+            self.misses += len(missing)
+        if not missing:
+            return embeddings
+
+        new = embed_fn(missing)
+        self.put_many(missing, new)
+        by_text = dict(zip(missing, np.asarray(new, dtype=np.float32).tolist()))
+        return [e if e is not None else by_text[t] for t, e in zip(texts, embeddings)]
+
+    def stats(self) -> str:
+        return f"embedding cache: {self.hits} hits, {self.misses} TEI embeddings"
+
+
+def get_embedding_cache(model_name: str | None = None) -> EmbeddingCache:
+    """The cache of `model_name` (default: config.embedding)."""
+    return EmbeddingCache(config.embedding_cache, model_name or config.embedding)
@@ -8,9 +8,13 @@ from datetime import datetime, date, timedelta
 from bs4 import BeautifulSoup
 import psycopg2
 from psycopg2.extras import execute_values
+from redis import Redis
 
 DATA_ROOT = "/datapool/chat_dku_advising/event_homepage"
 DATABASE_URL = os.getenv("PG_INGEST_URI", "")
+# Read by chat/weekly_events.py in the Django app, which caches the events
+# per version
+EVENTS_VERSION_KEY = "weekly_events:version"
 
 
 def get_current_week_range():
@@ -157,6 +161,20 @@ def extract_events_from_html(html_path):
         })
     return events
 
+
+def bump_events_version():
+    """Invalidate the cached weekly events served by the Django app."""
+    r = Redis(
+        host=os.getenv("REDIS_HOST"),
+        port=6379,
+        username="default",
+        password=os.getenv("REDIS_PASSWORD"),
+        db=0,
+    )
+    version = r.incr(EVENTS_VERSION_KEY)
+    print(f"Weekly events cache version is now {version}")
+
+
 def main():
     week_start, week_end = get_current_week_range()
     print(f"Current week range: {week_start} to {week_end}")
@@ -206,6 +224,7 @@ def main():
         execute_values(cur, insert_sql, values)
         conn.commit()
         print(f"Successfully inserted {len(values)} events into the weekly_events table")
+        bump_events_version()
     else:
         print("No events were found this week")
 
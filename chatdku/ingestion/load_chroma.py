@@ -2,7 +2,9 @@
 
 # import os
 import argparse
-import json
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from time import perf_counter
 
 import chromadb
 from chromadb.utils.embedding_functions import HuggingFaceEmbeddingServer
@@ -12,10 +14,13 @@ from datetime import datetime, timezone
 # from llama_index.core import Settings
 # from llama_index.vector_stores.chroma import ChromaVectorStore
 # from llama_index.core.ingestion import IngestionPipeline
-from llama_index.core.schema import TextNode
 
 # from chatdku.setup import setup
 from chatdku.config import config
+from chatdku.ingestion.corpus_version import bump_corpus_version
+from chatdku.ingestion.embedding_cache import get_embedding_cache
+from chatdku.ingestion.node_delta import load_delta, mark_applied
+from chatdku.ingestion.node_store import iter_node_batches
 
 
 def nodes_to_dicts(nodes: list):
@@ -35,23 +40,14 @@ def nodes_to_dicts(nodes: list):
 
 
 def cleanup_expired_chroma(collection):
-    results = collection.get(include=["metadatas"])
-    if not results or "metadatas" not in results:
-        return
-
-    now = datetime.now(timezone.utc)
-    expired_ids = []
-
-    for _id, meta in zip(results["ids"], results["metadatas"]):
-        expire_at = meta.get("expire_at")
-        if not expire_at:
-            continue
-        try:
-            exp_time = datetime.fromisoformat(expire_at.replace("Z", "+00:00"))
-            if exp_time < now:
-                expired_ids.append(_id)
-        except:
-            continue
+    """
+    Delete expired events. Chroma's `where` only compares numbers, so this
+    filters on `expire_at_ts` (set by `normalize_metadata`) on the server
+    and fetches only the matching ids.
+    """
+    now = datetime.now(timezone.utc).timestamp()
+    expired = collection.get(where={"expire_at_ts": {"$lt": now}}, include=[])
+    expired_ids = expired["ids"] if expired else []
 
     if expired_ids:
         print(f"Deleting {len(expired_ids)} expired documents from Chroma")
@@ -69,14 +65,58 @@ def normalize_metadata(meta: dict):
             clean[k] = v
         else:
             clean[k] = str(v)
+
+    expire_at = meta.get("expire_at")
+    if expire_at:
+        try:
+            clean["expire_at_ts"] = datetime.fromisoformat(
+                expire_at.replace("Z", "+00:00")
+            ).timestamp()
+        except ValueError:
+            pass
     return clean
 
 
+def _batched(node_batches, batch_size):
+    """Re-chunk the node store batches into `batch_size` valid nodes each."""
+    batch = []
+    for node_batch in node_batches:
+        for n in node_batch:
+            if not n.text or not isinstance(n.text, str):
+                continue
+            n.metadata = normalize_metadata(n.metadata)
+            batch.append(n)
+            if len(batch) >= batch_size:
+                yield batch
+                batch = []
+    if batch:
+        yield batch
+
+
+def _upload(collection, nodes_buffer, embed) -> int:
+    nodes_buffer_dict = nodes_to_dicts(nodes_buffer)
+    try:
+        # Upsert, so that applying a delta again does not keep stale chunks
+        collection.upsert(
+            ids=nodes_buffer_dict["ids"],
+            documents=nodes_buffer_dict["texts"],
+            embeddings=embed(nodes_buffer_dict["texts"]),
+            metadatas=nodes_buffer_dict["metadatas"],
+        )
+    except Exception:
+        for metadata in nodes_buffer_dict["metadatas"]:
+            print(metadata)
+        raise
+    return len(nodes_buffer_dict["ids"])
+
+
 def load_chroma(
     collection: str = None,
     nodes_path=None,
     reset: bool = False,
     buffer_size: int = 25,
+    delta_path=None,
+    upload_workers: int = 4,
 ):
     """
     Populate the ChromaDB. If you run this from the terminal it will re-populate
@@ -89,17 +129,25 @@ def load_chroma(
     collection: You can set this to any other name to create another collection in chromaDB but
         for Redis.
     reset: Whether to overwrite the data already on the DB.
+    delta_path: A delta.json from update_data.py. Deletes the nodes of changed
+        files and only adds their new nodes.
+    buffer_size: Nodes per embedding request and `collection.add` call.
+    upload_workers: Batches embedded and uploaded concurrently.
     """
-    if nodes_path is None:
-        nodes_path = config.nodes_path
+    if reset and delta_path is not None:
+        raise ValueError("A delta is applied on top of the collection, not after reset")
 
-    print("Nodes path:", nodes_path)
-    with open(nodes_path, "r") as f:
-        datas = json.load(f)
-    nodes = [TextNode.from_dict(data) for data in datas]
+    delta = None
+    if delta_path is not None:
+        print("Delta path:", delta_path)
+        delta = load_delta(delta_path)
+        node_batches = [delta.upserts]
+    else:
+        if nodes_path is None:
+            nodes_path = config.nodes_path
 
-    for n in nodes:
-        n.metadata = normalize_metadata(n.metadata)
+        print("Nodes path:", nodes_path)
+        node_batches = iter_node_batches(nodes_path)
 
     if collection is None:
         collection = config.user_uploads_collection
@@ -115,68 +163,64 @@ def load_chroma(
                     collection
                 )  # Clear previously stored data in vector database
 
+    embedding_function = HuggingFaceEmbeddingServer(
+        url=f"{config.tei_url}/{config.embedding}/embed"
+    )
     collection = chroma_db.get_or_create_collection(
         name=collection,
-        embedding_function=HuggingFaceEmbeddingServer(
-            url=f"{config.tei_url}/{config.embedding}/embed"
-        ),
+        embedding_function=embedding_function,
         metadata={
             "hnsw:batch_size": 512,
             "hnsw:sync_threshold": 1024,
         },
     )
     cleanup_expired_chroma(collection)
+    if delta is not None and delta.deletes:
+        print(f"Deleting {len(delta.deletes)} nodes of changed files from Chroma")
+        collection.delete(ids=delta.deletes)
+
+    # Embeddings are precomputed through the shared cache instead of letting
+    # Chroma call TEI on every add.
+    embedding_cache = get_embedding_cache()
+
+    def embed(texts):
+        return embedding_cache.embed(texts, embedding_function)
+
+    # Workers embed and upload whole batches. At most 2 * upload_workers
+    # batches are pending, so only a few batches of the node store are in
+    # memory at a time.
+    uploaded = batches = 0
+    t0 = perf_counter()
+    pending: deque[Future] = deque()
+
+    def collect():
+        nonlocal uploaded, batches
+        uploaded += pending.popleft().result()
+        batches += 1
+        if batches % 40 == 0:
+            print(
+                f"Uploaded {uploaded} nodes "
+                f"({uploaded / (perf_counter() - t0):.1f} nodes/s)"
+            )
 
-    nodes_buffer = []
-    for i, node in enumerate(nodes):
-        nodes_buffer.append(node)
-
-        if i % buffer_size == 0:
-            nodes_buffer_dict = nodes_to_dicts(nodes_buffer)
-            try:
-                collection.add(
-                    ids=nodes_buffer_dict["ids"],
-                    documents=nodes_buffer_dict["texts"],
-                    metadatas=nodes_buffer_dict["metadatas"],
-                )
-            except Exception as e:
-                for i in nodes_buffer_dict["metadatas"]:
-                    print(i)
-                raise e
-                for node in nodes_buffer:
-                    node_dict = nodes_to_dicts(node)
-                    try:
-                        collection.add(
-                            ids=node_dict["ids"],
-                            documents=node_dict["texts"],
-                            metadatas=node_dict["metadatas"],
-                        )
-
-                    except Exception as e:
-                        raise e
-            nodes_buffer = []
-
-    if nodes_buffer:
-        nodes_buffer_dict = nodes_to_dicts(nodes_buffer)
+    with ThreadPoolExecutor(max_workers=upload_workers) as pool:
         try:
-            collection.add(
-                ids=nodes_buffer_dict["ids"],
-                documents=nodes_buffer_dict["texts"],
-                metadatas=nodes_buffer_dict["metadatas"],
-            )
-        except Exception as e:
-            raise e
-            for node in nodes_buffer:
-                node_dict = nodes_to_dicts(node)
-                try:
-                    collection.add(
-                        ids=node_dict["ids"],
-                        documents=node_dict["texts"],
-                        metadatas=node_dict["metadatas"],
-                    )
-
-                except Exception as e:
-                    raise e
+            for nodes_buffer in _batched(node_batches, buffer_size):
+                if len(pending) >= 2 * upload_workers:
+                    collect()
+                pending.append(pool.submit(_upload, collection, nodes_buffer, embed))
+            while pending:
+                collect()
+        except BaseException:
+            for future in pending:
+                future.cancel()
+            raise
+
+    elapsed = perf_counter() - t0
+    print(
+        f"Uploaded {uploaded} nodes in {elapsed:.1f}s "
+        f"({uploaded / elapsed if elapsed else 0.0:.1f} nodes/s)"
+    )
 
     # NOTE: Currently, LlamaIndex has bug with using both caching and docstore.
     # I am using only caching here and there is not much need for attaching a
@@ -195,6 +239,12 @@ def load_chroma(
     #     documents=documents, num_workers=pipeline_workers, show_progress=True
     # )
     # pipeline.persist(pipeline_cache_path)
+    print(embedding_cache.stats())
+    if delta is not None:
+        mark_applied(delta_path, "chroma", delta.created_at)
+    # Cached answers are only built from the public collection
+    if collection.name == config.chroma_collection:
+        bump_corpus_version()
     print("Chroma load done!")
     #
     # docstore = SimpleDocumentStore()
@@ -203,11 +253,14 @@ def load_chroma(
     # print("docstore over")
 
 
-def main(nodes_path=None, collection_name=None):
+def main(nodes_path=None, collection_name=None, delta_path=None, upload_workers=4):
     load_chroma(
-        reset=True,
+        # A delta is applied on top of the existing collection
+        reset=delta_path is None,
         nodes_path=nodes_path,
         collection=collection_name,
+        delta_path=delta_path,
+        upload_workers=upload_workers,
     )
 
 
@@ -219,7 +272,7 @@ if __name__ == "__main__":
         "--nodes_path",
         type=str,
         default=config.nodes_path,
-        help="The directory containing the data",
+        help="Node store directory or nodes.json file",
     )
     parser.add_argument(
         "--collection_name",
@@ -227,6 +280,18 @@ if __name__ == "__main__":
         default=config.chroma_collection,
         help="Name of the chroma collection.",
     )
+    parser.add_argument(
+        "--delta_path",
+        type=str,
+        default=None,
+        help="Apply a delta.json from update_data.py instead of nodes_path.",
+    )
+    parser.add_argument(
+        "--upload_workers",
+        type=int,
+        default=4,
+        help="Batches embedded and uploaded concurrently.",
+    )
     args = parser.parse_args()
 
-    main(args.nodes_path, args.collection_name)
+    main(args.nodes_path, args.collection_name, args.delta_path, args.upload_workers)
@@ -16,19 +16,29 @@ into each node's metadata:
     user_id      : only meaningful when access_type == 'private'
 """
 
+import io
 import os
 import json
+import struct
 import argparse
 import logging
-from typing import Optional
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from time import perf_counter
+from typing import Iterable, Optional
 
+import numpy as np
 import psycopg2
-from psycopg2.extras import execute_values, Json
+from psycopg2.extras import execute_values
 from llama_index.core.schema import TextNode
 from llama_index.core import Settings
 
 from chatdku.setup import setup
 from chatdku.config import config
+from chatdku.ingestion.corpus_version import bump_corpus_version
+from chatdku.ingestion.embedding_cache import get_embedding_cache
+from chatdku.ingestion.node_delta import load_delta, mark_applied
+from chatdku.ingestion.node_store import iter_node_batches
 
 logger = logging.getLogger(__name__)
 
@@ -195,12 +205,51 @@ CREATE INDEX IF NOT EXISTS document_access_filter_idx
     ON document_access (source_type, access_type, role, organization, user_id);
 """
 
-# NOTE: No ANN vector index is created intentionally.
+# NOTE: No ANN vector index is created by default.
 # Sequential scan gives 100 % recall and is fast enough for thousands of rows.
-# Add an HNSW index here once the table grows beyond ~50 k rows:
-#
-#   CREATE INDEX {table}_embedding_hnsw_idx
-#       ON {table} USING hnsw (embedding vector_cosine_ops);
+# Pass hnsw=True (--hnsw) once the table grows beyond ~50 k rows.
+HNSW_INDEX_DDL = """
+CREATE INDEX IF NOT EXISTS {table_name}_embedding_hnsw_idx
+    ON {table_name} USING hnsw (embedding vector_cosine_ops);
+"""
+
+GIN_INDEX_DDL = """
+CREATE INDEX IF NOT EXISTS {table_name}_text_search_idx
+    ON {table_name} USING GIN (text_search);
+"""
+
+# Rows are bulk-loaded into a session-local staging table with binary COPY,
+# then merged into the partitioned table with a single upsert.
+STAGING_DDL = """
+CREATE TEMP TABLE IF NOT EXISTS {table_name}_staging (
+    id            TEXT,
+    doc_id        TEXT,
+    source_type   TEXT,
+    text          TEXT,
+    embedding     vector(1024),
+    file_name     TEXT,
+    user_id       TEXT,
+    groups        TEXT,
+    metadata      JSONB
+) ON COMMIT DELETE ROWS;
+"""
+
+COLUMNS = (
+    "id, doc_id, source_type, text, embedding, file_name, user_id, groups, metadata"
+)
+
+MERGE_SQL = """
+INSERT INTO {table_name} ({columns})
+SELECT DISTINCT ON (id, source_type) {columns} FROM {table_name}_staging
+ON CONFLICT (id, source_type) DO UPDATE SET
+    doc_id    = EXCLUDED.doc_id,
+    text      = EXCLUDED.text,
+    embedding = EXCLUDED.embedding,
+    file_name = EXCLUDED.file_name,
+    user_id   = EXCLUDED.user_id,
+    groups    = EXCLUDED.groups,
+    metadata  = EXCLUDED.metadata
+"""
 
 
 # ---------------------------------------------------------------------------
@@ -212,9 +261,14 @@ def _get_connection() -> psycopg2.extensions.connection:
     return psycopg2.connect(config.pg_ingest_uri)
 
 
-def _prepare_batch(valid_pairs, embed_model):
+def _prepare_batch(valid_pairs, embed_model, embedding_cache=None):
     valid_nodes, texts = zip(*valid_pairs)
-    embeddings = _embed_with_retry(embed_model, list(texts))
+    if embedding_cache is None:
+        embeddings = _embed_with_retry(embed_model, list(texts))
+    else:
+        embeddings = embedding_cache.embed(
+            list(texts), lambda missing: _embed_with_retry(embed_model, missing)
+        )
 
     rows = []
     acl_rows: set[tuple[str, str, str, str | None, str | None, str | None]] = set()
@@ -264,87 +318,183 @@ def _prepare_batch(valid_pairs, embed_model):
                 file_name,
                 owner_user_id,
                 groups_val,
-                Json(
-                    {
-                        k: _strip_nul(v) if isinstance(v, str) else v
-                        for k, v in rest.items()
-                    }
-                ),
+                {
+                    k: _strip_nul(v) if isinstance(v, str) else v
+                    for k, v in rest.items()
+                },
             )
         )
     return rows, acl_rows
 
 
+def _copy_binary(rows: list[tuple]) -> io.BytesIO:
+    """
+    Encode rows from `_prepare_batch` in PostgreSQL's binary COPY format, so
+    the embeddings are sent as float4 arrays instead of being printed and
+    parsed as text.
+    """
+    buf = io.BytesIO()
+    buf.write(b"PGCOPY\n\xff\r\n\x00" + struct.pack("!ii", 0, 0))
+    for row in rows:
+        buf.write(struct.pack("!h", len(row)))
+        *head, embedding, file_name, user_id, groups, metadata = row
+        for value in head:
+            _write_text(buf, value)
+        # pgvector's binary format: dim, unused, float4 values
+        vec = np.asarray(embedding, dtype=">f4")
+        buf.write(struct.pack("!ihh", 4 + vec.nbytes, len(vec), 0))
+        buf.write(vec.tobytes())
+        for value in (file_name, user_id, groups):
+            _write_text(buf, value)
+        # jsonb's binary format: version 1, then the JSON text
+        _write_bytes(buf, b"\x01" + json.dumps(metadata).encode())
+    buf.write(struct.pack("!h", -1))
+    buf.seek(0)
+    return buf
+
+
+def _write_bytes(buf: io.BytesIO, data: bytes) -> None:
+    buf.write(struct.pack("!i", len(data)))
+    buf.write(data)
+
+
+def _write_text(buf: io.BytesIO, value) -> None:
+    if value is None:
+        buf.write(struct.pack("!i", -1))
+    else:
+        _write_bytes(buf, value.encode())
+
+
+def _write_rows(conn, cur, rows, acl_rows, *, target_table_name: str) -> None:
+    """COPY rows into the staging table, merge them and commit."""
+    cur.execute(STAGING_DDL.format(table_name=target_table_name))
+    cur.copy_expert(
+        f"COPY {target_table_name}_staging ({COLUMNS}) FROM STDIN WITH (FORMAT binary)",
+        _copy_binary(rows),
+    )
+    cur.execute(MERGE_SQL.format(table_name=target_table_name, columns=COLUMNS))
+
+    if acl_rows:
+        execute_values(
+            cur,
+            """
+            INSERT INTO document_access
+                (doc_id, source_type, access_type, role, organization, user_id)
+            VALUES %s
+            ON CONFLICT DO NOTHING
+            """,
+            list(acl_rows),
+            template="(%s, %s, %s, %s, %s, %s)",
+        )
+
+    # Also empties the staging table (ON COMMIT DELETE ROWS)
+    conn.commit()
+
+
+def _embed_batches(nodes: Iterable[TextNode], batch_size: int):
+    """Yield lists of (node, clean text) with at most `batch_size` entries."""
+    batch = []
+    for node in nodes:
+        if not _is_valid_text(node.text):
+            logger.warning("Skipping node %s with empty/invalid text.", node.node_id)
+            continue
+        batch.append((node, _strip_nul(node.text)))
+        if len(batch) >= batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
 def _insert_batch(
     conn,
     cur,
-    batch_nodes: list[TextNode],
+    batch_nodes: Iterable[TextNode],
     *,
     target_table_name: str,
     embed_model,
     batch_size: int = 25,
-) -> None:
+    embedding_cache=None,
+    embed_workers: int = 4,
+    write_batch_size: int = 500,
+) -> int:
+    """
+    Embed and insert nodes as a pipeline: `embed_workers` threads embed
+    batches of `batch_size` texts while this thread writes the finished ones
+    with `_write_rows` every `write_batch_size` rows. At most
+    2 * `embed_workers` embedded batches wait for the writer, so `batch_nodes`
+    can be a stream of any length.
 
-    if not batch_nodes:
+    Returns the number of rows written.
+    """
+    written = 0
+    rows: list[tuple] = []
+    acl_rows: set[tuple] = set()
+    t0 = perf_counter()
+
+    def flush():
+        nonlocal written, rows, acl_rows
+        if not rows:
+            return
+        _write_rows(conn, cur, rows, acl_rows, target_table_name=target_table_name)
+        written += len(rows)
+        logger.info(
+            "Inserted %d rows into %s (%.1f rows/s)",
+            written,
+            target_table_name,
+            written / (perf_counter() - t0),
+        )
+        rows, acl_rows = [], set()
+
+    pending: deque[Future] = deque()
+
+    def collect():
+        batch_rows, batch_acl_rows = pending.popleft().result()
+        rows.extend(batch_rows)
+        acl_rows.update(batch_acl_rows)
+        if len(rows) >= write_batch_size:
+            flush()
+
+    with ThreadPoolExecutor(
+        max_workers=embed_workers, thread_name_prefix="pg-embed"
+    ) as pool:
+        try:
+            for valid_pairs in _embed_batches(batch_nodes, batch_size):
+                if len(pending) >= 2 * embed_workers:
+                    collect()
+                pending.append(
+                    pool.submit(
+                        _prepare_batch, valid_pairs, embed_model, embedding_cache
+                    )
+                )
+            while pending:
+                collect()
+        except BaseException:
+            for future in pending:
+                future.cancel()
+            raise
+    flush()
+
+    if not written:
         logger.info("No nodes to insert for table %s", target_table_name)
-        return
-
-    # ---- Embed + insert in batches -----------------------------------
-    total = len(batch_nodes)
-    for batch_start in range(0, total, batch_size):
-        batch = batch_nodes[batch_start : batch_start + batch_size]
-
-        valid_pairs = [(n, _strip_nul(n.text)) for n in batch if _is_valid_text(n.text)]
-        skipped = len(batch) - len(valid_pairs)
-        if skipped:
-            logger.warning(
-                "Skipping %d node(s) with empty/invalid text in this batch.", skipped
-            )
-        if not valid_pairs:
-            continue
+    return written
 
-        rows, acl_rows = _prepare_batch(valid_pairs, embed_model=embed_model)
 
-        execute_values(
-            cur,
-            f"""
-            INSERT INTO {target_table_name}
-                (id, doc_id, source_type, text, embedding, file_name, user_id, groups, metadata)
-            VALUES %s
-            ON CONFLICT (id, source_type) DO UPDATE SET
-                doc_id    = EXCLUDED.doc_id,
-                text      = EXCLUDED.text,
-                embedding = EXCLUDED.embedding,
-                file_name = EXCLUDED.file_name,
-                user_id   = EXCLUDED.user_id,
-                groups    = EXCLUDED.groups,
-                metadata  = EXCLUDED.metadata
-            """,
-            rows,
-            template="(%s, %s, %s, %s, %s::vector, %s, %s, %s, %s)",
+def _delete_nodes(
+    cur, *, target_table_name: str, node_ids: list[str], doc_ids: list[str]
+) -> None:
+    """Delete the chunks of changed files and their ACL rows before re-inserting."""
+    if node_ids:
+        cur.execute(
+            f"DELETE FROM {target_table_name} WHERE id = ANY(%s)",
+            ([_strip_nul(i) for i in node_ids],),
         )
-
-        if acl_rows:
-            acl_rows_list = list(acl_rows)
-            execute_values(
-                cur,
-                """
-                INSERT INTO document_access
-                    (doc_id, source_type, access_type, role, organization, user_id)
-                VALUES %s
-                ON CONFLICT DO NOTHING
-                """,
-                acl_rows_list,
-                template="(%s, %s, %s, %s, %s, %s)",
-            )
-
-        conn.commit()
-        logger.info(
-            "Inserted batch %d–%d / %d into %s",
-            batch_start + 1,
-            min(batch_start + batch_size, total),
-            total,
-            target_table_name,
+        logger.info("Deleted %d node(s) from %s", cur.rowcount, target_table_name)
+    if doc_ids:
+        # Upserted chunks re-insert the ACL rows of modified files.
+        cur.execute(
+            "DELETE FROM document_access WHERE doc_id = ANY(%s)",
+            (doc_ids,),
         )
 
 
@@ -354,6 +504,12 @@ def load_postgres(
     table_name: Optional[str] = None,
     reset: bool = False,
     batch_size: int = 25,  # matches Chroma's buffer_size default; auto-halves on 413
+    delta_path: Optional[str] = None,
+    load_batch_size: int = 1000,
+    embed_workers: int = 4,
+    defer_indexes: bool = False,
+    hnsw: bool = False,
+    bump_version: bool = True,
 ) -> None:
     """
     Ingest TextNodes into PostgreSQL + pgvector.
@@ -361,40 +517,54 @@ def load_postgres(
     Parameters
     ----------
     nodes       : pre-built list of TextNode objects (optional).
-    nodes_path  : path to a nodes.json file (used when *nodes* is None).
+    nodes_path  : node store directory or legacy nodes.json file (used when
+                  *nodes* is None).
     table_name  : target table; falls back to config.postgres_table.
     reset       : if True, DROP and recreate the table before ingestion.
     batch_size  : texts per embedding request.  Defaults to 25 (same as the
                   legacy Chroma loader) to stay within TEI's payload limit.
                   Automatically halved on HTTP 413 / server error responses.
+    delta_path  : path to a delta.json from update_data.py.  Deletes the
+                  nodes of changed files and inserts only their new nodes
+                  instead of loading the whole node store.
+    load_batch_size : nodes read from the node store at a time.
+    embed_workers : concurrent embedding requests feeding the single writer.
+    defer_indexes : drop the GIN (and HNSW) index before loading and build
+                  it once afterwards.  Faster for full rebuilds, but keyword
+                  search is degraded while loading.
+    hnsw        : also build an HNSW index on the embeddings.
+    bump_version : increment the corpus version afterwards, which invalidates
+                  cached answers.  Off for private user uploads.
     """
+    if reset and delta_path is not None:
+        raise ValueError("A delta is applied on top of the table, not after reset")
+
     # ---- 1. Embeddings setup ------------------------------------------------
     setup(use_llm=False)
     embed_model = Settings.embed_model
+    embedding_cache = get_embedding_cache()
 
     # ---- 2. Load nodes ------------------------------------------------------
-    if nodes is None:
+    # Node batches are streamed from the node store, so memory stays bounded
+    # by load_batch_size rather than by the corpus size.
+    delta = None
+    if delta_path is not None:
+        logger.info("Applying delta from %s", delta_path)
+        delta = load_delta(delta_path)
+        node_batches = [delta.upserts]
+    elif nodes is not None:
+        node_batches = [nodes]
+    else:
         if nodes_path is None:
             nodes_path = config.nodes_path
         logger.info("Loading nodes from %s", nodes_path)
-        with open(nodes_path, "r") as fh:
-            datas = json.load(fh)
-        nodes = [TextNode.from_dict(d) for d in datas]
-
-    for node in nodes:
-        # Normalise file_name (strip extension) to match legacy behaviour
-        if "file_name" in node.metadata:
-            node.metadata["file_name"] = _clean_file_name(node.metadata["file_name"])
+        node_batches = iter_node_batches(nodes_path, load_batch_size)
 
     # table_name/event_table_name kept for CLI compatibility; loader inserts into chat_dku only.
     if table_name is None:
         table_name = getattr(config, "postgres_table", "chat_dku")
 
-    logger.info(
-        f"Target partitioned table: {table_name}  |  nodes: %d  |  reset: %s",
-        len(nodes),
-        reset,
-    )
+    logger.info(f"Target partitioned table: {table_name}  |  reset: %s", reset)
 
     # ---- 3. Database setup --------------------------------------------------
     conn = _get_connection()
@@ -407,22 +577,72 @@ def load_postgres(
 
     cur.execute(DDL.format(table_name=table_name))
 
+    if defer_indexes:
+        cur.execute(
+            f"DROP INDEX IF EXISTS {table_name}_text_search_idx,"
+            f" {table_name}_embedding_hnsw_idx;"
+        )
+    elif hnsw:
+        cur.execute(HNSW_INDEX_DDL.format(table_name=table_name))
+
+    if delta is not None:
+        _delete_nodes(
+            cur,
+            target_table_name=table_name,
+            node_ids=delta.deletes,
+            doc_ids=delta.doc_ids,
+        )
+
     conn.commit()
 
-    # ---- 4. Embed + insert in batches ---------------------------------------
-    _insert_batch(
+    # ---- 4. Embed + insert in a pipeline ------------------------------------
+    def normalized():
+        for batch_nodes in node_batches:
+            for node in batch_nodes:
+                # Normalise file_name (strip extension) to match legacy behaviour
+                if "file_name" in node.metadata:
+                    node.metadata["file_name"] = _clean_file_name(
+                        node.metadata["file_name"]
+                    )
+                yield node
+
+    t0 = perf_counter()
+    total = _insert_batch(
         conn,
         cur,
-        nodes,
+        normalized(),
         target_table_name=table_name,
         batch_size=batch_size,
         embed_model=embed_model,
+        embedding_cache=embedding_cache,
+        embed_workers=embed_workers,
+    )
+    load_s = perf_counter() - t0
+    logger.info(embedding_cache.stats())
+
+    if defer_indexes:
+        t_index0 = perf_counter()
+        cur.execute(GIN_INDEX_DDL.format(table_name=table_name))
+        if hnsw:
+            cur.execute(HNSW_INDEX_DDL.format(table_name=table_name))
+        conn.commit()
+        logger.info("Built indexes in %.1fs", perf_counter() - t_index0)
+
+    logger.info(
+        "PostgreSQL load done! %d rows in %.1fs (%.1f rows/s)",
+        total,
+        load_s,
+        total / load_s if load_s else 0.0,
     )
-    logger.info("PostgreSQL load done!")
 
     cur.close()
     conn.close()
 
+    if delta is not None:
+        mark_applied(delta_path, "postgres", delta.created_at)
+    if bump_version:
+        bump_corpus_version()
+
 
 # ---------------------------------------------------------------------------
 # CLI entry point
@@ -439,11 +659,23 @@ def _str2bool(val):
     raise ValueError(f"Cannot parse boolean from: {val!r}")
 
 
-def main(nodes_path=None, table_name=None, reset=False):
+def main(
+    nodes_path=None,
+    table_name=None,
+    reset=False,
+    delta_path=None,
+    embed_workers=4,
+    defer_indexes=False,
+    hnsw=False,
+):
     load_postgres(
         nodes_path=nodes_path,
         table_name=table_name,
         reset=reset,
+        delta_path=delta_path,
+        embed_workers=embed_workers,
+        defer_indexes=defer_indexes,
+        hnsw=hnsw,
     )
 
 
@@ -454,13 +686,13 @@ if __name__ == "__main__":
     )
 
     parser = argparse.ArgumentParser(
-        description="Ingest nodes.json into PostgreSQL + pgvector."
+        description="Ingest a node store into PostgreSQL + pgvector."
     )
     parser.add_argument(
         "--nodes_path",
         type=str,
         default=config.nodes_path,
-        help="Path to nodes.json (default: config.nodes_path)",
+        help="Node store directory or nodes.json (default: config.nodes_path)",
     )
     parser.add_argument(
         "--table_name",
@@ -474,5 +706,37 @@ if __name__ == "__main__":
         default=False,
         help="Drop and recreate the table before ingestion (default: False)",
     )
+    parser.add_argument(
+        "--delta_path",
+        type=str,
+        default=None,
+        help="Apply a delta.json from update_data.py instead of loading nodes_path",
+    )
+    parser.add_argument(
+        "--embed_workers",
+        type=int,
+        default=4,
+        help="Concurrent embedding requests (default: 4)",
+    )
+    parser.add_argument(
+        "--defer_indexes",
+        type=_str2bool,
+        default=False,
+        help="Build the GIN/HNSW indexes after the load (default: False)",
+    )
+    parser.add_argument(
+        "--hnsw",
+        type=_str2bool,
+        default=False,
+        help="Build an HNSW index on the embeddings (default: False)",
+    )
     args = parser.parse_args()
-    main(args.nodes_path, args.table_name, args.reset)
+    main(
+        args.nodes_path,
+        args.table_name,
+        args.reset,
+        args.delta_path,
+        args.embed_workers,
+        args.defer_indexes,
+        args.hnsw,
+    )
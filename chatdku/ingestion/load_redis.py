@@ -2,61 +2,87 @@
 
 import argparse
 import datetime
-import json
 import os
 
 ######
 from llama_index.core import Settings
-from llama_index.core.ingestion import IngestionPipeline
 from llama_index.core.schema import TextNode
 from llama_index.vector_stores.redis import RedisVectorStore
 from redis import Redis
 from redisvl.schema import IndexSchema
 
 from chatdku.config import config
+from chatdku.ingestion.corpus_version import bump_corpus_version
+from chatdku.ingestion.embedding_cache import get_embedding_cache
+from chatdku.ingestion.node_delta import load_delta, mark_applied
+from chatdku.ingestion.node_store import iter_node_batches
 from chatdku.setup import setup
 
 
-def cleanup_expired_events(redis_client, index_name):
-    """Delete expired event nodes from Redis index."""
-    now = (
-        datetime.datetime.now(datetime.timezone.utc).isoformat().replace("+00:00", "Z")
-    )
-
-    # RedisVectorStore key prefix: {index_name}_doc:{node_id}
-    prefix = f"{index_name}_doc"
-
-    keys = redis_client.keys(f"{prefix}:*")
-
-    deleted = 0
-    for k in keys:
-        data = redis_client.hgetall(k)
-        if not data:
-            continue
+def _is_expired_event(is_event, expire_at, now) -> bool:
+    # Booleans are stored as "true"/"false", older loads used "True"
+    if not is_event or is_event.decode().lower() != "true" or not expire_at:
+        return False
+    try:
+        expire = datetime.datetime.fromisoformat(
+            expire_at.decode().replace("Z", "+00:00")
+        )
+    except ValueError:
+        return False
+    return expire < now
 
-        metadata = {}
-        for kk, vv in data.items():
-            key_str = kk.decode() if isinstance(kk, bytes) else kk
 
-            # vector bytes 不要 decode
-            if key_str == "vector":
-                metadata[key_str] = vv
-                continue
+def cleanup_expired_events(redis_client, index_name, batch_size=1000):
+    """
+    Delete expired event nodes from Redis index.
 
-            # 普通字段正常 decode
-            try:
-                metadata[key_str] = vv.decode() if isinstance(vv, bytes) else vv
-            except UnicodeDecodeError:
-                # 跳过不可解码字段
-                continue
+    Walks the keys with SCAN instead of KEYS so Redis is never blocked, reads
+    only `is_event` and `expire_at` with pipelined HMGETs instead of pulling
+    every hash (including its vector), and removes the expired keys with
+    batched UNLINKs, which free the memory in the background.
+    """
+    now = datetime.datetime.now(datetime.timezone.utc)
 
-        if metadata.get("is_event") == "True":
-            expire_at = metadata.get("expire_at")
-            if expire_at and expire_at < now:
-                redis_client.delete(k)
-                deleted += 1
+    # RedisVectorStore key prefix: {index_name}_doc:{node_id}
+    prefix = f"{index_name}_doc"
 
-    print(f"[cleanup] Deleted {deleted} expired events")
+    scanned = deleted = 0
+    keys = []
+    for key in redis_client.scan_iter(match=f"{prefix}:*", count=batch_size):
+        keys.append(key)
+        if len(keys) >= batch_size:
+            deleted += _unlink_expired(redis_client, keys, now)
+            scanned += len(keys)
+            keys = []
+    if keys:
+        deleted += _unlink_expired(redis_client, keys, now)
+        scanned += len(keys)
+
+    print(f"[cleanup] Deleted {deleted} expired events ({scanned} keys scanned)")
+
+
+def _unlink_expired(redis_client, keys, now) -> int:
+    pipe = redis_client.pipeline(transaction=False)
+    for key in keys:
+        pipe.hmget(key, "is_event", "expire_at")
+    expired = [
+        key
+        for key, (is_event, expire_at) in zip(keys, pipe.execute())
+        if _is_expired_event(is_event, expire_at, now)
+    ]
+    if expired:
+        redis_client.unlink(*expired)
+    return len(expired)
+
+
+def delete_nodes(redis_client, index_name, node_ids, batch_size=500):
+    """Delete nodes by id, e.g. the old chunks of modified or removed files."""
+    prefix = f"{index_name}_doc"
+    deleted = 0
+    for start in range(0, len(node_ids), batch_size):
+        keys = [f"{prefix}:{i}" for i in node_ids[start : start + batch_size]]
+        deleted += redis_client.unlink(*keys)
+    print(f"[delta] Deleted {deleted} nodes")
 
 
 def clean_file_name(file_name: str) -> str:
@@ -67,9 +93,9 @@ def load_redis(
     nodes: list[TextNode] = None,
     nodes_path: list = None,
     index_name: str = None,
-    pipeline_workers: int = 1,
-    pipeline_cache_path: str = config.pipeline_cache,
     reset: bool = False,
+    delta_path: str = None,
+    load_batch_size: int = 1000,
 ):
     """
     Populate the Redis. If you run this from the terminal it will re-populate
@@ -82,29 +108,28 @@ def load_redis(
     index_name: You can set this to any other name to act as if creating
         another collection in chromaDB but for Redis.
     reset: Whether to overwrite the data on the existing DB.
+    delta_path: A delta.json from update_data.py. Deletes the nodes of
+        changed files and only embeds their new nodes.
+    load_batch_size: Nodes read from the node store and embedded at a time.
     """
 
+    if reset and delta_path is not None:
+        raise ValueError("A delta is applied on top of the index, not after reset")
+
     setup(use_llm=False)
 
-    if nodes is None:
+    delta = None
+    if delta_path is not None:
+        print("Delta path:", delta_path)
+        delta = load_delta(delta_path)
+        node_batches = [delta.upserts]
+    elif nodes is not None:
+        node_batches = [nodes]
+    else:
         if nodes_path is None:
             nodes_path = config.nodes_path
         print("Nodes path:", nodes_path)
-
-        with open(nodes_path, "r") as f:
-            datas = json.load(f)
-        nodes = [TextNode.from_dict(data) for data in datas]
-
-    for node in nodes:
-        file_name = node.metadata["file_name"]
-        node.metadata["file_name"] = clean_file_name(file_name)
-
-        # normalize boolean metadata → strings
-        for k, v in list(node.metadata.items()):
-            if isinstance(v, bool):
-                node.metadata[k] = "true" if v else "false"
-            if v is None:
-                node.metadata[k] = "None"
+        node_batches = iter_node_batches(nodes_path, load_batch_size)
 
     if index_name is None:
         index_name = config.index_name
@@ -154,29 +179,59 @@ def load_redis(
 
     if not reset:
         cleanup_expired_events(redis_client, index_name)
+        if delta is not None:
+            delete_nodes(redis_client, index_name, delta.deletes)
 
     vector_store = RedisVectorStore(
         redis_client=redis_client, schema=custom_schema, overwrite=reset
     )
-    pipeline = IngestionPipeline(
-        vector_store=vector_store, transformations=[Settings.embed_model]
-    )
-    if os.path.exists(pipeline_cache_path):
-        pipeline.load(pipeline_cache_path)
-    pipeline.run(nodes=nodes, num_workers=pipeline_workers, show_progress=True)
-
-    print("Redis load done!")
-
-
-def main(nodes_path, index_name, reset):
+    embedding_cache = get_embedding_cache()
+
+    total = 0
+    for batch in node_batches:
+        for node in batch:
+            file_name = node.metadata["file_name"]
+            node.metadata["file_name"] = clean_file_name(file_name)
+
+            # normalize boolean metadata → strings
+            for k, v in list(node.metadata.items()):
+                if isinstance(v, bool):
+                    node.metadata[k] = "true" if v else "false"
+                if v is None:
+                    node.metadata[k] = "None"
+
+        # The chunk text, as in load_chroma and load_postgres, so the three
+        # loaders share the cached embeddings
+        texts = [node.text for node in batch]
+        embeddings = embedding_cache.embed(
+            texts,
+            lambda missing: Settings.embed_model.get_text_embedding_batch(
+                missing, show_progress=True
+            ),
+        )
+        for node, embedding in zip(batch, embeddings):
+            node.embedding = embedding
+        vector_store.add(batch)
+        total += len(batch)
+
+    print(embedding_cache.stats())
+    if delta is not None:
+        mark_applied(delta_path, "redis", delta.created_at)
+    # KeywordRetriever results in the tool cache come from the public index
+    if index_name == config.index_name:
+        bump_corpus_version()
+    print(f"Redis load done! {total} nodes")
+
+
+def main(nodes_path, index_name, reset, delta_path=None):
     # with open(nodes_path, "rb") as f:
     #     documents = pickle.load(f)
 
     load_redis(
         nodes_path=nodes_path,
         index_name=index_name,
-        pipeline_cache_path=str(config.pipeline_cache),
         reset=reset,
+        delta_path=delta_path,
     )
 
 
@@ -193,13 +248,13 @@ def str2bool(val):
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(
-        description="Load the specified nodes.json file into redis"
+        description="Load the specified node store or nodes.json file into redis"
     )
     parser.add_argument(
         "--nodes_path",
         type=str,
         default=config.nodes_path,
-        help="The directory containing the data",
+        help="Node store directory or nodes.json file",
     )
     parser.add_argument(
         "--index_name",
@@ -213,6 +268,12 @@ if __name__ == "__main__":
         default=False,
         help="Overwrite existing data?",
     )
+    parser.add_argument(
+        "--delta_path",
+        type=str,
+        default=None,
+        help="Apply a delta.json from update_data.py instead of nodes_path.",
+    )
     args = parser.parse_args()
 
-    main(args.nodes_path, args.index_name, args.reset)
+    main(args.nodes_path, args.index_name, args.reset, args.delta_path)
@@ -11,6 +11,8 @@ import re
 from pathlib import Path
 from typing import Dict, List
 
+from chatdku.ingestion.corpus_version import bump_corpus_version
+
 try:
     import fitz  # PyMuPDF
     import pymupdf4llm
@@ -247,6 +249,9 @@ def main():
             print(f"Warning: No content found for major '{major}'")
 
     print(f"\nExtraction complete. Saved {saved_count} major(s) to {output_dir}")
+    if saved_count:
+        # Invalidates cached MajorRequirementsLookup results
+        bump_corpus_version()
     return 0
 
 
@@ -0,0 +1,169 @@
+"""node_delta.py
+
+Per-file change set written by `update_data.py` and applied by the
+Redis / Chroma / Postgres loaders with `--delta_path`.
+
+`delta.json` lists, for every added, modified or removed file (and for the
+regenerated event nodes), the node ids to delete and the nodes to upsert:
+
+    {
+        "created_at": "2026-01-01T00:00:00+00:00",
+        "pending": ["chroma", "postgres", "redis"],   # stores yet to apply it
+        "files": [
+            {
+                "file_path": "/data/handbook.pdf",
+                "change": "modified",          # added | modified | removed | events | duplicates
+                "doc_id": "<md5 of file_path>",
+                "deletes": ["<old node id>", ...],
+                "upserts": [<TextNode.to_dict()>, ...]
+            },
+            ...
+        ]
+    }
+
+A "duplicates" entry upserts some chunks of an unchanged file, whose
+duplicates changed (see `chatdku.ingestion.dedup_nodes.DedupIndex`).
+
+Node ids are derived from the file and the chunk index, so the new nodes of a
+modified file may reuse ids of its old ones. A loader applies deletes before
+upserts and never has to rebuild the whole store, and applying a delta again
+overwrites the nodes it already wrote.
+
+Each loader removes itself from `pending` once it applied the delta. While a
+store is pending, the next `update_data.py` run merges its changes into the
+delta instead of replacing it, so no change is lost when a loader did not run
+in between.
+"""
+
+import datetime
+import fcntl
+import json
+import os
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+
+from llama_index.core.schema import TextNode
+
+DELTA_FILE_NAME = "delta.json"
+
+# Loaders that apply a delta, see `mark_applied`
+DELTA_STORES = ("chroma", "postgres", "redis")
+
+
+@dataclass
+class NodeDelta:
+    deletes: list[str] = field(default_factory=list)
+    doc_ids: list[str] = field(default_factory=list)
+    upserts: list[TextNode] = field(default_factory=list)
+    # Identifies the version of the delta for `mark_applied`
+    created_at: str | None = None
+
+    def __bool__(self) -> bool:
+        return bool(self.deletes or self.upserts)
+
+
+def _sibling(delta_path: str, suffix: str) -> str:
+    root, ext = os.path.splitext(delta_path)
+    return f"{root}.{suffix}{ext}"
+
+
+@contextmanager
+def _locked(delta_path: str):
+    """Serialize the read-modify-write of a delta between processes."""
+    # Ends in .json, so `update_data.read_changes` does not take it as data
+    with open(_sibling(delta_path, "lock"), "w") as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        yield
+
+
+def _read(delta_path: str) -> dict | None:
+    if not os.path.exists(delta_path):
+        return None
+    with open(delta_path, "r") as f:
+        return json.load(f)
+
+
+def _write(delta_path: str, delta: dict) -> None:
+    tmp_path = _sibling(delta_path, "tmp")
+    with open(tmp_path, "w") as f:
+        json.dump(delta, f)
+    os.replace(tmp_path, delta_path)
+
+
+def merge_files(old: list[dict], new: list[dict]) -> list[dict]:
+    """
+    Entries of `old` followed by those of `new`. A file in both keeps the
+    upserts of `new` and the deletes of both, so its nodes from either run
+    are removed before the new ones are loaded. The upserts of a
+    "duplicates" entry are added to those of the file's previous entry.
+    """
+    merged = {entry["file_path"]: entry for entry in old}
+    for entry in new:
+        previous = merged.pop(entry["file_path"], None)
+        if previous is not None and entry["change"] == "duplicates":
+            # Only some chunks of the file, upserted on top of the previous entry
+            upserts = {d["id_"]: d for d in previous["upserts"] + entry["upserts"]}
+            entry = {**previous, "upserts": list(upserts.values())}
+        elif previous is not None:
+            deletes = dict.fromkeys(previous["deletes"] + entry["deletes"])
+            entry = {**entry, "deletes": list(deletes)}
+        merged[entry["file_path"]] = entry
+    return list(merged.values())
+
+
+def write_delta(
+    delta_path: str, files: list[dict], stores: tuple[str, ...] = DELTA_STORES
+) -> None:
+    """
+    Write the per-file entries built by `update_data.update`, to be applied
+    by `stores`. If a store has not applied the delta at `delta_path` yet,
+    the entries are merged into it.
+    """
+    with _locked(delta_path):
+        previous = _read(delta_path)
+        pending = set(stores)
+        if previous and previous.get("pending"):
+            print(
+                "Merging into the delta not applied yet by: "
+                + ", ".join(previous["pending"])
+            )
+            files = merge_files(previous["files"], files)
+            pending |= set(previous["pending"])
+        _write(
+            delta_path,
+            {
+                "created_at": datetime.datetime.now(datetime.UTC).isoformat(),
+                "pending": sorted(pending),
+                "files": files,
+            },
+        )
+
+
+def mark_applied(delta_path: str, store: str, created_at: str | None) -> None:
+    """
+    Record that `store` has applied the delta at `delta_path`, unless it was
+    rewritten since the store read it (`created_at` of its `NodeDelta`).
+    """
+    with _locked(delta_path):
+        delta = _read(delta_path)
+        if (
+            delta
+            and delta.get("created_at") == created_at
+            and store in delta.get("pending", [])
+        ):
+            delta["pending"].remove(store)
+            _write(delta_path, delta)
+
+
+def load_delta(delta_path: str) -> NodeDelta:
+    """Flatten `delta.json` into the ids to delete and the nodes to upsert."""
+    with open(delta_path, "r") as f:
+        data = json.load(f)
+
+    delta = NodeDelta(created_at=data.get("created_at"))
+    for entry in data["files"]:
+        delta.deletes.extend(entry["deletes"])
+        if entry.get("doc_id"):
+            delta.doc_ids.append(entry["doc_id"])
+        delta.upserts.extend(TextNode.from_dict(d) for d in entry["upserts"])
+    return delta
@@ -0,0 +1,153 @@
+#!/usr/bin/env python3
+"""node_store.py
+
+Directory of JSONL shards that replaces the monolithic `nodes.json`.
+
+Every source file gets its own shard, named after the file's doc_id (the md5
+of its absolute path, same as the SOURCE relationship of its nodes), with
+one `TextNode.to_dict()` per line. Event nodes go to `events.jsonl`.
+
+    nodes/
+        3f2a...c1.jsonl     # chunks of /data/handbook.pdf
+        9b0e...7d.jsonl     # chunks of /data/menu.xlsx
+        events.jsonl
+
+Replacing or deleting the nodes of one file only touches its shard, and
+readers stream the shards line by line instead of loading every node.
+
+Migrate an existing nodes.json once with:
+    python node_store.py --nodes_json /path/to/nodes.json --store_dir /path/to/nodes
+"""
+
+import argparse
+import hashlib
+import json
+import os
+from typing import Iterator
+
+from llama_index.core.schema import TextNode
+
+EVENTS_SHARD = "events"
+SHARD_SUFFIX = ".jsonl"
+
+
+class NodeStore:
+    def __init__(self, store_dir: str):
+        self.store_dir = store_dir
+        os.makedirs(store_dir, exist_ok=True)
+
+    def _shard_path(self, file_path: str | None) -> str:
+        """Shard of `file_path`, or the events shard if it is None."""
+        if file_path is None:
+            name = EVENTS_SHARD
+        else:
+            name = hashlib.md5(os.path.abspath(file_path).encode()).hexdigest()
+        return os.path.join(self.store_dir, name + SHARD_SUFFIX)
+
+    def _shards(self) -> list[str]:
+        return sorted(
+            os.path.join(self.store_dir, name)
+            for name in os.listdir(self.store_dir)
+            if name.endswith(SHARD_SUFFIX)
+        )
+
+    @staticmethod
+    def _read_shard(path: str) -> Iterator[dict]:
+        with open(path, "r") as f:
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+
+    def ids(self, file_path: str | None) -> list[str]:
+        """Node ids stored for `file_path` (None for the event nodes)."""
+        path = self._shard_path(file_path)
+        if not os.path.exists(path):
+            return []
+        return [d["id_"] for d in self._read_shard(path)]
+
+    def put(self, file_path: str | None, node_dicts: list[dict]) -> None:
+        """Replace the nodes of `file_path` (None for the event nodes)."""
+        if not node_dicts:
+            self.delete(file_path)
+            return
+        path = self._shard_path(file_path)
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "w") as f:
+            for d in node_dicts:
+                f.write(json.dumps(d))
+                f.write("\n")
+        # Readers never see a half-written shard
+        os.replace(tmp_path, path)
+
+    def delete(self, file_path: str | None) -> None:
+        path = self._shard_path(file_path)
+        if os.path.exists(path):
+            os.remove(path)
+
+    def iter_dicts(self) -> Iterator[dict]:
+        for path in self._shards():
+            yield from self._read_shard(path)
+
+    def iter_batches(self, batch_size: int = 1000) -> Iterator[list[TextNode]]:
+        """Stream all nodes in batches of at most `batch_size`."""
+        batch = []
+        for d in self.iter_dicts():
+            batch.append(TextNode.from_dict(d))
+            if len(batch) >= batch_size:
+                yield batch
+                batch = []
+        if batch:
+            yield batch
+
+    def __len__(self) -> int:
+        count = 0
+        for path in self._shards():
+            with open(path, "rb") as f:
+                count += sum(1 for line in f if line.strip())
+        return count
+
+
+def migrate(nodes_json: str, store_dir: str) -> NodeStore:
+    """Split an existing nodes.json into per-file shards."""
+    with open(nodes_json, "r") as f:
+        datas = json.load(f)
+
+    by_file: dict[str | None, list[dict]] = {}
+    for d in datas:
+        metadata = d.get("metadata") or {}
+        key = None if metadata.get("is_event") else metadata.get("file_path", "")
+        by_file.setdefault(key, []).append(d)
+
+    store = NodeStore(store_dir)
+    for file_path, node_dicts in by_file.items():
+        store.put(file_path, node_dicts)
+    print(f"Migrated {len(datas)} nodes into {len(by_file)} shards in {store_dir}")
+    return store
+
+
+def iter_node_batches(
+    nodes_path: str, batch_size: int = 1000
+) -> Iterator[list[TextNode]]:
+    """
+    Stream nodes from a node store directory, or from a legacy nodes.json
+    (which still has to be loaded as a whole).
+    """
+    if os.path.isdir(nodes_path):
+        yield from NodeStore(nodes_path).iter_batches(batch_size)
+        return
+
+    with open(nodes_path, "r") as f:
+        datas = json.load(f)
+    for start in range(0, len(datas), batch_size):
+        yield [TextNode.from_dict(d) for d in datas[start : start + batch_size]]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Migrate a nodes.json file into a node store directory."
+    )
+    parser.add_argument("--nodes_json", type=str, required=True)
+    parser.add_argument("--store_dir", type=str, required=True)
+    args = parser.parse_args()
+
+    migrate(args.nodes_json, args.store_dir)
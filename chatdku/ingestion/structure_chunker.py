@@ -4,6 +4,7 @@ Detects heading levels and chunks according to structure.
 """
 
 import re
+from collections import Counter
 from typing import Any, Dict, List
 
 import pdfplumber
@@ -28,39 +29,43 @@ def pdf_to_items(pdf_path: str) -> List[Dict[str, Any]]:
 
     with pdfplumber.open(pdf_path) as pdf:
         for page_num, page in enumerate(pdf.pages):
-            text = page.extract_text()
-            if not text:
-                continue
-
-            chars = page.chars if page.chars else []
-            lines = text.split("\n")
-
-            # Calculate the most common font size on this page
-            font_sizes = [char.get("size", 0) for char in chars if char.get("size")]
-            common_size = (
-                max(set(font_sizes), key=font_sizes.count) if font_sizes else 12
-            )
-
-            for line in lines:
-                line = line.strip()
-                if not line:
-                    continue
-
-                # Detect font size for this specific line
-                line_font_size = common_size
-                if chars:
-                    line_chars = [
-                        c for c in chars if c.get("text") and c["text"] in line
-                    ]
-                    if line_chars:
-                        line_font_size = line_chars[0].get("size", common_size)
-
-                # Detect heading level based on content and formatting
-                level = detect_title_level(line, line_font_size, common_size)
-
-                items.append(
-                    {"text": line, "level": level, "page": page_num}  # 0-indexed
-                )
+            items.extend(page_to_items(page, page_num))
+
+    return items
+
+
+def page_to_items(page, page_num: int) -> List[Dict[str, Any]]:
+    """
+    Extract the items of a single pdfplumber page, see `pdf_to_items()`.
+
+    Lines and their chars come from one pass over `page.chars` grouped by
+    y-coordinate, so this is linear in the number of chars on the page.
+    """
+    # Same lines as `page.extract_text().split("\n")`, each with its own chars
+    lines = page.extract_text_lines(strip=True, return_chars=True)
+    if not lines:
+        return []
+
+    # Calculate the most common font size on this page
+    font_sizes = Counter(
+        char["size"] for line in lines for char in line["chars"] if char.get("size")
+    )
+    common_size = font_sizes.most_common(1)[0][0] if font_sizes else 12
+
+    items = []
+    for line in lines:
+        text = line["text"]
+        if not text:
+            continue
+
+        # Font size of this line: most common size among its own chars
+        line_sizes = Counter(char["size"] for char in line["chars"] if char.get("size"))
+        line_font_size = line_sizes.most_common(1)[0][0] if line_sizes else common_size
+
+        # Detect heading level based on content and formatting
+        level = detect_title_level(text, line_font_size, common_size)
+
+        items.append({"text": text, "level": level, "page": page_num})  # 0-indexed
 
     return items
 
@@ -127,7 +132,7 @@ def detect_title_level(text: str, font_size: float, default_size: float) -> int:
 
 def split_items_by_level(
     items: List[Dict], target_level: int, max_chunk_size: int
-) -> List[List[str]]:
+) -> List[List[Dict]]:
     """
     Split a list of items by a specific heading level.
 
@@ -137,7 +142,7 @@ def split_items_by_level(
         max_chunk_size: Maximum chunk size in characters (reserved)
 
     Returns:
-        List of chunks, each chunk is a list of text lines
+        List of chunks, each chunk is a list of items
     """
     sub_chunks = []
     current_sub = []
@@ -154,9 +159,9 @@ def split_items_by_level(
             if current_sub:
                 sub_chunks.append(current_sub)
                 current_sub = []
-            current_sub.append(text)
+            current_sub.append(item)
         else:
-            current_sub.append(text)
+            current_sub.append(item)
 
     # Don't forget the last chunk
     if current_sub:
@@ -166,22 +171,23 @@ def split_items_by_level(
 
 
 def split_text_by_sentences(
-    text_lines: List[str], max_chunk_size: int
-) -> List[List[str]]:
+    text_lines: List[Dict], max_chunk_size: int
+) -> List[List[Dict]]:
     """
     Split text by sentence boundaries for lines that exceed max_chunk_size.
 
     Args:
-        text_lines: List of text lines
+        text_lines: List of items, one per text line
         max_chunk_size: Maximum chunk size in characters
 
     Returns:
-        List of chunks, each chunk is a list of text lines/sentences
+        List of chunks, each chunk is a list of items. Sentences split from
+        a long line are copies of its item with the sentence as 'text'.
     """
     if not text_lines:
         return []
 
-    total_text = "\n".join(text_lines)
+    total_text = "\n".join(line["text"] for line in text_lines)
     if len(total_text) <= max_chunk_size:
         return [text_lines]
 
@@ -190,7 +196,7 @@ def split_text_by_sentences(
     current_size = 0
 
     for line in text_lines:
-        line_size = len(line)
+        line_size = len(line["text"])
 
         # Handle extra-long lines that exceed max_chunk_size by themselves
         if line_size > max_chunk_size:
@@ -201,27 +207,29 @@ def split_text_by_sentences(
                 current_size = 0
 
             # Split the long line by sentence boundaries
-            sentences = re.split(r"([。！？\.!\?])", line)
+            sentences = re.split(r"([。！？\.!\?])", line["text"])
             sentence_parts = []
             for i in range(0, len(sentences) - 1, 2):
                 if i + 1 < len(sentences):
                     sentence_parts.append(sentences[i] + sentences[i + 1])
 
             if not sentence_parts:
-                sentence_parts = [line]
+                sentence_parts = [line["text"]]
 
             # Group sentences into chunks respecting max_chunk_size
             sub_chunk = []
             sub_size = 0
             for sent in sentence_parts:
                 sent_size = len(sent)
+                # Sentences keep the page of the line they were split from
+                sent_item = {**line, "text": sent}
                 if sub_size + sent_size > max_chunk_size:
                     if sub_chunk:
                         chunks.append(sub_chunk)
-                    sub_chunk = [sent]
+                    sub_chunk = [sent_item]
                     sub_size = sent_size
                 else:
-                    sub_chunk.append(sent)
+                    sub_chunk.append(sent_item)
                     sub_size += sent_size
 
             if sub_chunk:
@@ -248,7 +256,7 @@ def structure_aware_chunking(
     items: List[Dict[str, Any]],
     max_chunk_size: int = 800,
     min_chunk_size: int = 80,
-) -> List[List[str]]:
+) -> List[List[Dict[str, Any]]]:
     """
     Perform structure-aware chunking on parsed PDF items.
 
@@ -265,8 +273,13 @@ def structure_aware_chunking(
         min_chunk_size: Minimum chunk size for merging
 
     Returns:
-        List of chunks, each chunk is a list of text lines
+        List of chunks, each chunk is a list of items. Items keep their
+        'page', so a chunk's pages are known without searching `items`.
     """
+
+    def _text(chunk: List[Dict[str, Any]], sep: str = "\n") -> str:
+        return sep.join(item["text"] for item in chunk)
+
     # First pass: split by level-1 headings
     temp_list = []
     chunked_list = []
@@ -275,7 +288,7 @@ def structure_aware_chunking(
     for j, item in enumerate(items):
         if item.get("level") == 1:
             if len(temp_list) > 0:
-                temp_text = "\n".join(temp_list)
+                temp_text = _text(temp_list)
                 if len(temp_text) > max_chunk_size:
                     # Section too large - split by level-2 headings
                     sub_chunks = split_items_by_level(
@@ -286,15 +299,14 @@ def structure_aware_chunking(
                     chunked_list.append(temp_list)
                 temp_list = []
             prev_j = j
-            temp_list.append(item.get("text", ""))
+            temp_list.append(item)
         else:
-            text = item.get("text", "")
-            if text:
-                temp_list.append(text)
+            if item.get("text"):
+                temp_list.append(item)
 
     # Handle the last section
     if temp_list:
-        temp_text = "\n".join(temp_list)
+        temp_text = _text(temp_list)
         if len(temp_text) > max_chunk_size:
             sub_chunks = split_items_by_level(items[prev_j:], 2, max_chunk_size)
             chunked_list.extend(sub_chunks)
@@ -304,7 +316,7 @@ def structure_aware_chunking(
     # Second pass: split oversized chunks by sentence boundaries
     final_chunks = []
     for chunk in chunked_list:
-        chunk_text = "\n".join(chunk)
+        chunk_text = _text(chunk)
         if len(chunk_text) > max_chunk_size:
             sub_chunks = split_text_by_sentences(chunk, max_chunk_size)
             final_chunks.extend(sub_chunks)
@@ -314,7 +326,7 @@ def structure_aware_chunking(
     # Third pass: merge very small chunks with previous ones
     filtered_chunks = []
     for chunk in final_chunks:
-        chunk_text = "".join(chunk)
+        chunk_text = _text(chunk, sep="")
         if len(chunk_text) >= min_chunk_size:
             filtered_chunks.append(chunk)
         else:
@@ -357,16 +369,10 @@ def process_pdf(
     documents = []
     for idx, chunk_lines in enumerate(chunks):
         # Join all lines in this chunk into a single text block
-        text = "\n".join(chunk_lines)
-
-        # Collect all unique page numbers where this chunk's lines appear
-        pages = set()
-        for line in chunk_lines:
-            for item in items:
-                if item["text"] == line:
-                    # Convert from 0-indexed to 1-indexed (user-facing)
-                    pages.add(item["page"] + 1)
-                    break
+        text = "\n".join(line["text"] for line in chunk_lines)
+
+        # Pages this chunk's lines come from, 1-indexed (user-facing)
+        pages = {line["page"] + 1 for line in chunk_lines}
 
         # Format page numbers (required by load_redis)
         if pages:
@@ -4,6 +4,8 @@ import json
 import mimetypes
 import os
 import uuid
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
 from typing import Dict, List, Optional
 import hashlib
@@ -18,24 +20,25 @@ from llama_index.core.schema import BaseNode, Document, TextNode
 from llama_index.readers.file import UnstructuredReader
 from llama_index.core.schema import NodeRelationship, RelatedNodeInfo
 from openpyxl import load_workbook
-from improved_html_cleaner import HtmlCleaner
 
 from chatdku.config import config
+from chatdku.ingestion.dedup_nodes import DedupIndex
+from chatdku.ingestion.improved_html_cleaner import HtmlCleaner
+from chatdku.ingestion.node_delta import DELTA_FILE_NAME, DELTA_STORES, write_delta
+from chatdku.ingestion.node_store import NodeStore, migrate
+
+NODE_STORE_DIR = "nodes"
 
 # Import structure-aware PDF chunker (local parsing, replaces LlamaParse)
-from structure_chunker import process_pdf as process_pdf_structure_aware
+from chatdku.ingestion.structure_chunker import (
+    process_pdf as process_pdf_structure_aware,
+)
 
 
 def _safe_lower(x):
     return x.strip().lower() if isinstance(x, str) else None
 
 
-def _import_data(nodes_path: str) -> list:
-    with open(nodes_path, "r") as f:
-        datas = json.load(f)
-    return [TextNode.from_dict(data) for data in datas]
-
-
 def _ensure_permission_metadata(
     metadata: dict,
     *,
@@ -91,9 +94,14 @@ def load_event_files():
     return result
 
 
-def _write_data(nodes_path: str, data: list):
-    with open(nodes_path, "w") as f:
-        json.dump(data, f)
+def _open_node_store(data_dir: str) -> NodeStore:
+    """Open the node store of `data_dir`, migrating a legacy nodes.json once."""
+    store_dir = os.path.join(data_dir, NODE_STORE_DIR)
+    nodes_path = os.path.join(data_dir, "nodes.json")
+    if not os.path.isdir(store_dir) and os.path.exists(nodes_path):
+        migrate(nodes_path, store_dir)
+        print(f"{nodes_path} is no longer updated, the nodes are in {store_dir}")
+    return NodeStore(store_dir)
 
 
 def nodes_to_dicts(nodes: list) -> dict:
@@ -237,7 +245,20 @@ class XlsxReader(BaseReader):
         return [Document(text=self.xlsx_load(file), metadata=metadata or {})]
 
 
-def write_changes(data_dir: str, added_files: set[str], removed_files: set[str]):
+def _hash_file(file_path: str) -> str:
+    digest = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def write_changes(
+    data_dir: str,
+    added_files: set[str],
+    removed_files: set[str],
+    manifest: dict[str, dict] | None = None,
+):
     """
     Write the changes that has happened to the log.json.
     Args:
@@ -245,6 +266,9 @@ def write_changes(data_dir: str, added_files: set[str], removed_files: set[str])
         added_files: Set of added files, that was returned from read_changes()
         removed_files: Set of removed files, that was returned from
         read_changes()
+        manifest: Size, mtime and sha256 of the current files, as returned
+        from read_changes(). Files left out of it (e.g. a modified file that
+        failed to parse) are treated as modified on the next run.
     """
     log_path = os.path.join(data_dir, "log.json")
 
@@ -265,20 +289,29 @@ def write_changes(data_dir: str, added_files: set[str], removed_files: set[str])
             new_list.append(f)
 
     log["file_paths"] = new_list
+    if manifest is not None:
+        log["files"] = {f: manifest[f] for f in new_list if f in manifest}
 
     with open(log_path, "w") as file:
         json.dump(log, file)
 
 
-def read_changes(data_dir: str) -> tuple[set[str], set[str]]:
+def read_changes(
+    data_dir: str,
+) -> tuple[set[str], set[str], set[str], dict[str, dict]]:
     """
     Read the log.json file and read which files are turned into nodes.
     Will skip files with suffixes ".json", and "pkl".
+
+    A file counts as modified when its size or mtime differ from the
+    manifest in log.json and its content hash changed as well, so only
+    touched files are hashed.
     Args:
         data_dir: The directory that log.json and all the data is in.
     Returns:
-        tuple(added_files, removed_files): A tuple of sets with the added
-        files and removed files.
+        tuple(added_files, modified_files, removed_files, manifest): Sets of
+        the added, modified and removed files, and the size, mtime and
+        sha256 of every current file to pass to write_changes().
     """
     log_path = os.path.join(data_dir, "log.json")
 
@@ -292,9 +325,14 @@ def read_changes(data_dir: str) -> tuple[set[str], set[str]]:
                 if not f.startswith(config.event_path)
             ]
     else:
+        log = {"file_paths": []}
         previous_files = []
         with open(log_path, "w") as file:
-            json.dump({"file_paths": []}, file)
+            json.dump(log, file)
+
+    # Logs written before the manifest existed have no "files"; their
+    # entries are taken as unchanged and only get hashed once.
+    previous_manifest = log.get("files")
 
     # Recursively get current file paths
     current_files = []
@@ -307,6 +345,7 @@ def read_changes(data_dir: str) -> tuple[set[str], set[str]]:
                 or file_name.endswith(".json")
                 or file_name.endswith(".pkl")
                 or file_path.startswith(os.path.abspath(config.event_path))
+                or file_path.startswith(os.path.join(data_dir, NODE_STORE_DIR, ""))
             ):
                 continue
             current_files.append(os.path.abspath(file_path))
@@ -315,7 +354,28 @@ def read_changes(data_dir: str) -> tuple[set[str], set[str]]:
     added_files = set(current_files) - set(previous_files)
     removed_files = set(previous_files) - set(current_files)
 
-    return added_files, removed_files
+    modified_files = set()
+    manifest = {}
+    for file_path in current_files:
+        stat = os.stat(file_path)
+        entry = {"size": stat.st_size, "mtime": stat.st_mtime_ns}
+        old = (previous_manifest or {}).get(file_path)
+
+        if file_path in added_files:
+            entry["sha256"] = _hash_file(file_path)
+        elif old is None:
+            entry["sha256"] = _hash_file(file_path)
+            if previous_manifest is not None:
+                modified_files.add(file_path)
+        elif old["size"] == entry["size"] and old["mtime"] == entry["mtime"]:
+            entry["sha256"] = old["sha256"]
+        else:
+            entry["sha256"] = _hash_file(file_path)
+            if entry["sha256"] != old["sha256"]:
+                modified_files.add(file_path)
+        manifest[file_path] = entry
+
+    return added_files, modified_files, removed_files, manifest
 
 
 def clean_expired_nodes(nodes):
@@ -336,9 +396,63 @@ def clean_expired_nodes(nodes):
     return kept
 
 
+def _chunk_pdf(file_path: str) -> list[dict]:
+    """
+    Parse and chunk a single PDF. Runs in a worker process with `--workers`.
+
+    Returns plain chunk records instead of llama_index objects so that only
+    small dicts are pickled back to the parent process.
+    """
+    chunked_docs = process_pdf_structure_aware(
+        file_path, max_chunk_size=config.chunk_size, min_chunk_size=80
+    )
+    return [
+        {
+            "text": doc.text,
+            "page_number": doc.metadata.get("page_number", "Not given"),
+            "chunking_method": doc.metadata.get("chunking_method", "structure_aware"),
+        }
+        for doc in chunked_docs
+    ]
+
+
+def _chunk_pdfs(file_paths: list[str], workers: int = 1):
+    """
+    Yield `(file_path, chunk records, error)` for each PDF, in the order of
+    `file_paths`. A file that fails to parse yields its exception as `error`
+    instead of stopping the others.
+    """
+    if workers <= 1 or len(file_paths) <= 1:
+        for file_path in file_paths:
+            print(f"Reading PDF with structure_chunker: {file_path}")
+            try:
+                yield file_path, _chunk_pdf(file_path), None
+            except Exception as e:
+                yield file_path, [], e
+        return
+
+    print(f"Reading {len(file_paths)} PDFs with structure_chunker, {workers} workers")
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = [pool.submit(_chunk_pdf, file_path) for file_path in file_paths]
+        for file_path, future in zip(file_paths, futures):
+            try:
+                yield file_path, future.result(), None
+            except Exception as e:
+                yield file_path, [], e
+
+
+def _chunk_id(doc_id: str, index: int) -> str:
+    """
+    Node id of the `index`-th chunk of a file. It is the same on every run,
+    so re-loading a file whose delta was only partly applied overwrites its
+    chunks instead of adding copies.
+    """
+    return str(uuid.uuid5(uuid.NAMESPACE_URL, f"{doc_id}#{index}"))
+
+
 def _read_pdf(
-    file_paths: list[str], user_id, access_type, role, organization
-) -> list[TextNode]:
+    file_paths: list[str], user_id, access_type, role, organization, workers: int = 1
+) -> tuple[list[TextNode], dict[str, str]]:
     """
     Read PDF files using local structure-aware chunker (pdfplumber).
     Replaces the previous LlamaParse-based implementation.
@@ -349,31 +463,31 @@ def _read_pdf(
         access_type: Access type (public/student/office/private)
         role: User role
         organization: Organization name (required for office access)
+        workers: Number of processes to parse PDFs with
 
     Returns:
-        List of TextNode objects with structure-aware chunks
+        Tuple of the TextNode objects with structure-aware chunks, in the
+        order of the sorted `file_paths`, and a dict of the files that failed
+        to parse mapped to their error.
     """
     total_nodes = []
+    failed = {}
 
-    for file_path in file_paths:
-        print(f"Reading PDF with structure_chunker: {file_path}")
-
-        # Use local structure-aware chunker instead of LlamaParse
-        chunked_docs = process_pdf_structure_aware(
-            file_path, max_chunk_size=config.chunk_size, min_chunk_size=80
-        )
+    for file_path, records, error in _chunk_pdfs(sorted(file_paths), workers):
+        if error is not None:
+            failed[file_path] = f"{type(error).__name__}: {error}"
+            print(f"Failed to load {file_path}: {failed[file_path]}")
+            continue
 
-        for doc in chunked_docs:
-            # Generate unique ID for the chunk
-            chunk_id = str(uuid.uuid4())
+        doc_id = os.path.abspath(file_path)
+        for index, record in enumerate(records):
+            chunk_id = _chunk_id(doc_id, index)
 
             # Build metadata with permission fields
             base_metadata = custom_metadata(user_id)(file_path)
-            base_metadata["page_number"] = doc.metadata.get("page_number", "Not given")
+            base_metadata["page_number"] = record["page_number"]
             base_metadata["chunk_id"] = chunk_id
-            base_metadata["chunking_method"] = doc.metadata.get(
-                "chunking_method", "structure_aware"
-            )
+            base_metadata["chunking_method"] = record["chunking_method"]
 
             # Apply permission metadata
             base_metadata = _ensure_permission_metadata(
@@ -386,7 +500,7 @@ def _read_pdf(
 
             # Create TextNode
             node = TextNode(
-                text=doc.text,
+                text=record["text"],
                 id_=chunk_id,
                 metadata=base_metadata,
             )
@@ -395,15 +509,14 @@ def _read_pdf(
                 continue
 
             # Set source relationship
-            doc_id = os.path.abspath(file_path)
             node.relationships[NodeRelationship.SOURCE] = RelatedNodeInfo(
                 node_id=hashlib.md5(doc_id.encode()).hexdigest()
             )
 
             total_nodes.append(node)
 
-        print(f"Finished loading {file_path}. Generated {len(chunked_docs)} chunks.")
-    return total_nodes
+        print(f"Finished loading {file_path}. Generated {len(records)} chunks.")
+    return total_nodes, failed
 
 
 def _read_non_pdf(
@@ -453,10 +566,21 @@ def _read_non_pdf(
 
     non_pdf_nodes = pipeline.run(documents=non_pdf_documents, show_progress=True)
 
+    chunk_counts = defaultdict(int)
     for node in non_pdf_nodes:
         if node.text == "":
             continue
-        node.node_id = str(uuid.uuid4())
+
+        file_path = (
+            node.metadata.get("file_path")
+            or node.metadata.get("source")
+            or node.metadata.get("file_name")
+        )
+        if not file_path:
+            raise ValueError("Cannot determine file_path for node")
+        doc_id = os.path.abspath(file_path) if file_path else "unknown"
+        node.node_id = _chunk_id(doc_id, chunk_counts[doc_id])
+        chunk_counts[doc_id] += 1
         node.metadata["chunk_id"] = node.node_id
 
         # Permission defaults for ordinary nodes
@@ -468,14 +592,6 @@ def _read_non_pdf(
             organization=organization,
         )
 
-        file_path = (
-            node.metadata.get("file_path")
-            or node.metadata.get("source")
-            or node.metadata.get("file_name")
-        )
-        if not file_path:
-            raise ValueError("Cannot determine file_path for node")
-        doc_id = os.path.abspath(file_path) if file_path else "unknown"
         node.relationships[NodeRelationship.SOURCE] = RelatedNodeInfo(
             node_id=hashlib.md5(doc_id.encode()).hexdigest()
         )
@@ -528,17 +644,22 @@ def update(
     role: str,
     organization: str = None,
     verbose: bool = False,
+    workers: int = 1,
+    stores: tuple[str, ...] = DELTA_STORES,
+    dedup: bool = True,
 ):
     """
     Main update function that processes all documents and generates nodes.
 
     This function:
-    1. Detects added/removed files since last run
-    2. Processes new PDF files using local structure-aware chunker
-    3. Processes new non-PDF files using UnstructuredReader
-    4. Removes nodes from deleted files
+    1. Detects added/modified/removed files since last run
+    2. Processes new and modified PDF files using local structure-aware chunker
+    3. Processes new and modified non-PDF files using UnstructuredReader
+    4. Removes nodes from deleted and modified files
     5. Generates fresh event nodes
-    6. Saves all nodes to nodes.json
+    6. Saves the nodes of changed files to the node store and the
+       per-file changes to delta.json, without the chunks that duplicate
+       chunks of other files
 
     Args:
         data_dir: Root directory containing documents
@@ -547,29 +668,27 @@ def update(
         role: User role
         organization: Organization name (required for office access)
         verbose: Whether to print detailed information
+        workers: Number of processes to parse PDFs with
+        stores: Loaders that will apply the delta. Until all of them did,
+            the next run merges its changes into the delta.
+        dedup: Leave duplicate chunks out of the delta, see
+            `chatdku.ingestion.dedup_nodes.DedupIndex`.
     """
-    # detect add/remove only in NON-EVENT dir
-    nodes_path = os.path.join(data_dir, "nodes.json")
+    # detect add/remove/modify only in NON-EVENT dir
+    store = _open_node_store(data_dir)
 
-    # load old nodes
-    if os.path.exists(nodes_path):
-        old_nodes = _import_data(nodes_path)
-    else:
-        old_nodes = []
-
-    # keep only non-event nodes
-    non_event_old = [n for n in old_nodes if not n.metadata.get("is_event")]
-    new_nodes = []
-
-    added_files, removed_files = read_changes(data_dir)
+    added_files, modified_files, removed_files, manifest = read_changes(data_dir)
     if verbose:
         print(f"Files to be added: {added_files}")
+        print(f"Files to be modified: {modified_files}")
         print(f"Files to be removed: {removed_files}")
 
-    # load newly added non-event files
-    if added_files:
-        pdf_files = [file for file in added_files if file.endswith(".pdf")]
-        non_pdf_files = list(set(added_files) - set(pdf_files))
+    new_nodes = []
+    # load newly added and modified non-event files
+    changed_files = added_files | modified_files
+    if changed_files:
+        pdf_files = [file for file in changed_files if file.endswith(".pdf")]
+        non_pdf_files = list(changed_files - set(pdf_files))
 
         if non_pdf_files:
             new_nodes.extend(
@@ -577,37 +696,93 @@ def update(
             )
 
         if pdf_files:
-            new_nodes.extend(
-                _read_pdf(pdf_files, user_id, access_type, role, organization)
+            pdf_nodes, failed_pdfs = _read_pdf(
+                pdf_files, user_id, access_type, role, organization, workers
             )
+            new_nodes.extend(pdf_nodes)
+            if failed_pdfs:
+                # Left out of the manifest so they are retried on the next
+                # run. A modified PDF keeps its old nodes until then.
+                print(f"{len(failed_pdfs)} PDF(s) failed to load:")
+                for file_path, error in failed_pdfs.items():
+                    print(f"  {file_path}: {error}")
+                    manifest.pop(file_path, None)
+                added_files -= set(failed_pdfs)
+                modified_files -= set(failed_pdfs)
 
         print("Total added nodes:", len(new_nodes))
 
-    # remove deleted non-event files
-    kept_nodes = []
-    for n in non_event_old:
-        file_path_meta = os.path.abspath(n.metadata.get("file_path", ""))
-        if file_path_meta not in removed_files:
-            kept_nodes.append(n)
-    print("Total kept nodes:", len(kept_nodes))
+    upserts: dict[str, list[dict]] = {}
+    for node in new_nodes:
+        file_path_meta = os.path.abspath(node.metadata.get("file_path", ""))
+        upserts.setdefault(file_path_meta, []).append(node.to_dict())
 
-    # combine non-event
-    non_event_nodes = kept_nodes + new_nodes
     # now load events
-    event_nodes = update_events(user_id)
-
-    total_nodes = non_event_nodes + event_nodes
-    print("Total nodes:", len(total_nodes))
-
-    nodes_dicts = [node.to_dict() for node in total_nodes]
-
-    _write_data(nodes_path, nodes_dicts)
-    write_changes(data_dir, added_files, removed_files)
-
+    event_nodes = [node.to_dict() for node in update_events(user_id)]
+
+    delta_files = []
+    for change, files in (
+        ("added", added_files),
+        ("modified", modified_files),
+        ("removed", removed_files),
+    ):
+        for file_path in sorted(files):
+            delta_files.append(
+                {
+                    "file_path": file_path,
+                    "change": change,
+                    "doc_id": hashlib.md5(file_path.encode()).hexdigest(),
+                    "deletes": store.ids(file_path),
+                    "upserts": upserts.get(file_path, []),
+                }
+            )
+    old_event_ids = store.ids(None)
+    if old_event_ids or event_nodes:
+        delta_files.append(
+            {
+                "file_path": config.event_path,
+                "change": "events",
+                "doc_id": None,
+                "deletes": old_event_ids,
+                "upserts": event_nodes,
+            }
+        )
+    delta_upserts = delta_files
+    dedup_index = None
+    # Event nodes are not deduplicated, so a run with only them skips it
+    if dedup and any(e["change"] != "events" for e in delta_files):
+        dedup_index = DedupIndex(store)
+        delta_upserts, dropped, readmitted = dedup_index.dedup_delta(delta_files)
+        print(f"Duplicate chunks left out of the delta: {dropped}")
+        print(f"Chunks admitted again, their copy was removed: {readmitted}")
+    write_delta(os.path.join(data_dir, DELTA_FILE_NAME), delta_upserts, stores)
+
+    # Only the shards of changed files are rewritten
+    for entry in delta_files:
+        file_path = None if entry["change"] == "events" else entry["file_path"]
+        store.put(file_path, entry["upserts"])
+    if dedup_index is not None:
+        dedup_index.commit()
+    write_changes(data_dir, added_files, removed_files, manifest)
+
+    print(
+        f"Nodes added: {sum(len(e['upserts']) for e in delta_files)}, "
+        f"removed: {sum(len(e['deletes']) for e in delta_files)}"
+    )
     print("Document load done!")
 
 
-def main(data_dir, user_id, access_type, role, organization=None, verbose=False):
+def main(
+    data_dir,
+    user_id,
+    access_type,
+    role,
+    organization=None,
+    verbose=False,
+    workers=1,
+    stores=DELTA_STORES,
+    dedup=True,
+):
     """
     Main entry point for the document processing script.
 
@@ -618,6 +793,9 @@ def main(data_dir, user_id, access_type, role, organization=None, verbose=False)
         role: User role
         organization: Organization name (required for office access)
         verbose: Whether to print detailed information
+        workers: Number of processes to parse PDFs with
+        stores: Loaders that will apply the delta
+        dedup: Leave duplicate chunks out of the delta
     """
     if data_dir is None:
         data_dir = config.data_dir
@@ -628,7 +806,17 @@ def main(data_dir, user_id, access_type, role, organization=None, verbose=False)
     if role is None:
         role = "student"
 
-    update(data_dir, user_id, access_type, role, organization, verbose=verbose)
+    update(
+        data_dir,
+        user_id,
+        access_type,
+        role,
+        organization,
+        verbose=verbose,
+        workers=workers,
+        stores=tuple(stores),
+        dedup=dedup,
+    )
 
 
 if __name__ == "__main__":
@@ -673,6 +861,25 @@ if __name__ == "__main__":
         default=True,
         help="Whether to print extra information.",
     )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=1,
+        help="Number of processes used to parse PDFs. Defaults to 1.",
+    )
+    parser.add_argument(
+        "--stores",
+        type=str,
+        nargs="+",
+        default=list(DELTA_STORES),
+        choices=DELTA_STORES,
+        help="Loaders that apply delta.json. Defaults to all of them.",
+    )
+    parser.add_argument(
+        "--no_dedup",
+        action="store_true",
+        help="Keep chunks that duplicate chunks of other files in delta.json.",
+    )
     args = parser.parse_args()
 
     main(
@@ -681,5 +888,8 @@ if __name__ == "__main__":
         args.access_type,
         args.role,
         args.organization,
-        args.v,
+        args.verbose,
+        args.workers,
+        args.stores,
+        not args.no_dedup,
     )
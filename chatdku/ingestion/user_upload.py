@@ -0,0 +1,169 @@
+#!/usr/bin/env python3
+"""user_upload.py
+
+Fast path for user uploads. `update_data.py` re-reads a whole data directory
+and regenerates the event nodes; this only chunks the PDFs of a user's folder
+that are new or changed since the last run, and applies them to the user
+partition (Chroma `user_uploads`, Postgres rows of the user) as a delta:
+
+  1. `read_changes()` finds the new, modified and removed files of the folder.
+  2. Only those PDFs are chunked, as private nodes of the user.
+  3. A delta.json is written next to the user's node store and applied by
+     `load_chroma` and `load_postgres`. Both embed through the shared
+     embedding cache, so each chunk is embedded once for both stores.
+
+Files uploaded while a previous run was busy are picked up together by the
+next run, so their chunks go through the same embedding batches. A PDF that
+fails to parse is reported and retried with the next upload, and does not
+keep the other files from being loaded.
+
+Chunk ids are derived from the file and the chunk index (see
+`update_data._chunk_id`). If a store fails after another one was loaded, the
+next run loads the same ids again and overwrites them instead of leaving the
+first attempt's chunks behind.
+
+Usage:
+    python user_upload.py --user_id netid --data_dir /path/to/media/folder
+"""
+
+import argparse
+import hashlib
+import os
+from typing import Callable, Optional
+
+from chatdku.config import config
+from chatdku.ingestion.node_delta import DELTA_FILE_NAME, write_delta
+from chatdku.ingestion.update_data import (
+    _open_node_store,
+    _read_pdf,
+    read_changes,
+    write_changes,
+)
+
+STORES = ("chroma", "postgres")
+
+# progress(stage, done, total)
+Progress = Callable[[str, int, int], None]
+
+
+def update(
+    user_id: str,
+    data_dir: str,
+    progress: Optional[Progress] = None,
+    stores: tuple[str, ...] = STORES,
+) -> tuple[int, dict[str, str]]:
+    """
+    Ingest the new and changed PDFs of `data_dir` for `user_id` and remove the
+    nodes of deleted ones.
+
+    Args:
+        user_id: NetID of the user, stored as the `user_id` of every node.
+        data_dir: The user's upload folder. Its log.json, node store and
+            delta.json are kept in the same folder.
+        progress: Called with the stage ("parsing", "chroma", "postgres"),
+            the number of steps done and the total.
+        stores: Vector stores to load the delta into.
+
+    Returns:
+        Number of nodes added, and the files that failed to parse mapped to
+        their error.
+    """
+    progress = progress or (lambda stage, done, total: None)
+    store = _open_node_store(data_dir)
+
+    added_files, modified_files, removed_files, manifest = read_changes(data_dir)
+    # Uploads are PDFs only, other files in the folder are not ingested
+    added_files = {f for f in added_files if f.endswith(".pdf")}
+    modified_files = {f for f in modified_files if f.endswith(".pdf")}
+    changed_files = sorted(added_files | modified_files)
+
+    upserts: dict[str, list[dict]] = {}
+    failed = {}
+    for done, file_path in enumerate(changed_files):
+        progress("parsing", done, len(changed_files))
+        nodes, file_failed = _read_pdf(
+            [file_path], user_id, "private", role=None, organization=None
+        )
+        failed.update(file_failed)
+        upserts[file_path] = [node.to_dict() for node in nodes]
+    progress("parsing", len(changed_files), len(changed_files))
+
+    for file_path in failed:
+        # Retried on the next upload, a modified file keeps its old nodes
+        manifest.pop(file_path, None)
+    added_files -= set(failed)
+    modified_files -= set(failed)
+
+    delta_files = []
+    for change, files in (
+        ("added", added_files),
+        ("modified", modified_files),
+        ("removed", removed_files),
+    ):
+        for file_path in sorted(files):
+            delta_files.append(
+                {
+                    "file_path": file_path,
+                    "change": change,
+                    "doc_id": hashlib.md5(file_path.encode()).hexdigest(),
+                    "deletes": store.ids(file_path),
+                    "upserts": upserts.get(file_path, []),
+                }
+            )
+
+    if delta_files:
+        delta_path = os.path.join(data_dir, DELTA_FILE_NAME)
+        write_delta(delta_path, delta_files, stores)
+        _apply_delta(delta_path, progress, stores)
+        for entry in delta_files:
+            store.put(entry["file_path"], entry["upserts"])
+    write_changes(data_dir, added_files, removed_files, manifest)
+
+    return sum(len(entry["upserts"]) for entry in delta_files), failed
+
+
+def _apply_delta(delta_path: str, progress: Progress, stores: tuple[str, ...]):
+    # Imported here so that only the stores in use need their clients
+    for done, name in enumerate(stores):
+        progress(name, done, len(stores))
+        if name == "chroma":
+            from chatdku.ingestion.load_chroma import load_chroma
+
+            load_chroma(
+                collection=config.user_uploads_collection, delta_path=delta_path
+            )
+        elif name == "postgres":
+            from chatdku.ingestion.load_postgres import load_postgres
+
+            # Private uploads do not change the answers of the public corpus
+            load_postgres(delta_path=delta_path, bump_version=False)
+        else:
+            raise ValueError(f"Unknown store: {name}")
+    progress("done", len(stores), len(stores))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Ingest the new and changed uploads of a user."
+    )
+    parser.add_argument("--user_id", type=str, required=True)
+    parser.add_argument("--data_dir", type=str, required=True)
+    parser.add_argument(
+        "--stores",
+        type=str,
+        nargs="+",
+        default=list(STORES),
+        choices=STORES,
+        help="Vector stores to load the new nodes into.",
+    )
+    args = parser.parse_args()
+
+    added, failed = update(
+        args.user_id,
+        args.data_dir,
+        progress=lambda stage, done, total: print(f"{stage}: {done}/{total}"),
+        stores=tuple(args.stores),
+    )
+    print(f"Added {added} nodes for {args.user_id}")
+    for file_path, error in failed.items():
+        print(f"Failed to load {file_path}: {error}")
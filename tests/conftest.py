@@ -3,6 +3,7 @@
 from contextlib import contextmanager
 from unittest.mock import MagicMock
 
+import fakeredis
 import pandas as pd
 import pytest
 
@@ -38,6 +39,12 @@ def mock_span_ctx(monkeypatch):
     return mock_span
 
 
+@pytest.fixture()
+def fake_redis():
+    """In-memory Redis for the caches and loaders that take a client."""
+    return fakeredis.FakeRedis()
+
+
 @pytest.fixture()
 def mock_get_current_span(monkeypatch):
     """Mock get_current_span for llama_index_tools which uses it directly."""
@@ -0,0 +1,139 @@
+"""Tests for chatdku.core.tools.retriever.async_postgres_retriever against a stand-in pool."""
+
+import asyncio
+
+import numpy as np
+import pytest
+
+# The postgres-async extra
+pytest.importorskip("psycopg_pool")
+pytest.importorskip("pgvector.psycopg")
+
+from chatdku.core.tools.retriever import async_postgres_retriever, postgres_retriever
+from chatdku.core.tools.retriever.async_postgres_retriever import (
+    AsyncPostgresRetriever,
+)
+from chatdku.core.tools.utils import timeout
+
+
+class FakePool:
+    """
+    `AsyncConnectionPool` stand-in. Records the statements and answers the
+    dense and sparse queries with `dense` and `sparse` rows. A `slow` sparse
+    query waits until its task is cancelled.
+    """
+
+    def __init__(self, dense=(), sparse=(), slow=False):
+        self.rows = {"<=>": list(dense), "plainto_tsquery": list(sparse)}
+        self.slow = slow
+        self.executed = []
+        self.cancelled = asyncio.Event()
+
+    def connection(self):
+        pool = self
+
+        class Cursor:
+            async def __aenter__(self):
+                return self
+
+            async def __aexit__(self, *exc):
+                return False
+
+            async def execute(self, sql, params=None, prepare=None):
+                pool.executed.append((sql, params, prepare))
+                self.kind = next((k for k in pool.rows if k in sql), None)
+                if self.kind == "plainto_tsquery" and pool.slow:
+                    try:
+                        await asyncio.sleep(5)
+                    except asyncio.CancelledError:
+                        pool.cancelled.set()
+                        raise
+
+            async def fetchall(self):
+                return pool.rows.get(self.kind, [])
+
+        class Connection:
+            async def __aenter__(self):
+                return self
+
+            async def __aexit__(self, *exc):
+                return False
+
+            def transaction(self):
+                return self
+
+            def cursor(self):
+                return Cursor()
+
+        return Connection()
+
+
+def _row(id_):
+    return (id_, f"text {id_}", {"file_name": f"{id_}.pdf"}, f"{id_}.pdf")
+
+
+@pytest.fixture()
+def use_pool(monkeypatch):
+    monkeypatch.setattr(
+        AsyncPostgresRetriever, "_embed", lambda self, query: (0.1, 0.2)
+    )
+    # Reads the URL table from the data directory
+    monkeypatch.setattr(postgres_retriever, "get_url", lambda metadata: "")
+
+    def use(pool):
+        async def get_apool():
+            return pool
+
+        monkeypatch.setattr(async_postgres_retriever, "_get_apool", get_apool)
+        return pool
+
+    return use
+
+
+def test_aquery_fuses_prepared_dense_and_sparse(use_pool):
+    pool = use_pool(FakePool(dense=[_row("a"), _row("b")], sparse=[_row("b")]))
+    retriever = AsyncPostgresRetriever(statement_timeout_ms=4000)
+
+    nodes = asyncio.run(retriever.aquery("majors"))
+
+    assert [n.node_id for n in nodes] == ["b", "a"]
+    queries = [
+        (sql, params, prepare) for sql, params, prepare in pool.executed if prepare
+    ]
+    dense = next(q for q in queries if "<=>" in q[0])
+    # The embedding is sent as a binary float32 vector
+    assert "(%b)::vector" in dense[0]
+    assert any(isinstance(p, np.ndarray) and p.dtype == np.float32 for p in dense[1])
+    assert len(queries) == 2
+    assert ("4000", "64") in [params for _, params, _ in pool.executed]
+
+
+def test_sparse_is_cancelled_when_the_embedding_fails(use_pool, monkeypatch):
+    pool = use_pool(FakePool(slow=True))
+
+    def fail(self, query):
+        raise RuntimeError("embedding server down")
+
+    monkeypatch.setattr(AsyncPostgresRetriever, "_embed", fail)
+
+    async def run():
+        with pytest.raises(RuntimeError, match="embedding server down"):
+            await AsyncPostgresRetriever().aquery("majors")
+        await asyncio.wait_for(pool.cancelled.wait(), 1)
+
+    asyncio.run(run())
+
+
+def test_statement_timeouts_are_bounded_by_the_deadline(use_pool):
+    pool = use_pool(FakePool(dense=[_row("a")]))
+    retriever = AsyncPostgresRetriever(
+        statement_timeout_ms=4000, sparse_timeout_ms=1200
+    )
+
+    with timeout(0.3):
+        asyncio.run(retriever.aquery("majors"))
+
+    timeouts = [
+        int(params[0]) for sql, params, _ in pool.executed if "set_config" in sql
+    ]
+    assert len(timeouts) == 2 and all(0 < t <= 300 for t in timeouts)
@@ -0,0 +1,171 @@
+"""Tests for chatdku.ingestion.dedup_nodes."""
+
+import random
+
+from chatdku.ingestion.dedup_nodes import DedupIndex, Deduplicator, dedup_store
+from chatdku.ingestion.node_store import NodeStore
+
+WORDS = (
+    "students must complete the major requirements before graduation and may "
+    "petition the registrar for course substitutions approved by their advisor "
+    "during the add drop period of each session"
+).split()
+
+
+def _node(id_, text, file_path, **metadata):
+    metadata = {"file_path": file_path, "access_type": "student", **metadata}
+    return {"id_": id_, "text": text, "metadata": metadata}
+
+
+class TestDedupStore:
+    def test_collapses_exact_and_near_duplicates(self, tmp_path):
+        rng = random.Random(0)
+        page = " ".join(rng.choices(WORDS, k=300))
+        near = page.replace(page.split()[150], "registrar", 1) + " Last updated."
+        other = " ".join(rng.choices(WORDS, k=300))
+        store = NodeStore(str(tmp_path / "nodes"))
+        store.put("/a.html", [_node("a", page, "/a.html")])
+        store.put(
+            "/b.html",
+            [
+                _node("b1", page.upper(), "/b.html"),
+                _node("b2", near, "/b.html"),
+                _node("b3", other, "/b.html"),
+            ],
+        )
+        store.put("/c.pdf", [_node("c", page, "/c.pdf", access_type="faculty")])
+        store.put(
+            None,
+            [_node(f"e{i}", "Event", "", is_event=True) for i in range(2)],
+        )
+
+        report = dedup_store(str(tmp_path / "nodes"), str(tmp_path / "out"))
+
+        kept = {d["id_"]: d for d in NodeStore(str(tmp_path / "out")).iter_dicts()}
+        assert sorted(kept) == ["a", "b3", "c", "e0", "e1"]
+        assert kept["a"]["metadata"]["duplicate_count"] == 2
+        assert kept["a"]["metadata"]["duplicate_sources"] == "/b.html"
+        assert "duplicate_count" not in kept["c"]["metadata"]
+        assert report["exact_duplicates"] == 1
+        assert report["near_duplicates"] == 1
+        assert report["chunks"] == 7
+        assert report["kept"] == 5
+
+
+def _update(store, delta_files):
+    """Deduplicate and write the shards like `update_data.update`."""
+    index = DedupIndex(store)
+    result = index.dedup_delta(delta_files)
+    for entry in delta_files:
+        file_path = None if entry["change"] == "events" else entry["file_path"]
+        store.put(file_path, entry["upserts"])
+    index.commit()
+    return result
+
+
+def _entry(file_path, change, *upserts):
+    return {"file_path": file_path, "change": change, "upserts": list(upserts)}
+
+
+class TestDedupIndex:
+    def test_drops_upserts_duplicating_other_files(self, tmp_path):
+        rng = random.Random(0)
+        page = " ".join(rng.choices(WORDS, k=300))
+        other = " ".join(rng.choices(WORDS, k=300))
+        store = NodeStore(str(tmp_path / "nodes"))
+        store.put("/a.html", [_node("a", page, "/a.html")])
+        # The old version of a modified file is not compared with
+        store.put("/b.html", [_node("b-old", other, "/b.html")])
+        delta_files = [
+            _entry(
+                "/b.html",
+                "modified",
+                _node("b1", page, "/b.html"),
+                _node("b2", other, "/b.html"),
+            ),
+            _entry("/c.html", "added", _node("c", other + " Last updated.", "/c.html")),
+            _entry(None, "events", *[_node("e", "Event", "", is_event=True)] * 2),
+        ]
+
+        deduplicated, dropped, readmitted = _update(store, delta_files)
+
+        upserts = [[d["id_"] for d in e["upserts"]] for e in deduplicated]
+        assert upserts == [["b2"], [], ["e", "e"], ["a"]]
+        assert (dropped, readmitted) == (2, 0)
+        # The kept chunks name the files of the chunks they replace
+        assert (
+            deduplicated[0]["upserts"][0]["metadata"]["duplicate_sources"] == "/c.html"
+        )
+        a = deduplicated[3]
+        assert a["change"] == "duplicates" and a["file_path"] == "/a.html"
+        assert a["upserts"][0]["metadata"]["duplicate_count"] == 1
+        assert a["upserts"][0]["metadata"]["duplicate_sources"] == "/b.html"
+        # The node store's copy is left as it was
+        assert len(delta_files[0]["upserts"]) == 2
+        assert "duplicate_count" not in delta_files[0]["upserts"][1]["metadata"]
+
+    def test_unchanged_shards_are_not_hashed_again(self, tmp_path, monkeypatch):
+        rng = random.Random(0)
+        store = NodeStore(str(tmp_path / "nodes"))
+        _update(
+            store,
+            [
+                _entry(
+                    f"/{i}.html",
+                    "added",
+                    _node(str(i), " ".join(rng.choices(WORDS, k=50)), f"/{i}.html"),
+                )
+                for i in range(5)
+            ],
+        )
+        calls = []
+        signature = Deduplicator.signature
+        monkeypatch.setattr(
+            Deduplicator,
+            "signature",
+            lambda self, text: calls.append(text) or signature(self, text),
+        )
+
+        _update(
+            store, [_entry("/new.html", "added", _node("n", "new page", "/new.html"))]
+        )
+
+        assert calls == ["new page"]
+
+    def test_readmits_chunks_when_their_copy_is_removed(self, tmp_path):
+        rng = random.Random(0)
+        page = " ".join(rng.choices(WORDS, k=300))
+        store = NodeStore(str(tmp_path / "nodes"))
+        _update(store, [_entry("/a.html", "added", _node("a", page, "/a.html"))])
+        _, dropped, _ = _update(
+            store,
+            [
+                _entry("/b.html", "added", _node("b", page, "/b.html")),
+                _entry("/c.html", "added", _node("c", page, "/c.html")),
+            ],
+        )
+        assert dropped == 2
+
+        deduplicated, _, readmitted = _update(store, [_entry("/a.html", "removed")])
+
+        assert readmitted == 1
+        b = deduplicated[1]
+        assert (b["change"], b["file_path"]) == ("duplicates", "/b.html")
+        assert [d["id_"] for d in b["upserts"]] == ["b"]
+        # c still duplicates b, which now stands for both
+        assert b["upserts"][0]["metadata"]["duplicate_sources"] == "/c.html"
+
+    def test_shards_written_without_the_index_are_indexed_again(self, tmp_path):
+        rng = random.Random(0)
+        page = " ".join(rng.choices(WORDS, k=300))
+        store = NodeStore(str(tmp_path / "nodes"))
+        _update(store, [_entry("/a.html", "added", _node("a", "old text", "/a.html"))])
+        # e.g. update_data.py --no_dedup
+        store.put("/a.html", [_node("a", page, "/a.html")])
+
+        deduplicated, dropped, _ = _update(
+            store, [_entry("/b.html", "added", _node("b", page, "/b.html"))]
+        )
+
+        assert dropped == 1
+        assert deduplicated[0]["upserts"] == []
@@ -0,0 +1,61 @@
+"""Tests for chatdku.ingestion.embedding_cache.EmbeddingCache."""
+
+import pytest
+
+from chatdku.ingestion.embedding_cache import EmbeddingCache
+
+
+class FakeEmbedder:
+    def __init__(self, dim=4):
+        self.dim = dim
+        self.calls = []
+
+    def __call__(self, texts):
+        self.calls.append(list(texts))
+        return [[float(len(t)) + i for i in range(self.dim)] for t in texts]
+
+
+class TestEmbeddingCache:
+    def test_only_missing_texts_are_embedded(self, tmp_path):
+        cache = EmbeddingCache(str(tmp_path), "org/model")
+        embedder = FakeEmbedder()
+
+        first = cache.embed(["a", "bb"], embedder)
+        second = cache.embed(["bb", "ccc", "a"], embedder)
+
+        assert embedder.calls == [["a", "bb"], ["ccc"]]
+        assert second == [first[1], embedder(["ccc"])[0], first[0]]
+        assert (cache.hits, cache.misses) == (2, 3)
+
+    def test_duplicate_texts_embedded_once(self, tmp_path):
+        cache = EmbeddingCache(str(tmp_path), "org/model")
+        embedder = FakeEmbedder()
+
+        result = cache.embed(["x", "x", "y"], embedder)
+
+        assert embedder.calls == [["x", "y"]]
+        assert result[0] == result[1]
+
+    def test_persists_across_instances(self, tmp_path):
+        embedder = FakeEmbedder()
+        expected = EmbeddingCache(str(tmp_path), "org/model").embed(
+            ["a", "bb"], embedder
+        )
+
+        reopened = EmbeddingCache(str(tmp_path), "org/model")
+
+        assert reopened.embed(["bb", "a"], embedder) == expected[::-1]
+        assert len(embedder.calls) == 1
+
+    def test_keyed_by_model(self, tmp_path):
+        embedder = FakeEmbedder()
+        EmbeddingCache(str(tmp_path), "org/model-a").embed(["a"], embedder)
+
+        assert EmbeddingCache(str(tmp_path), "org/model-b").get_many(["a"]) == [None]
+
+    def test_dim_mismatch_raises(self, tmp_path):
+        cache = EmbeddingCache(str(tmp_path), "org/model")
+        cache.embed(["a"], FakeEmbedder(dim=4))
+
+        with pytest.raises(ValueError):
+            cache.embed(["b"], FakeEmbedder(dim=8))
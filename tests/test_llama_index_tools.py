@@ -288,3 +288,249 @@ class TestKeywordRetrieverOuterTimeout:
         )
         with pytest.raises(Exception, match="Keyword retriever timeout"):
             fn("test")
+
+
+# ---------------------------------------------------------------------------
+# Deduplication across executor iterations (Agent.internal_memory)
+# ---------------------------------------------------------------------------
+
+
+class TestRetrievalDedup:
+    @pytest.fixture(autouse=True)
+    def _setup(
+        self,
+        monkeypatch,
+        mock_get_current_span,
+        _patch_vector_retriever,
+        _patch_keyword_retriever,
+        _patch_rerank,
+        _patch_timeout,
+    ):
+        monkeypatch.setattr(
+            "chatdku.core.tools.utils._count_tokens", lambda text: len(text.split())
+        )
+        self.vector = _patch_vector_retriever
+        self.keyword = _patch_keyword_retriever
+
+    def _make(self):
+        from chatdku.core.tools.llama_index_tools import (
+            KeywordRetrieverOuter,
+            VectorRetrieverOuter,
+        )
+
+        kwargs = dict(retriever_top_k=10, use_reranker=False)
+        return VectorRetrieverOuter(**kwargs), KeywordRetrieverOuter(**kwargs)
+
+    def test_no_memory_keeps_duplicates(self):
+        vector, _ = self._make()
+        assert vector("q") == vector("q")
+
+    def test_repeated_chunks_become_back_references(self):
+        from chatdku.core.tools.utils import use_internal_memory
+
+        vector, _ = self._make()
+        memory = {}
+        with use_internal_memory(memory):
+            first = vector("q")
+            second = vector("q")
+
+        assert "doc one" in first
+        assert "doc one" not in second
+        # Both chunks were shown as [S1], their (unnamed) source
+        assert second.splitlines()[0] == "[Already retrieved: S1]"
+        assert memory["ids"] == {"1", "2"}
+        assert memory["duplicates"] == 2
+        assert memory["saved_tokens"] == 4
+
+    def test_same_text_under_other_id_is_deduplicated(self):
+        from chatdku.core.tools.utils import use_internal_memory
+
+        vector, keyword = self._make()
+        self.keyword.query_with_tell.return_value = [
+            NodeWithScore(node_id="idx_doc:1", text="doc  ONE", metadata={}, score=1.0),
+            NodeWithScore(
+                node_id="idx_doc:3", text="doc three", metadata={}, score=1.0
+            ),
+        ]
+        with use_internal_memory({}):
+            vector("q")
+            result = keyword("q")
+
+        assert "[Already retrieved: S1]" in result
+        assert "doc three" in result
+
+    def test_back_references_cite_the_source_tag_shown(self):
+        from chatdku.core.tools.utils import use_internal_memory
+
+        vector, keyword = self._make()
+        self.vector.query_with_tell.return_value = [
+            NodeWithScore(
+                node_id="1",
+                text="doc one",
+                metadata={"file_name": "a.pdf", "page_number": 3},
+                score=0.9,
+            ),
+        ]
+        self.keyword.query_with_tell.return_value = [
+            NodeWithScore(
+                node_id="idx_doc:2",
+                text="doc two",
+                metadata={"filename": "b.pdf", "page_number": 1},
+                score=1.0,
+            ),
+            NodeWithScore(
+                node_id="idx_doc:1",
+                text="doc one",
+                metadata={"filename": "a.pdf", "page_number": 3},
+                score=1.0,
+            ),
+        ]
+        with use_internal_memory({}):
+            first = vector("q")
+            second = keyword("q")
+
+        assert first.splitlines()[0] == "[S1 p.3] doc one"
+        # b.pdf gets the next id of the turn, not S1 again
+        assert second.splitlines() == [
+            "[S2 p.1] doc two",
+            "[Already retrieved: S1 p.3]",
+            "Sources:",
+            "S2: b.pdf",
+        ]
+
+    def test_only_reranked_nodes_are_marked_seen(self):
+        from chatdku.core.tools.llama_index_tools import VectorRetrieverOuter
+        from chatdku.core.tools.utils import use_internal_memory
+
+        vector = VectorRetrieverOuter(retriever_top_k=10, use_reranker=True)
+        memory = {}
+        with use_internal_memory(memory):
+            vector("q")
+
+        # The patched reranker keeps only the first node.
+        assert memory["ids"] == {"1"}
+
+
+# ---------------------------------------------------------------------------
+# Observation format
+# ---------------------------------------------------------------------------
+
+
+class TestObservationFormat:
+    @pytest.fixture(autouse=True)
+    def _setup(self, mock_get_current_span, _patch_vector_retriever, _patch_timeout):
+        self.vector = _patch_vector_retriever
+
+    def _make(self, **kwargs):
+        from chatdku.core.tools.llama_index_tools import VectorRetrieverOuter
+
+        return VectorRetrieverOuter(retriever_top_k=10, use_reranker=False, **kwargs)
+
+    def test_compact_uses_source_ids_and_table(self):
+        self.vector.query_with_tell.return_value = [
+            NodeWithScore(
+                node_id="1",
+                text="doc one",
+                metadata={"file_name": "a.pdf", "url": "http://a", "page_number": 3},
+                score=0.9,
+            ),
+            NodeWithScore(
+                node_id="2",
+                text="doc two",
+                metadata={"file_name": "a.pdf", "url": "http://a", "page_number": 4},
+                score=0.8,
+            ),
+            NodeWithScore(
+                node_id="3",
+                text="doc three",
+                metadata={"filename": "b.html", "url": "no url"},
+                score=0.7,
+            ),
+        ]
+        result = self._make()("q")
+
+        assert result.splitlines() == [
+            "[S1 p.3] doc one",
+            "[S1 p.4] doc two",
+            "[S2] doc three",
+            "Sources:",
+            "S1: a.pdf http://a",
+            "S2: b.html",
+        ]
+
+    def test_compact_drops_scores(self):
+        result = self._make()("q")
+        assert "0.9" not in result
+        assert "NodeWithScore" not in result
+
+    def test_raw_keeps_node_reprs(self):
+        assert self._make(observation_format="raw")("q") == str(SAMPLE_NODES)
+
+    def test_invalid_format_defaults_to_compact(self):
+        assert self._make(observation_format="xml")("q") == self._make()("q")
+
+    def test_empty_result(self):
+        self.vector.query_with_tell.return_value = []
+        assert self._make()("q") == "No documents found."
+
+
+# ---------------------------------------------------------------------------
+# Shared tool executor
+# ---------------------------------------------------------------------------
+
+
+class TestToolExecutor:
+    @pytest.fixture(autouse=True)
+    def _executor(self, monkeypatch):
+        from chatdku.core.tools.utils import ToolExecutor
+
+        self.executor = ToolExecutor(max_workers=1, max_queue=1)
+        monkeypatch.setattr("chatdku.core.tools.utils._tool_executor", self.executor)
+
+    def test_run_returns_result(self):
+        from chatdku.core.tools.utils import timeout
+
+        with timeout() as ctx:
+            assert ctx.run(lambda x: x + 1, 1) == 2
+        assert self.executor.stats()["in_flight"] == 0
+        assert self.executor.stats()["queue_depth"] == 0
+
+    def test_deadline_is_visible_in_worker(self):
+        from chatdku.core.tools.utils import remaining_time, timeout
+
+        assert remaining_time() is None
+        with timeout(5) as ctx:
+            left = ctx.run(remaining_time)
+        assert 0 < left <= 5
+
+    def test_timeout_raises_and_is_counted(self):
+        import threading
+
+        from chatdku.core.tools.utils import timeout
+
+        release = threading.Event()
+        try:
+            with pytest.raises(QueryTimeoutError):
+                with timeout(0.05) as ctx:
+                    ctx.run(release.wait)
+        finally:
+            release.set()
+        assert self.executor.stats()["timed_out"] == 1
+
+    def test_sheds_load_when_saturated(self):
+        import threading
+
+        from chatdku.core.tools.utils import ToolOverloadedError
+
+        release = threading.Event()
+        running = self.executor.submit(release.wait)
+        queued = self.executor.submit(release.wait)
+        try:
+            with pytest.raises(ToolOverloadedError):
+                self.executor.submit(release.wait)
+            assert self.executor.stats()["rejected"] == 1
+        finally:
+            release.set()
+        running.result(timeout=1)
+        queued.result(timeout=1)
+        assert self.executor.stats()["queue_depth"] == 0
@@ -0,0 +1,236 @@
+"""Tests for chatdku.core.llm_router against local stub vLLM servers."""
+
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from chatdku.core import llm_router
+from chatdku.core.llm_router import LLMRouter, RoutedLM, routed_lm
+
+
+class StubVLLM:
+    """OpenAI-compatible server answering /v1/models and /v1/chat/completions."""
+
+    def __init__(self, name, status=200, delay=0.0):
+        self.name = name
+        self.status = status
+        self.delay = delay
+        self.calls = 0
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def reply(self, status, body):
+                data = json.dumps(body).encode()
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def do_GET(self):
+                self.reply(stub.status, {"object": "list", "data": []})
+
+            def do_POST(self):
+                self.rfile.read(int(self.headers["Content-Length"]))
+                stub.calls += 1
+                time.sleep(stub.delay)
+                if stub.status != 200:
+                    self.reply(stub.status, {"error": {"message": "down"}})
+                    return
+                self.reply(
+                    200,
+                    {
+                        "id": "cmpl",
+                        "object": "chat.completion",
+                        "created": 0,
+                        "model": "stub",
+                        "choices": [
+                            {
+                                "index": 0,
+                                "message": {"role": "assistant", "content": stub.name},
+                                "finish_reason": "stop",
+                            }
+                        ],
+                        "usage": {
+                            "prompt_tokens": 1,
+                            "completion_tokens": 1,
+                            "total_tokens": 2,
+                        },
+                    },
+                )
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.url = f"http://127.0.0.1:{self.server.server_port}/v1"
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+@pytest.fixture()
+def stubs():
+    servers = []
+
+    def make(*args, **kwargs):
+        server = StubVLLM(*args, **kwargs)
+        servers.append(server)
+        return server
+
+    yield make
+    for server in servers:
+        server.close()
+
+
+def make_lm(router):
+    return RoutedLM("openai/stub", router=router, api_key="x", cache=False)
+
+
+def test_fails_over_on_5xx(stubs):
+    bad, good = stubs("bad", status=503), stubs("good")
+    router = LLMRouter([bad.url, good.url])
+
+    assert make_lm(router)("hi") == ["good"]
+    # The failed endpoint is skipped until its cooldown ends
+    assert make_lm(router)("hi") == ["good"]
+    assert bad.calls == 1 and good.calls == 2
+
+    metrics = {m["url"]: m for m in router.metrics()}
+    assert metrics[bad.url]["failures"] == 1
+    assert not metrics[bad.url]["healthy"]
+    assert metrics[good.url]["healthy"] and metrics[good.url]["in_flight"] == 0
+
+
+def test_fails_over_on_connection_error(stubs):
+    dead, good = stubs("dead"), stubs("good")
+    dead.close()
+    router = LLMRouter([dead.url, good.url])
+
+    assert make_lm(router)("hi") == ["good"]
+
+
+def test_raises_when_every_endpoint_fails(stubs):
+    router = LLMRouter([stubs("a", status=500).url, stubs("b", status=502).url])
+
+    with pytest.raises(Exception):
+        make_lm(router)("hi")
+    assert all(m["failures"] == 1 for m in router.metrics())
+
+
+def test_client_errors_do_not_fail_over(stubs):
+    bad, good = stubs("bad", status=400), stubs("good")
+    router = LLMRouter([bad.url, good.url])
+
+    with pytest.raises(Exception):
+        make_lm(router)("hi")
+    assert good.calls == 0
+    assert all(m["healthy"] for m in router.metrics())
+
+
+def test_concurrent_calls_are_spread_by_load(stubs):
+    a, b = stubs("a", delay=0.2), stubs("b", delay=0.2)
+    router = LLMRouter([a.url, b.url])
+    lm = make_lm(router)
+
+    threads = [threading.Thread(target=lm, args=("hi",)) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert a.calls == 2 and b.calls == 2
+
+
+def test_prefers_faster_endpoint(stubs):
+    slow, fast = stubs("slow", delay=0.3), stubs("fast")
+    router = LLMRouter([slow.url, fast.url])
+    lm = make_lm(router)
+    lm("hi")
+    lm("hi")
+
+    assert [lm("hi") for _ in range(3)] == [["fast"]] * 3
+    assert slow.calls == 1
+
+
+def test_health_check_marks_endpoints(stubs):
+    flaky = stubs("flaky", status=503)
+    router = LLMRouter([flaky.url], cooldown=60)
+
+    router.check_health()
+    assert not router.metrics()[0]["healthy"]
+
+    flaky.status = 200
+    router.check_health()
+    assert router.metrics()[0]["healthy"]
+
+
+def test_copies_share_the_router(stubs):
+    router = LLMRouter([stubs("a").url])
+
+    assert make_lm(router).copy(temperature=0.5).router is router
+
+
+def test_router_starts_on_first_call(monkeypatch, stubs):
+    monkeypatch.setattr(llm_router, "_router", None)
+    started = []
+    monkeypatch.setattr(
+        LLMRouter, "start_health_checks", lambda self, i: started.append(i)
+    )
+    monkeypatch.setattr(llm_router.config, "llm_url", stubs("a").url)
+    monkeypatch.setattr(llm_router.config, "llm_urls", [])
+    monkeypatch.setattr(llm_router.config, "backup_llm", None)
+    monkeypatch.setattr(llm_router.config, "llm_api_key", "x")
+
+    lm = routed_lm(cache=False)
+    assert llm_router.current_router() is None and not started
+
+    assert lm("hi") == ["a"]
+    assert llm_router.current_router() is lm.router and len(started) == 1
+
+
+class FakeSendStream:
+    def __init__(self):
+        self.items = []
+
+    async def send(self, item):
+        self.items.append(item)
+
+
+def test_streamed_call_fails_over_only_before_first_chunk(monkeypatch, stubs):
+    import asyncio
+
+    import dspy
+
+    a, b = stubs("a"), stubs("b")
+    router = LLMRouter([a.url, b.url])
+    calls = []
+
+    def forward(self, prompt=None, messages=None, **kwargs):
+        calls.append(kwargs["api_base"])
+        if len(calls) == 1 and send_first_chunk:
+            asyncio.run(dspy.settings.send_stream.send("partial"))
+        if len(calls) == 1:
+            raise ConnectionError("endpoint went away")
+        return "answer"
+
+    monkeypatch.setattr(dspy.LM, "forward", forward)
+    client = FakeSendStream()
+
+    send_first_chunk = False
+    with dspy.context(send_stream=client):
+        assert make_lm(router).forward(prompt="hi") == "answer"
+    assert len(calls) == 2
+
+    calls.clear()
+    send_first_chunk = True
+    with dspy.context(send_stream=client):
+        with pytest.raises(ConnectionError):
+            make_lm(router).forward(prompt="hi")
+    assert len(calls) == 1
+    assert client.items == ["partial"]
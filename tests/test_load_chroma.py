@@ -0,0 +1,46 @@
+"""Tests for chatdku.ingestion.load_chroma batching and expiry cleanup."""
+
+import datetime
+
+import chromadb
+from llama_index.core.schema import TextNode
+
+from chatdku.ingestion import load_chroma
+
+
+def _iso(days: int) -> str:
+    expire = datetime.datetime.now(datetime.timezone.utc) + datetime.timedelta(
+        days=days
+    )
+    return expire.isoformat().replace("+00:00", "Z")
+
+
+class TestBatched:
+    def test_fixed_size_batches_skip_empty_text(self):
+        nodes = [TextNode(id_=str(i), text=f"t{i}") for i in range(60)]
+        nodes.insert(5, TextNode(id_="empty", text=""))
+
+        batches = list(load_chroma._batched([nodes[:30], nodes[30:]], 25))
+
+        assert [len(b) for b in batches] == [25, 25, 10]
+        assert "empty" not in {n.node_id for b in batches for n in b}
+
+
+class TestCleanupExpired:
+    def test_deletes_only_expired_events(self):
+        collection = chromadb.EphemeralClient().get_or_create_collection("cleanup_test")
+        metadatas = [
+            load_chroma.normalize_metadata({"is_event": True, "expire_at": _iso(-1)}),
+            load_chroma.normalize_metadata({"is_event": True, "expire_at": _iso(1)}),
+            load_chroma.normalize_metadata({"file_name": "doc"}),
+        ]
+        collection.add(
+            ids=["expired", "upcoming", "doc"],
+            embeddings=[[1.0, 0.0], [0.0, 1.0], [1.0, 1.0]],
+            documents=["a", "b", "c"],
+            metadatas=metadatas,
+        )
+
+        load_chroma.cleanup_expired_chroma(collection)
+
+        assert sorted(collection.get(include=[])["ids"]) == ["doc", "upcoming"]
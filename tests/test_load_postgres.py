@@ -0,0 +1,108 @@
+"""Tests for the pipelined insert path of chatdku.ingestion.load_postgres."""
+
+import json
+import struct
+import threading
+import time
+
+import numpy as np
+from llama_index.core.schema import NodeRelationship, RelatedNodeInfo, TextNode
+
+from chatdku.ingestion import load_postgres
+
+
+def _decode_copy(data: bytes) -> list[list[bytes | None]]:
+    """Minimal reader for PostgreSQL's binary COPY format."""
+    assert data[:11] == b"PGCOPY\n\xff\r\n\x00"
+    pos = 19
+    rows = []
+    while True:
+        (n_fields,) = struct.unpack_from("!h", data, pos)
+        pos += 2
+        if n_fields == -1:
+            assert pos == len(data)
+            return rows
+        row = []
+        for _ in range(n_fields):
+            (length,) = struct.unpack_from("!i", data, pos)
+            pos += 4
+            if length == -1:
+                row.append(None)
+                continue
+            row.append(data[pos : pos + length])
+            pos += length
+        rows.append(row)
+
+
+def _node(i: int) -> TextNode:
+    node = TextNode(
+        id_=f"n{i}",
+        text=f"chunk {i}",
+        metadata={"file_name": "a", "access_type": "student", "page_number": i},
+    )
+    node.relationships[NodeRelationship.SOURCE] = RelatedNodeInfo(node_id="doc")
+    return node
+
+
+class FakeEmbedModel:
+    def __init__(self, delay=0.0):
+        self.delay = delay
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self._lock = threading.Lock()
+
+    def get_text_embedding_batch(self, texts, show_progress=False):
+        with self._lock:
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        time.sleep(self.delay)
+        with self._lock:
+            self.in_flight -= 1
+        return [[float(len(t)), 0.5, -1.0] for t in texts]
+
+
+class TestCopyBinary:
+    def test_encodes_text_vector_and_jsonb(self):
+        row = ("id1", "doc", "doc", "héllo", [1.0, 2.5], "f", None, "", {"k": "v"})
+
+        (fields,) = _decode_copy(load_postgres._copy_binary([row]).getvalue())
+
+        assert fields[0] == b"id1"
+        assert fields[3] == "héllo".encode()
+        dim, unused = struct.unpack_from("!hh", fields[4])
+        assert (dim, unused) == (2, 0)
+        assert np.frombuffer(fields[4][4:], dtype=">f4").tolist() == [1.0, 2.5]
+        assert fields[6] is None
+        assert fields[7] == b""
+        assert fields[8][:1] == b"\x01"
+        assert json.loads(fields[8][1:]) == {"k": "v"}
+
+
+class TestInsertPipeline:
+    def test_writes_every_valid_node_in_bounded_batches(self, monkeypatch):
+        written = []
+        monkeypatch.setattr(
+            load_postgres,
+            "_write_rows",
+            lambda conn, cur, rows, acl_rows, **kw: written.append(list(rows)),
+        )
+        nodes = [_node(i) for i in range(103)] + [TextNode(id_="empty", text="  ")]
+        embed_model = FakeEmbedModel(delay=0.01)
+
+        total = load_postgres._insert_batch(
+            None,
+            None,
+            iter(nodes),
+            target_table_name="t",
+            embed_model=embed_model,
+            batch_size=10,
+            embed_workers=3,
+            write_batch_size=40,
+        )
+
+        assert total == 103
+        assert [r[0] for batch in written for r in batch] == [
+            f"n{i}" for i in range(103)
+        ]
+        assert all(len(batch) <= 40 + 10 for batch in written)
+        assert 1 < embed_model.max_in_flight <= 3
@@ -0,0 +1,46 @@
+"""Tests for chatdku.ingestion.load_redis.cleanup_expired_events."""
+
+import datetime
+from unittest.mock import MagicMock
+
+from chatdku.ingestion import load_redis
+
+
+def _iso(days: int) -> bytes:
+    expire = datetime.datetime.now(datetime.timezone.utc) + datetime.timedelta(
+        days=days
+    )
+    return expire.isoformat().replace("+00:00", "Z")
+
+
+class TestCleanupExpiredEvents:
+    def test_unlinks_only_expired_events_in_batches(self, fake_redis, monkeypatch):
+        hashes = {
+            f"idx_doc:expired{i}": {"is_event": "true", "expire_at": _iso(-1)}
+            for i in range(5)
+        }
+        hashes["idx_doc:legacy"] = {"is_event": "True", "expire_at": _iso(-2)}
+        hashes["idx_doc:upcoming"] = {"is_event": "true", "expire_at": _iso(1)}
+        hashes["idx_doc:doc"] = {"is_event": "false", "vector": b"\x00" * 4096}
+        hashes["idx_doc:bad"] = {"is_event": "true", "expire_at": "not a date"}
+        hashes["other_doc:expired"] = {"is_event": "true", "expire_at": _iso(-1)}
+        for key, fields in hashes.items():
+            fake_redis.hset(key, mapping=fields)
+        # KEYS blocks Redis and HGETALL pulls the vector
+        for name in ("keys", "hgetall"):
+            monkeypatch.setattr(fake_redis, name, MagicMock(side_effect=AssertionError))
+        pipeline = MagicMock(wraps=fake_redis.pipeline)
+        unlink = MagicMock(wraps=fake_redis.unlink)
+        monkeypatch.setattr(fake_redis, "pipeline", pipeline)
+        monkeypatch.setattr(fake_redis, "unlink", unlink)
+
+        load_redis.cleanup_expired_events(fake_redis, "idx", batch_size=3)
+
+        assert sorted(fake_redis.scan_iter()) == [
+            b"idx_doc:bad",
+            b"idx_doc:doc",
+            b"idx_doc:upcoming",
+            b"other_doc:expired",
+        ]
+        assert pipeline.call_count == 3
+        assert sum(len(call.args) for call in unlink.call_args_list) == 6
@@ -0,0 +1,81 @@
+"""Tests for chatdku.ingestion.node_delta (write_delta, mark_applied, load_delta)."""
+
+import json
+
+import pytest
+from llama_index.core.schema import TextNode
+
+from chatdku.ingestion import load_redis
+from chatdku.ingestion.node_delta import load_delta, mark_applied, write_delta
+
+
+def _entry(file_path, deletes, upsert_ids, change="modified"):
+    return {
+        "file_path": file_path,
+        "change": change,
+        "doc_id": file_path,
+        "deletes": deletes,
+        "upserts": [
+            TextNode(id_=i, text=f"text {i}", metadata={}).to_dict() for i in upsert_ids
+        ],
+    }
+
+
+class TestWriteDelta:
+    def test_merges_into_a_pending_delta(self, tmp_path):
+        path = str(tmp_path / "delta.json")
+        write_delta(
+            path,
+            [_entry("/a.pdf", ["a0"], ["a1"]), _entry("/b.pdf", [], ["b1"])],
+            stores=("chroma", "postgres"),
+        )
+        mark_applied(path, "chroma", load_delta(path).created_at)
+
+        write_delta(
+            path, [_entry("/a.pdf", ["a1"], ["a2"]), _entry("/c.pdf", ["c0"], [])]
+        )
+
+        delta = load_delta(path)
+        assert delta.deletes == ["a0", "a1", "c0"]
+        assert [n.node_id for n in delta.upserts] == ["b1", "a2"]
+        with open(path) as f:
+            assert json.load(f)["pending"] == ["chroma", "postgres", "redis"]
+
+    def test_duplicates_entry_adds_to_the_pending_upserts(self, tmp_path):
+        path = str(tmp_path / "delta.json")
+        write_delta(path, [_entry("/a.pdf", ["a0"], ["a1"])], stores=("chroma",))
+
+        write_delta(path, [_entry("/a.pdf", [], ["a2"], change="duplicates")])
+
+        delta = load_delta(path)
+        assert delta.deletes == ["a0"]
+        assert [n.node_id for n in delta.upserts] == ["a1", "a2"]
+
+    def test_replaces_a_delta_applied_by_every_store(self, tmp_path):
+        path = str(tmp_path / "delta.json")
+        write_delta(path, [_entry("/a.pdf", [], ["a1"])], stores=("chroma",))
+        mark_applied(path, "chroma", load_delta(path).created_at)
+
+        write_delta(path, [_entry("/b.pdf", [], ["b1"])], stores=("chroma",))
+
+        assert [n.node_id for n in load_delta(path).upserts] == ["b1"]
+        assert sorted(p.name for p in tmp_path.iterdir()) == [
+            "delta.json",
+            "delta.lock.json",
+        ]
+
+    def test_rewritten_delta_stays_pending(self, tmp_path):
+        path = str(tmp_path / "delta.json")
+        write_delta(path, [_entry("/a.pdf", [], ["a1"])], stores=("chroma",))
+        read_by_loader = load_delta(path)
+        # update_data runs again while the loader is busy
+        write_delta(path, [_entry("/b.pdf", [], ["b1"])], stores=("chroma",))
+
+        mark_applied(path, "chroma", read_by_loader.created_at)
+
+        assert [n.node_id for n in load_delta(path).upserts] == ["a1", "b1"]
+
+
+def test_load_redis_rejects_reset_with_delta(tmp_path):
+    with pytest.raises(ValueError):
+        load_redis.load_redis(reset=True, delta_path=str(tmp_path / "delta.json"))
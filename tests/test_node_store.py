@@ -0,0 +1,86 @@
+"""Tests for chatdku.ingestion.node_store (NodeStore, migrate, iter_node_batches)."""
+
+import json
+
+from llama_index.core.schema import TextNode
+
+from chatdku.ingestion.node_store import NodeStore, iter_node_batches, migrate
+
+
+def _node(node_id, file_path, **metadata):
+    return TextNode(
+        id_=node_id,
+        text=f"text {node_id}",
+        metadata={"file_path": file_path, **metadata},
+    ).to_dict()
+
+
+class TestNodeStore:
+    def test_put_replaces_only_that_file(self, tmp_path):
+        store = NodeStore(str(tmp_path / "nodes"))
+        store.put(
+            "/data/a.pdf", [_node("a1", "/data/a.pdf"), _node("a2", "/data/a.pdf")]
+        )
+        store.put("/data/b.pdf", [_node("b1", "/data/b.pdf")])
+
+        store.put("/data/a.pdf", [_node("a3", "/data/a.pdf")])
+
+        assert store.ids("/data/a.pdf") == ["a3"]
+        assert store.ids("/data/b.pdf") == ["b1"]
+        assert len(store) == 2
+
+    def test_put_empty_deletes_shard(self, tmp_path):
+        store = NodeStore(str(tmp_path / "nodes"))
+        store.put("/data/a.pdf", [_node("a1", "/data/a.pdf")])
+
+        store.put("/data/a.pdf", [])
+
+        assert store.ids("/data/a.pdf") == []
+        assert len(store) == 0
+
+    def test_events_shard(self, tmp_path):
+        store = NodeStore(str(tmp_path / "nodes"))
+        store.put(None, [_node("e1", "/events/e.csv", is_event=True)])
+
+        assert store.ids(None) == ["e1"]
+
+    def test_iter_batches_is_bounded(self, tmp_path):
+        store = NodeStore(str(tmp_path / "nodes"))
+        for f in range(3):
+            store.put(
+                f"/data/{f}.pdf",
+                [_node(f"{f}-{i}", f"/data/{f}.pdf") for i in range(4)],
+            )
+
+        batches = list(store.iter_batches(batch_size=5))
+
+        assert [len(b) for b in batches] == [5, 5, 2]
+        assert all(isinstance(n, TextNode) for b in batches for n in b)
+
+
+class TestMigrate:
+    def test_migrate_groups_by_file_and_events(self, tmp_path):
+        nodes = [
+            _node("a1", "/data/a.pdf"),
+            _node("b1", "/data/b.pdf"),
+            _node("a2", "/data/a.pdf"),
+            _node("e1", "/events/e.csv", is_event=True),
+        ]
+        nodes_json = tmp_path / "nodes.json"
+        nodes_json.write_text(json.dumps(nodes))
+
+        store = migrate(str(nodes_json), str(tmp_path / "nodes"))
+
+        assert store.ids("/data/a.pdf") == ["a1", "a2"]
+        assert store.ids("/data/b.pdf") == ["b1"]
+        assert store.ids(None) == ["e1"]
+
+    def test_iter_node_batches_accepts_legacy_json(self, tmp_path):
+        nodes_json = tmp_path / "nodes.json"
+        nodes_json.write_text(
+            json.dumps([_node(str(i), "/data/a.pdf") for i in range(3)])
+        )
+
+        batches = list(iter_node_batches(str(nodes_json), batch_size=2))
+
+        assert [[n.node_id for n in b] for b in batches] == [["0", "1"], ["2"]]
@@ -0,0 +1,105 @@
+"""Tests for the sparse-branch timeouts of chatdku.core.tools.retriever.postgres_retriever."""
+
+import threading
+import time
+
+import pytest
+
+from chatdku.core.tools.retriever import postgres_retriever
+from chatdku.core.tools.retriever.postgres_retriever import PostgresRetriever
+from chatdku.core.tools.utils import timeout
+
+
+class FakeConnection:
+    """Records the statement timeouts and blocks `slow` queries until cancelled."""
+
+    def __init__(self, slow=False):
+        self.slow = slow
+        self.timeouts = []
+        self.cancelled = threading.Event()
+
+    def cursor(self):
+        conn = self
+
+        class Cursor:
+            def __enter__(self):
+                return self
+
+            def __exit__(self, *exc):
+                return False
+
+            def execute(self, sql, params=None):
+                if "statement_timeout" in sql:
+                    conn.timeouts.append(params[0])
+                elif "SELECT" in sql and conn.slow:
+                    if not conn.cancelled.wait(5):
+                        raise AssertionError("the query was not cancelled")
+                    raise RuntimeError("canceling statement due to user request")
+
+            def fetchall(self):
+                return []
+
+        return Cursor()
+
+    def cancel(self):
+        self.cancelled.set()
+
+    def commit(self):
+        pass
+
+    def rollback(self):
+        pass
+
+
+@pytest.fixture()
+def connections(monkeypatch):
+    # The dense branch borrows on the calling thread, sparse on the executor
+    dense, sparse = FakeConnection(), FakeConnection(slow=True)
+
+    def borrow():
+        if threading.current_thread().name.startswith("pg-sparse"):
+            return None, sparse
+        return None, dense
+
+    monkeypatch.setattr(postgres_retriever, "_borrow", borrow)
+    monkeypatch.setattr(postgres_retriever, "_return", lambda pool, conn: None)
+    monkeypatch.setattr(PostgresRetriever, "_embed", lambda self, query: (0.1, 0.2))
+    return dense, sparse
+
+
+def test_running_sparse_query_is_cancelled_on_the_server(connections):
+    dense, sparse = connections
+    retriever = PostgresRetriever(sparse_timeout_ms=50)
+
+    assert retriever.query("majors") == []
+
+    # Future.cancel() cannot stop it once it runs, the connection can
+    assert sparse.cancelled.wait(1)
+
+
+def test_statement_timeouts_are_bounded_by_the_deadline(connections):
+    dense, sparse = connections
+    retriever = PostgresRetriever(statement_timeout_ms=4000, sparse_timeout_ms=1200)
+
+    with timeout(0.3):
+        retriever.query("majors")
+
+    assert 0 < dense.timeouts[0] <= 300
+    assert 0 < sparse.timeouts[0] <= 300
+
+
+def test_sparse_query_is_cancelled_when_the_embedding_fails(connections, monkeypatch):
+    dense, sparse = connections
+
+    def fail(self, query):
+        # Let the sparse branch reach the server first
+        time.sleep(0.1)
+        raise RuntimeError("embedding server down")
+
+    monkeypatch.setattr(PostgresRetriever, "_embed", fail)
+    retriever = PostgresRetriever(sparse_timeout_ms=5000)
+
+    with pytest.raises(RuntimeError, match="embedding server down"):
+        retriever.query("majors")
+
+    assert sparse.cancelled.wait(1)
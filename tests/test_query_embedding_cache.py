@@ -0,0 +1,158 @@
+"""Tests for chatdku.core.tools.query_embedding_cache."""
+
+import threading
+import time
+
+import numpy as np
+import pytest
+from redis import RedisError
+
+from chatdku.core.tools.query_embedding_cache import QueryEmbeddingCache
+
+
+class BrokenRedis:
+    """Fails every command after the socket timeout."""
+
+    def __init__(self, delay=0.0):
+        self.delay = delay
+        self.calls = 0
+
+    def __getattr__(self, name):
+        def fail(*args, **kwargs):
+            self.calls += 1
+            time.sleep(self.delay)
+            raise RedisError("connection refused")
+
+        return fail
+
+
+class CountingEmbedder:
+    def __init__(self, delay=0.0):
+        self.texts = []
+        self.delay = delay
+        self.lock = threading.Lock()
+
+    def __call__(self, text):
+        with self.lock:
+            self.texts.append(text)
+        time.sleep(self.delay)
+        return [0.1, 0.2, 0.3, float(len(text))]
+
+
+def test_local_hit_and_normalization():
+    cache, embedder = QueryEmbeddingCache("bge-m3"), CountingEmbedder()
+
+    first = cache.embed("what is  DKU?", embedder)
+    second = cache.embed(" what is\nDKU? ", embedder)
+
+    assert first == second
+    assert embedder.texts == ["what is DKU?"]
+    assert cache.stats()["local_hits"] == 1
+
+
+def test_vectors_are_float16_in_redis(fake_redis):
+    redis, embedder = fake_redis, CountingEmbedder()
+    cache = QueryEmbeddingCache("bge-m3", redis_client=redis)
+
+    embedding = cache.embed("what is DKU?", embedder)
+
+    data = redis.get(cache.key("what is DKU?"))
+    assert len(data) == 4 * 2
+    assert embedding == tuple(
+        np.frombuffer(data, dtype=np.float16).astype(np.float32).tolist()
+    )
+    assert embedding == pytest.approx([0.1, 0.2, 0.3, 12.0], rel=1e-3)
+
+
+def test_redis_tier_is_shared_per_model(fake_redis):
+    redis, embedder = fake_redis, CountingEmbedder()
+    QueryEmbeddingCache("bge-m3", redis_client=redis).embed("majors", embedder)
+
+    other = QueryEmbeddingCache("bge-m3", redis_client=redis)
+    other.embed("majors", embedder)
+    QueryEmbeddingCache("other-model", redis_client=redis).embed("majors", embedder)
+
+    assert len(embedder.texts) == 2
+    assert other.stats()["redis_hits"] == 1
+
+
+def test_lru_evicts_oldest():
+    cache, embedder = QueryEmbeddingCache("bge-m3", maxsize=2), CountingEmbedder()
+
+    for query in ("a", "b", "a", "c", "a", "b"):
+        cache.embed(query, embedder)
+
+    assert embedder.texts == ["a", "b", "c", "b"]
+
+
+def test_concurrent_misses_embed_once(fake_redis):
+    redis, embedder = fake_redis, CountingEmbedder(delay=0.1)
+    # Two processes with four threads each
+    caches = [QueryEmbeddingCache("bge-m3", redis_client=redis) for _ in range(2)]
+    results = []
+
+    def run(cache):
+        results.append(cache.embed("how do I declare a major?", embedder))
+
+    threads = [threading.Thread(target=run, args=(c,)) for c in caches * 4]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len(embedder.texts) == 1
+    assert len(set(results)) == 1 and len(results) == 8
+    assert sum(c.stats()["coalesced"] for c in caches) == 7
+
+
+def test_waiters_give_up_on_a_stuck_lock(fake_redis):
+    redis, embedder = fake_redis, CountingEmbedder()
+    cache = QueryEmbeddingCache("bge-m3", redis_client=redis, wait=0.05)
+    # Another process died while holding the lock
+    redis.set(cache.key("majors") + ":lock", "1")
+
+    cache.embed("majors", embedder)
+
+    assert embedder.texts == ["majors"]
+
+
+def test_redis_errors_fall_back_to_lru():
+    cache = QueryEmbeddingCache("bge-m3", redis_client=BrokenRedis())
+    embedder = CountingEmbedder()
+
+    cache.embed("majors", embedder)
+    cache.embed("majors", embedder)
+
+    assert embedder.texts == ["majors"]
+    assert cache.stats()["redis_errors"] == 1
+
+
+def test_misses_do_not_wait_for_broken_redis():
+    redis = BrokenRedis(delay=0.05)
+    cache = QueryEmbeddingCache("bge-m3", redis_client=redis, wait=2.0)
+    embedder = CountingEmbedder()
+
+    started = time.monotonic()
+    cache.embed("majors", embedder)
+    first_miss = time.monotonic() - started
+    started = time.monotonic()
+    for query in ("minors", "courses", "events"):
+        cache.embed(query, embedder)
+    later_misses = time.monotonic() - started
+
+    # One failed call, then Redis is skipped until `retry_after` passed
+    assert first_miss < 0.5
+    assert later_misses < 0.1
+    assert redis.calls == 1
+    assert len(embedder.texts) == 4
+
+
+def test_redis_is_retried_after_an_error(fake_redis):
+    cache = QueryEmbeddingCache("bge-m3", redis_client=BrokenRedis(), retry_after=0)
+    embedder = CountingEmbedder()
+
+    cache.embed("majors", embedder)
+    cache.redis = fake_redis
+    cache.embed("minors", embedder)
+
+    assert cache.redis.get(cache.key("minors")) is not None
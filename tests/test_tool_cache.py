@@ -0,0 +1,245 @@
+"""Tests for chatdku.core.tools.tool_cache and its use in the Executor and retrievers."""
+
+import os
+import time
+from contextlib import contextmanager
+from unittest.mock import MagicMock
+
+import pytest
+
+from chatdku.core.tools.retriever.base_retriever import NodeWithScore
+from chatdku.core.tools.tool_cache import ToolCache, UncachedResult
+from chatdku.ingestion.corpus_version import CORPUS_VERSION_KEY
+
+
+class CountingTool:
+    def __init__(self):
+        self.calls = 0
+
+    def __call__(self, major):
+        self.calls += 1
+        return f"requirements of {major} #{self.calls}"
+
+
+def make_cache(**kwargs):
+    defaults = dict(ttls={"MajorRequirementsLookup": 60}, version_ttl=0)
+    defaults.update(kwargs)
+    return ToolCache(**defaults)
+
+
+class TestToolCache:
+    def test_same_args_hit(self):
+        cache, tool = make_cache(), CountingTool()
+
+        first = cache.call("MajorRequirementsLookup", tool, {"major": "data science"})
+        second = cache.call(
+            "MajorRequirementsLookup", tool, {"major": " data\n science "}
+        )
+
+        assert first == ("requirements of data science #1", False)
+        assert second == ("requirements of data science #1", True)
+        assert cache.stats() == {"hits": 1, "misses": 1, "size": 1}
+
+    def test_different_args_and_scopes_miss(self):
+        cache, tool = make_cache(), CountingTool()
+
+        cache.call("MajorRequirementsLookup", tool, {"major": "biology"})
+        cache.call("MajorRequirementsLookup", tool, {"major": "physics"})
+        cache.call("MajorRequirementsLookup", tool, {"major": "physics"}, scope="u1")
+
+        assert tool.calls == 3
+
+    def test_unlisted_and_bypassed_tools_are_not_cached(self):
+        cache = make_cache(bypass=("MajorRequirementsLookup",))
+        tool = CountingTool()
+
+        cache.call("MajorRequirementsLookup", tool, {"major": "x"})
+        cache.call("MajorRequirementsLookup", tool, {"major": "x"})
+        cache.call("SyllabusLookup", tool, {"major": "x"})
+
+        assert tool.calls == 3
+
+    def test_exceptions_are_not_cached(self):
+        cache = make_cache()
+        tool = MagicMock(side_effect=[RuntimeError("down"), "ok"])
+
+        with pytest.raises(RuntimeError):
+            cache.call("MajorRequirementsLookup", tool, {"major": "x"})
+
+        assert cache.call("MajorRequirementsLookup", tool, {"major": "x"}) == (
+            "ok",
+            False,
+        )
+
+    def test_uncached_results_are_returned_but_not_stored(self):
+        cache = make_cache()
+        tool = MagicMock(side_effect=[UncachedResult("error"), "ok", "later"])
+
+        assert cache.call("MajorRequirementsLookup", tool, {"major": "x"}) == (
+            "error",
+            False,
+        )
+        cache.call("MajorRequirementsLookup", tool, {"major": "x"})
+
+        assert cache.call("MajorRequirementsLookup", tool, {"major": "x"}) == (
+            "ok",
+            True,
+        )
+
+    def test_entries_expire(self):
+        cache, tool = make_cache(ttls={"MajorRequirementsLookup": 0.01}), CountingTool()
+
+        cache.call("MajorRequirementsLookup", tool, {"major": "x"})
+        time.sleep(0.02)
+        cache.call("MajorRequirementsLookup", tool, {"major": "x"})
+
+        assert tool.calls == 2
+
+    def test_lru_evicts_oldest(self):
+        cache, tool = make_cache(maxsize=2), CountingTool()
+
+        for major in ("a", "b", "a", "c", "a", "b"):
+            cache.call("MajorRequirementsLookup", tool, {"major": major})
+
+        # "b" was evicted by "c", "a" was kept by its hits
+        assert tool.calls == 4
+
+    def test_corpus_version_bump_invalidates(self, fake_redis):
+        redis = fake_redis
+        cache, tool = make_cache(redis_client=redis), CountingTool()
+
+        cache.call("MajorRequirementsLookup", tool, {"major": "x"})
+        redis.incr(CORPUS_VERSION_KEY)
+        cache.call("MajorRequirementsLookup", tool, {"major": "x"})
+
+        assert tool.calls == 2
+
+    def test_source_file_change_invalidates(self, tmp_path):
+        source = tmp_path / "prereqs.csv"
+        source.write_text("v1")
+        cache = make_cache(sources={"MajorRequirementsLookup": [str(source)]})
+        tool = CountingTool()
+
+        cache.call("MajorRequirementsLookup", tool, {"major": "x"})
+        cache.call("MajorRequirementsLookup", tool, {"major": "x"})
+        source.write_text("v2")
+        os.utime(source, ns=(0, source.stat().st_mtime_ns + 1))
+        cache.call("MajorRequirementsLookup", tool, {"major": "x"})
+
+        assert tool.calls == 2
+
+    def test_redis_tier_is_shared(self, fake_redis):
+        redis = fake_redis
+        tool = CountingTool()
+        make_cache(redis_client=redis, shared=True).call(
+            "MajorRequirementsLookup", tool, {"major": "x"}
+        )
+
+        other = make_cache(redis_client=redis, shared=True)
+        result, hit = other.call("MajorRequirementsLookup", tool, {"major": "x"})
+
+        assert hit and result == "requirements of x #1"
+        assert tool.calls == 1
+
+
+def test_failed_prerequisite_lookup_is_not_cached(monkeypatch):
+    from chatdku.core.tools.get_prerequisites import get_prereq
+
+    cache = make_cache(ttls={"PrerequisiteLookup": 60})
+    monkeypatch.setattr(
+        "chatdku.core.tools.get_prerequisites.pd.read_csv",
+        MagicMock(side_effect=OSError("stale file handle")),
+    )
+
+    result, hit = cache.call(
+        "PrerequisiteLookup",
+        get_prereq,
+        {"course": "STATS 202", "data_file_path": "prereqs.csv"},
+    )
+
+    assert result == "Unknown error in finding prerequisite for STATS 202."
+    assert cache.stats()["size"] == 0
+
+
+@pytest.fixture()
+def tool_cache(monkeypatch):
+    cache = make_cache(ttls={"MajorRequirementsLookup": 60, "VectorRetriever": 60})
+    monkeypatch.setattr(
+        "chatdku.core.dspy_classes.executor.get_tool_cache", lambda: cache
+    )
+    monkeypatch.setattr(
+        "chatdku.core.tools.llama_index_tools.get_tool_cache", lambda: cache
+    )
+    return cache
+
+
+def test_executor_records_hits_in_tool_span(tool_cache, monkeypatch):
+    from chatdku.core.dspy_classes.executor import Executor
+
+    spans = []
+
+    @contextmanager
+    def fake_span_ctx_start(name, kind, parent_context=None):
+        span = MagicMock()
+        spans.append((name, span))
+        yield span
+
+    monkeypatch.setattr(
+        "chatdku.core.dspy_classes.executor.span_ctx_start", fake_span_ctx_start
+    )
+    calls = []
+
+    def MajorRequirementsLookup(major: str) -> str:
+        """Look up the requirements of a major."""
+        calls.append(major)
+        return f"requirements of {major}"
+
+    executor = Executor([MajorRequirementsLookup])
+
+    assert executor._call_tool("MajorRequirementsLookup", {"major": "x"}) == (
+        "requirements of x",
+        False,
+    )
+    assert spans == []
+    assert executor._call_tool("MajorRequirementsLookup", {"major": "x"}) == (
+        "requirements of x",
+        True,
+    )
+    assert calls == ["x"]
+    name, span = spans[0]
+    assert name == "MajorRequirementsLookup"
+    span.set_attribute.assert_any_call("tool_cache.hit", True)
+
+
+@contextmanager
+def fake_timeout(seconds=5):
+    class FakeCtx:
+        def run(self, func, *args, **kwargs):
+            return func(*args, **kwargs)
+
+    yield FakeCtx()
+
+
+@pytest.mark.parametrize("search_mode, queries", [(0, 1), (1, 2)])
+def test_retriever_results_cached_for_public_corpus(
+    tool_cache, monkeypatch, mock_get_current_span, search_mode, queries
+):
+    from chatdku.core.tools.llama_index_tools import VectorRetrieverOuter
+
+    retriever = MagicMock(search_mode=search_mode, user_id="u", retriever_top_k=10)
+    retriever.query_with_tell.return_value = [
+        NodeWithScore(node_id="1", text="doc one", metadata={}, score=0.9)
+    ]
+    monkeypatch.setattr(
+        "chatdku.core.tools.llama_index_tools.VectorRetriever",
+        MagicMock(return_value=retriever),
+    )
+    monkeypatch.setattr("chatdku.core.tools.llama_index_tools.timeout", fake_timeout)
+    query = VectorRetrieverOuter(
+        use_reranker=False, search_mode=search_mode, files=["a.pdf"]
+    )
+
+    first, second = query("what is DKU?"), query("what is DKU?")
+
+    assert retriever.query_with_tell.call_count == queries
+    assert "doc one" in first and "doc one" in second
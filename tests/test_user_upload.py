@@ -0,0 +1,94 @@
+"""Tests for the per-file user upload path in chatdku.ingestion.user_upload."""
+
+import os
+
+from chatdku.benchmarks.structure_chunker import make_pdf
+from chatdku.ingestion import user_upload
+from chatdku.ingestion.node_delta import load_delta, mark_applied
+
+
+def _record(applied):
+    """Stand-in for `_apply_delta` that records the delta and marks it applied."""
+
+    def apply_delta(path, progress, stores):
+        delta = load_delta(path)
+        applied.append(delta)
+        for store in stores:
+            mark_applied(path, store, delta.created_at)
+
+    return apply_delta
+
+
+class TestUpdate:
+    def test_only_new_uploads_are_chunked_and_loaded(self, tmp_path, monkeypatch):
+        applied = []
+        monkeypatch.setattr(
+            user_upload,
+            "_apply_delta",
+            _record(applied),
+        )
+        stages = []
+
+        def progress(stage, done, total):
+            stages.append((stage, done, total))
+
+        make_pdf(str(tmp_path / "a.pdf"), pages=2)
+        (tmp_path / "notes.txt").write_text("not an upload")
+        first, _ = user_upload.update("NetID1", str(tmp_path), progress=progress)
+
+        make_pdf(str(tmp_path / "b.pdf"), pages=1, seed=1)
+        second, _ = user_upload.update("NetID1", str(tmp_path))
+        nothing, _ = user_upload.update("NetID1", str(tmp_path))
+
+        assert first > 0 and second > 0 and nothing == 0
+        assert len(applied) == 2
+        assert applied[1].doc_ids and not applied[1].deletes
+        files = {n.metadata["file_name"] for n in applied[1].upserts}
+        assert files == {"b.pdf"}
+        assert {n.metadata["access_type"] for n in applied[0].upserts} == {"private"}
+        assert stages[:2] == [("parsing", 0, 1), ("parsing", 1, 1)]
+
+        os.remove(tmp_path / "a.pdf")
+        user_upload.update("NetID1", str(tmp_path))
+
+        assert len(applied[2].deletes) == first
+        assert not applied[2].upserts
+
+    def test_retry_after_a_failed_store_reuses_node_ids(self, tmp_path, monkeypatch):
+        applied = []
+
+        def apply_delta(path, progress, stores):
+            applied.append(load_delta(path))
+            if len(applied) == 1:
+                raise ConnectionError("postgres is down")
+
+        monkeypatch.setattr(user_upload, "_apply_delta", apply_delta)
+        make_pdf(str(tmp_path / "a.pdf"), pages=2)
+
+        try:
+            user_upload.update("NetID1", str(tmp_path))
+        except ConnectionError:
+            pass
+        user_upload.update("NetID1", str(tmp_path))
+
+        first, retry = ([n.node_id for n in d.upserts] for d in applied)
+        assert first and first == retry
+
+    def test_unparseable_pdf_is_reported_not_raised(self, tmp_path, monkeypatch):
+        applied = []
+        monkeypatch.setattr(
+            user_upload,
+            "_apply_delta",
+            _record(applied),
+        )
+        make_pdf(str(tmp_path / "a.pdf"), pages=1)
+        (tmp_path / "broken.pdf").write_bytes(b"not a pdf")
+
+        added, failed = user_upload.update("NetID1", str(tmp_path))
+
+        assert added > 0
+        assert list(failed) == [str(tmp_path / "broken.pdf")]
+        assert {n.metadata["file_name"] for n in applied[0].upserts} == {"a.pdf"}
+        # Still new for the next run
+        _, failed_again = user_upload.update("NetID1", str(tmp_path))
+        assert list(failed_again) == list(failed)